@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
+import hashlib
 import os
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -42,9 +43,16 @@ INSTALLED_APPS = [
     'core',
     'user',
     'recipe',
+    'batch',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.LatencyInjectionMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.RecordingMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +82,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+TEST_RUNNER = 'core.tests.runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
@@ -132,3 +142,301 @@ MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
 AUTH_USER_MODEL = 'core.User'
+
+
+# Batch API
+# Sub-requests may only target routes in these URL namespaces
+
+BATCH_NAMESPACES = ('recipe', 'user')
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+
+
+# Idempotency keys
+# Responses are replayed for IDEMPOTENCY_KEY_TTL seconds. A request that
+# holds its key for longer than IDEMPOTENCY_LOCK_TIMEOUT is assumed dead.
+
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+# Cache
+# Data cached across requests, such as the version of each user's recipe
+# data, must be seen by every server process, so it is only cached with a
+# shared memcached at CACHE_LOCATION, a comma separated list of
+# host:port. Without one every process has a cache of its own, which is
+# not used across requests.
+
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION', '')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION.split(','),
+        },
+    }
+SHARED_CACHE = bool(CACHE_LOCATION)
+
+
+# Recipe statistics
+# Cached per user until their recipes, tags or ingredients change, given
+# a shared cache
+
+RECIPE_STATS_CACHE_TIMEOUT = int(
+    os.environ.get('RECIPE_STATS_CACHE_TIMEOUT', 60 * 60))
+RECIPE_STATS_TIME_BUCKET = 15
+RECIPE_STATS_TOP_COUNT = 10
+
+
+# "What can I cook" ingredient index
+# Number of users whose index is kept in memory by each process
+
+RECIPE_COOK_INDEX_MAX_USERS = int(
+    os.environ.get('RECIPE_COOK_INDEX_MAX_USERS', 256))
+
+
+# Similar recipes
+# Number of neighbors stored per recipe by build_similar_recipes
+
+RECIPE_SIMILAR_COUNT = int(os.environ.get('RECIPE_SIMILAR_COUNT', 20))
+
+
+# Metrics
+# Each worker process writes its metrics to a file in METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds so that /metrics reports all of them.
+# Files of exited workers are added to a single archive file. Without
+# METRICS_DIR only the serving process is reported.
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+
+# Slow query log
+# Queries slower than SLOW_QUERY_THRESHOLD_MS are stored with the route and
+# user of the request, and a sample of them with their estimated query
+# plan. With SLOW_QUERY_EXPLAIN_ANALYZE, sampled SELECTs are run again
+# under EXPLAIN (ANALYZE, BUFFERS) for their actual timings instead, which
+# takes as long as the query did again before the response goes out. Only
+# the latest SLOW_QUERY_BUFFER_SIZE are kept.
+
+SLOW_QUERY_THRESHOLD_MS = (
+    float(os.environ['SLOW_QUERY_THRESHOLD_MS'])
+    if os.environ.get('SLOW_QUERY_THRESHOLD_MS') else None)
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0))
+SLOW_QUERY_EXPLAIN_ANALYZE = (
+    os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE', '0') == '1')
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', 1000))
+
+
+# Request profiling
+# A PROFILING_SAMPLE_RATE fraction of requests, and requests sending the
+# PROFILING_TOKEN in an X-Profile header, are profiled into PROFILING_DIR.
+# Only the latest PROFILING_MAX_FILES profiles are kept.
+
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/app-profiles')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 500))
+
+
+# Traffic recording
+# With RECORDING_DIR set, a RECORDING_SAMPLE_RATE fraction of requests is
+# logged there for the loadtest command to replay. Fields named in
+# RECORDING_REDACT_FIELDS are blanked out of the recorded bodies. Only
+# JSON bodies of at most RECORDING_MAX_BODY_SIZE bytes are recorded.
+
+RECORDING_DIR = os.environ.get('RECORDING_DIR')
+RECORDING_SAMPLE_RATE = float(os.environ.get('RECORDING_SAMPLE_RATE', 1))
+RECORDING_REDACT_FIELDS = ('password',)
+RECORDING_MAX_BODY_SIZE = int(
+    os.environ.get('RECORDING_MAX_BODY_SIZE', 64 * 1024))
+
+
+# Application server
+# Settings of the serve command. SERVER_WORKERS defaults to twice the
+# number of CPUs plus one. Workers are recycled after SERVER_MAX_REQUESTS
+# requests, with some jitter, to cap memory growth. With SERVER_PRELOAD,
+# the application, including the modules it otherwise loads on first use
+# such as numpy, is loaded once by the master and shared by the workers.
+
+SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 0))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 1))
+SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 5))
+SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 1000))
+SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 30))
+SERVER_PRELOAD = os.environ.get('SERVER_PRELOAD', '1') == '1'
+
+
+# ASGI
+# Requests served through app.asgi run their views in a pool of
+# ASGI_THREADS threads per worker process. INJECT_DB_LATENCY_MS delays
+# every query, to benchmark the servers against a slow database.
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+INJECT_DB_LATENCY_MS = float(os.environ.get('INJECT_DB_LATENCY_MS', 0))
+
+
+# Response compression
+# Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with the
+# first of COMPRESSION_ENCODINGS the client accepts. Brotli needs the
+# brotli package. Lists are cached for RECIPE_LIST_CACHE_TIMEOUT seconds
+# given a shared cache. With COMPRESSION_CACHE_VARIANTS, cached lists keep
+# their compressed forms so that they are compressed once, not per request.
+
+COMPRESSION_ENCODINGS = ('br', 'gzip')
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+COMPRESSION_SKIP_TYPES = (
+    'image/', 'video/', 'audio/', 'application/zip', 'application/gzip')
+COMPRESSION_CACHE_VARIANTS = (
+    os.environ.get('COMPRESSION_CACHE_VARIANTS', '1') == '1')
+RECIPE_LIST_CACHE_TIMEOUT = int(
+    os.environ.get('RECIPE_LIST_CACHE_TIMEOUT', 300))
+
+
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new hashes, pbkdf2_sha256 or
+# pbkdf2_sha1, which need no extra packages; hashes made by another
+# hasher, or with other PBKDF2 iterations, are upgraded on login. Logins
+# hash in a pool of PASSWORD_HASH_THREADS threads per process and are
+# turned away once PASSWORD_HASH_QUEUE_SIZE are waiting.
+
+AUTHENTICATION_BACKENDS = ['core.backends.EmailBackend']
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2_sha256')
+_PASSWORD_HASHERS = {
+    'pbkdf2_sha256': 'core.hashers.PBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items()
+    if name != PASSWORD_HASHER]
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 120000))
+PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 2))
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 32))
+PASSWORD_HASH_RETRY_AFTER = 1
+
+
+# User deletion
+# Deleting an account deactivates the user at once and queues deleting
+# their data for the process_user_deletions worker, which deletes at most
+# USER_DELETION_BATCH_SIZE rows of a table per transaction. Deletions
+# whose worker made no progress for USER_DELETION_STALE_AFTER seconds are
+# taken over by another worker.
+
+USER_DELETION_BATCH_SIZE = int(
+    os.environ.get('USER_DELETION_BATCH_SIZE', 500))
+USER_DELETION_PAUSE = float(os.environ.get('USER_DELETION_PAUSE', 0))
+USER_DELETION_POLL_INTERVAL = 5
+USER_DELETION_STALE_AFTER = 300
+
+
+# Throttling
+# Requests take a token from token buckets per user (per client when
+# anonymous) and scope. The buckets live in a memory mapped file at
+# THROTTLE_STORE_PATH, shared by every worker of a node without a cache
+# round trip. The default path is named after the code and database
+# served, so that deployments on a node keep their own buckets. Rates are
+# 'number/period', the number being the burst allowed; scopes without a
+# rate are not throttled. Logins are limited per account and client, and
+# per client across accounts. Clients are told apart by their address,
+# read from X-Forwarded-For only as set by the THROTTLE_NUM_PROXIES
+# proxies in front of the server, so that clients cannot pick another
+# address for themselves. Tests run with throttling off.
+
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', '1') == '1'
+THROTTLE_STORE_PATH = os.environ.get(
+    'THROTTLE_STORE_PATH', '/dev/shm/app-throttle-' + hashlib.sha1(
+        f"{BASE_DIR}:{DATABASES['default']['HOST']}:"
+        f"{DATABASES['default']['NAME']}".encode()).hexdigest()[:12])
+THROTTLE_STORE_SLOTS = int(os.environ.get('THROTTLE_STORE_SLOTS', 65536))
+THROTTLE_NUM_PROXIES = int(os.environ.get('THROTTLE_NUM_PROXIES', 0))
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.UserRateThrottle',
+        'core.throttling.WriteRateThrottle',
+        'core.throttling.ScopedRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.environ.get('THROTTLE_USER_RATE', '1200/min'),
+        'write': os.environ.get('THROTTLE_WRITE_RATE', '120/min'),
+        'upload': os.environ.get('THROTTLE_UPLOAD_RATE', '20/min'),
+        'login': os.environ.get('THROTTLE_LOGIN_RATE', '30/min'),
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP_RATE', '60/min'),
+    },
+    'NUM_PROXIES': THROTTLE_NUM_PROXIES,
+}
+
+
+# Cache warming
+# warm_caches fills the cached lists and statistics of users active in
+# the last WARM_UP_DAYS, as seen from their token use, which is recorded
+# at most every ACTIVITY_UPDATE_INTERVAL seconds; it needs the shared
+# cache and fails without one. With SERVER_WARM_UP, the workers a server
+# starts or restarts with run the list views once before taking requests
+# and, with a shared cache, build the ingredient indexes of the
+# WARM_UP_COOK_INDEXES most active users. Workers replacing ones recycled
+# after SERVER_MAX_REQUESTS do not warm up again.
+
+ACTIVITY_UPDATE_INTERVAL = 3600
+WARM_UP_DAYS = int(os.environ.get('WARM_UP_DAYS', 7))
+WARM_UP_COOK_INDEXES = int(os.environ.get('WARM_UP_COOK_INDEXES', 100))
+SERVER_WARM_UP = os.environ.get('SERVER_WARM_UP', '1') == '1'
+
+
+# Admin
+# Changelists of tables estimated to hold at least
+# ADMIN_ESTIMATED_COUNT_THRESHOLD rows show the row count from the table
+# statistics rather than counting every row.
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000))
+
+
+# Start up
+# API_ONLY servers leave out the admin and the browsable API, so that
+# their code, templates and URLs are not loaded by the workers.
+# profile_startup reports what importing the application costs, module
+# by module, and checks that a new server answers its first request
+# within COLD_START_TARGET_MS.
+
+API_ONLY = os.environ.get('API_ONLY') == '1'
+if API_ONLY:
+    INSTALLED_APPS.remove('django.contrib.admin')
+    INSTALLED_APPS.remove('django.contrib.messages')
+    MIDDLEWARE.remove('django.contrib.messages.middleware.MessageMiddleware')
+    TEMPLATES[0]['OPTIONS']['context_processors'].remove(
+        'django.contrib.messages.context_processors.messages')
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'rest_framework.renderers.JSONRenderer',
+    ]
+
+COLD_START_TARGET_MS = int(os.environ.get('COLD_START_TARGET_MS', 2000))
+
+
+# Streaming lists
+# Lists asked for with ?stream=1 are read from a server-side cursor and
+# sent LIST_STREAM_CHUNK_SIZE rows at a time. The cursor keeps a
+# transaction open while the client reads, so a client taking longer than
+# LIST_STREAM_IDLE_TIMEOUT seconds to read a chunk has the response cut
+# off. Batches cannot stream lists.
+
+LIST_STREAM_CHUNK_SIZE = int(os.environ.get('LIST_STREAM_CHUNK_SIZE', 2000))
+LIST_STREAM_IDLE_TIMEOUT = float(
+    os.environ.get('LIST_STREAM_IDLE_TIMEOUT', 30))
+
+
+# Copying recipes
+# Recipes are copied in the database, RECIPE_COPY_BATCH_SIZE at a time,
+# at most RECIPE_COPY_MAX_RECIPES per request. Copies share the image
+# file of their recipe. Recipes sent to another user wait as a share
+# until they accept it.
+
+RECIPE_COPY_BATCH_SIZE = int(os.environ.get('RECIPE_COPY_BATCH_SIZE', 500))
+RECIPE_COPY_MAX_RECIPES = int(os.environ.get('RECIPE_COPY_MAX_RECIPES', 5000))
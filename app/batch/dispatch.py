@@ -0,0 +1,169 @@
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, connections
+from django.urls import resolve, Resolver404
+
+from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import IdempotencyKey
+
+SAFE_METHODS = ('GET',)
+
+# Headers of the batch that do not apply to its sub-requests
+BATCH_ONLY_HEADERS = ('HTTP_IDEMPOTENCY_KEY', 'HTTP_ACCEPT_ENCODING')
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+  """Return the thread pool shared by parallel batch reads"""
+  global _executor
+  if _executor is None:
+    _executor = ThreadPoolExecutor(
+        max_workers=settings.BATCH_MAX_WORKERS,
+        thread_name_prefix='batch')
+  return _executor
+
+
+def build_request(request, method, path, body=None, idempotency_key=None):
+  """Build a sub-request that reuses the authentication of `request`"""
+  path, _, query = path.partition('?')
+  payload = b''
+  if body is not None:
+    payload = json.dumps(body, cls=JSONEncoder).encode('utf-8')
+
+  environ = dict(request.META)
+  for header in BATCH_ONLY_HEADERS:
+    environ.pop(header, None)
+  if idempotency_key is not None:
+    environ['HTTP_IDEMPOTENCY_KEY'] = idempotency_key
+  environ.update({
+      'REQUEST_METHOD': method,
+      'PATH_INFO': path,
+      'SCRIPT_NAME': '',
+      'QUERY_STRING': query,
+      'CONTENT_TYPE': 'application/json',
+      'CONTENT_LENGTH': str(len(payload)),
+      'wsgi.input': io.BytesIO(payload),
+  })
+  sub_request = WSGIRequest(environ)
+  # DRF skips the authentication classes of the target view when these are
+  # set, so the token is only looked up once for the whole batch
+  sub_request._force_auth_user = request.user
+  sub_request._force_auth_token = request.auth
+
+  return sub_request
+
+
+def dispatch(sub_request):
+  """Run a sub-request through the view it resolves to
+
+  A view raising an error gets a 500 of its own rather than failing the
+  batch, whose earlier writes are committed already, unless DEBUG is on.
+  """
+  try:
+    match = resolve(sub_request.path_info)
+  except Resolver404:
+    match = None
+
+  if match is None or match.namespace not in settings.BATCH_NAMESPACES:
+    return {'status': status.HTTP_404_NOT_FOUND,
+            'body': {'detail': 'Not found.'}}
+
+  if sub_request.GET.get('stream') == '1':
+    return {'status': status.HTTP_400_BAD_REQUEST,
+            'body': {'detail': 'Lists cannot be streamed in a batch.'}}
+
+  sub_request.resolver_match = match
+  try:
+    response = match.func(sub_request, *match.args, **match.kwargs)
+  except Exception:
+    if settings.DEBUG:
+      raise
+    logger.exception('Batch sub-request %s %s failed',
+                     sub_request.method, sub_request.path)
+    return {'status': status.HTTP_500_INTERNAL_SERVER_ERROR,
+            'body': {'detail': 'A server error occurred.'}}
+
+  return {'status': response.status_code, 'body': _body(response)}
+
+
+def _body(response):
+  """Return the data of a response, decoding it from the content of
+  responses served without going through a serializer, such as cached
+  lists"""
+  if hasattr(response, 'data'):
+    return response.data
+  if (response.content and
+          response.get('Content-Type', '').startswith('application/json')):
+    return json.loads(response.content.decode(response.charset))
+  return None
+
+
+def _dispatch_in_thread(sub_request):
+  """Dispatch a sub-request from a pool thread and release its connection"""
+  try:
+    return dispatch(sub_request)
+  finally:
+    connections.close_all()
+
+
+def max_batch_key_length():
+  """Return the longest Idempotency-Key a batch may have, leaving room
+  for the position its sub-request keys add"""
+  return (IdempotencyKey._meta.get_field('key').max_length -
+          len(f':{settings.BATCH_MAX_REQUESTS - 1}'))
+
+
+def can_run_in_parallel():
+  """Whether reads may run on other connections than the current one
+
+  Inside a transaction the pool threads would not see uncommitted rows,
+  so batches are then run one request at a time.
+  """
+  return settings.BATCH_MAX_WORKERS > 1 and not connection.in_atomic_block
+
+
+def run_batch(request, sub_requests):
+  """Run the sub-requests and return their responses in order
+
+  Writes run sequentially in the order they were given. Consecutive reads
+  between writes are run in parallel where it is safe to do so. With an
+  Idempotency-Key on the batch, every sub-request gets a key of its own
+  made from it and its position, so that a retried batch replays each
+  write rather than all writes replaying the first.
+  """
+  batch_key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+  parallel = can_run_in_parallel()
+  responses = []
+  reads = []
+
+  def flush_reads():
+    if len(reads) > 1 and parallel:
+      responses.extend(get_executor().map(_dispatch_in_thread, reads))
+    else:
+      responses.extend(dispatch(read) for read in reads)
+    reads.clear()
+
+  for index, item in enumerate(sub_requests):
+    sub_request = build_request(
+        request, item['method'], item['path'], item.get('body'),
+        f'{batch_key}:{index}' if batch_key else None)
+    if item['method'] in SAFE_METHODS:
+      reads.append(sub_request)
+      continue
+
+    flush_reads()
+    responses.append(dispatch(sub_request))
+
+  flush_reads()
+
+  return responses
@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class SubRequestSerializer(serializers.Serializer):
+  """Serializer for a single request inside a batch"""
+  method = serializers.ChoiceField(
+      choices=('GET', 'POST', 'PUT', 'PATCH', 'DELETE'))
+  path = serializers.CharField()
+  body = serializers.JSONField(required=False)
+
+  def validate_path(self, value):
+    if not value.startswith('/'):
+      raise serializers.ValidationError('Path must be absolute')
+    return value
+
+
+class BatchSerializer(serializers.Serializer):
+  """Serializer for a batch of sub-requests"""
+  requests = SubRequestSerializer(many=True, allow_empty=False)
+
+  def validate_requests(self, value):
+    if len(value) > settings.BATCH_MAX_REQUESTS:
+      msg = ('A batch may contain at most '
+             f'{settings.BATCH_MAX_REQUESTS} requests')
+      raise serializers.ValidationError(msg)
+    return value
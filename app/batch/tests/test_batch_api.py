@@ -0,0 +1,210 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+BATCH_URL = reverse('batch:batch')
+
+
+def sample_recipe(user, **params):
+  """Creates and returns a sample recipe"""
+  defaults = {
+      'title': 'Sample Recipe Title',
+      'time_minutes': 10,
+      'price': 5.00
+  }
+  defaults.update(params)
+
+  return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicBatchApiTests(TestCase):
+  """Tests the publicly available batch API"""
+
+  def setUp(self):
+    self.client = APIClient()
+
+  def test_login_required(self):
+    """Tests that login is required to run a batch"""
+    payload = {'requests': [{'method': 'GET', 'path': '/api/user/me/'}]}
+    res = self.client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateBatchApiTests(TestCase):
+  """Tests the batch API for authenticated users"""
+
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password', name='Vinson')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  def test_batch_reads(self):
+    """Tests that each sub-request gets its own response in order"""
+    recipe = sample_recipe(user=self.user)
+    Tag.objects.create(user=self.user, name='Vegan')
+    payload = {'requests': [
+        {'method': 'GET', 'path': f'/api/recipe/recipes/{recipe.id}/'},
+        {'method': 'GET', 'path': '/api/recipe/tags/'},
+        {'method': 'GET', 'path': '/api/recipe/ingredients/'},
+        {'method': 'GET', 'path': '/api/user/me/'},
+    ]}
+
+    res = self.client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    responses = res.data['responses']
+    self.assertEqual([r['status'] for r in responses], [200] * 4)
+    self.assertEqual(responses[0]['body']['id'], recipe.id)
+    self.assertEqual(responses[1]['body'][0]['name'], 'Vegan')
+    self.assertEqual(responses[2]['body'], [])
+    self.assertEqual(responses[3]['body']['email'], self.user.email)
+
+  def test_batch_authenticates_once(self):
+    """Tests that sub-requests do not authenticate the token again"""
+    token_client = APIClient()
+    token = Token.objects.create(user=self.user)
+    token_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    payload = {'requests': [
+        {'method': 'GET', 'path': '/api/recipe/tags/'},
+        {'method': 'GET', 'path': '/api/user/me/'},
+    ]}
+
+    with patch('rest_framework.authentication.TokenAuthentication'
+               '.authenticate_credentials',
+               return_value=(self.user, token)) as auth:
+      res = token_client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(auth.call_count, 1)
+
+  def test_batch_write_then_read(self):
+    """Tests that writes are applied before the reads that follow them"""
+    payload = {'requests': [
+        {'method': 'POST', 'path': '/api/recipe/tags/',
+         'body': {'name': 'Dessert'}},
+        {'method': 'GET', 'path': '/api/recipe/tags/'},
+    ]}
+
+    res = self.client.post(BATCH_URL, payload, format='json')
+
+    responses = res.data['responses']
+    self.assertEqual(responses[0]['status'], status.HTTP_201_CREATED)
+    self.assertEqual(responses[1]['body'][0]['name'], 'Dessert')
+    self.assertTrue(Tag.objects.filter(user=self.user).exists())
+
+  @override_settings(SHARED_CACHE=True)
+  def test_batch_cached_list(self):
+    """Tests that lists served from the cache have their body"""
+    Tag.objects.create(user=self.user, name='Vegan')
+    cached = self.client.get('/api/recipe/tags/').json()
+    payload = {'requests': [{'method': 'GET', 'path': '/api/recipe/tags/'}]}
+
+    res = self.client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.data['responses'][0]['body'], cached)
+    self.assertEqual(cached[0]['name'], 'Vegan')
+
+  def test_batch_streamed_list(self):
+    """Tests that lists are not streamed inside a batch"""
+    payload = {'requests': [
+        {'method': 'GET', 'path': '/api/recipe/recipes/?stream=1'}]}
+
+    res = self.client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.data['responses'][0]['status'],
+                     status.HTTP_400_BAD_REQUEST)
+
+  def test_batch_idempotency_key(self):
+    """Tests that writes of a keyed batch are not replays of each other,
+    and that retrying the batch replays every write"""
+    payload = {'requests': [
+        {'method': 'POST', 'path': '/api/recipe/tags/',
+         'body': {'name': 'A'}},
+        {'method': 'POST', 'path': '/api/recipe/tags/',
+         'body': {'name': 'B'}},
+    ]}
+
+    res = self.client.post(BATCH_URL, payload, format='json',
+                           HTTP_IDEMPOTENCY_KEY='k1')
+    retry = self.client.post(BATCH_URL, payload, format='json',
+                             HTTP_IDEMPOTENCY_KEY='k1')
+
+    names = [r['body']['name'] for r in res.data['responses']]
+    self.assertEqual(names, ['A', 'B'])
+    self.assertEqual(retry.data['responses'], res.data['responses'])
+    self.assertEqual(
+        sorted(Tag.objects.values_list('name', flat=True)), ['A', 'B'])
+
+  def test_batch_idempotency_key_too_long(self):
+    """Tests that batch keys leave room for the positions of their
+    sub-requests"""
+    payload = {'requests': [
+        {'method': 'POST', 'path': '/api/recipe/tags/',
+         'body': {'name': 'A'}},
+    ] * 20}
+
+    res = self.client.post(BATCH_URL, payload, format='json',
+                           HTTP_IDEMPOTENCY_KEY='k' * 253)
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertFalse(Tag.objects.exists())
+
+    res = self.client.post(BATCH_URL, payload, format='json',
+                           HTTP_IDEMPOTENCY_KEY='k' * 252)
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.data['responses'][0]['status'],
+                     status.HTTP_201_CREATED)
+
+  def test_batch_per_request_status(self):
+    """Tests that failing sub-requests do not fail the whole batch"""
+    payload = {'requests': [
+        {'method': 'GET', 'path': '/api/recipe/recipes/999999/'},
+        {'method': 'POST', 'path': '/api/recipe/tags/', 'body': {}},
+        {'method': 'GET', 'path': '/admin/'},
+        {'method': 'GET', 'path': '/api/recipe/tags/'},
+    ]}
+
+    res = self.client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual([r['status'] for r in res.data['responses']],
+                     [404, 400, 404, 200])
+
+  def test_batch_server_error(self):
+    """Tests that a sub-request raising an error gets a 500 while the
+    writes before it keep their responses"""
+    payload = {'requests': [
+        {'method': 'POST', 'path': '/api/recipe/tags/',
+         'body': {'name': 'Dessert'}},
+        {'method': 'GET', 'path': '/api/recipe/ingredients/'},
+        {'method': 'GET', 'path': '/api/recipe/tags/'},
+    ]}
+
+    with patch('recipe.views.IngredientViewSet.list',
+               side_effect=RuntimeError), \
+            self.assertLogs('batch.dispatch', 'ERROR'):
+      res = self.client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual([r['status'] for r in res.data['responses']],
+                     [201, 500, 200])
+    self.assertTrue(Tag.objects.filter(user=self.user).exists())
+
+  @override_settings(BATCH_MAX_REQUESTS=2)
+  def test_batch_too_large(self):
+    """Tests that batches above the configured size are rejected"""
+    payload = {'requests': [
+        {'method': 'GET', 'path': '/api/recipe/tags/'}] * 3}
+
+    res = self.client.post(BATCH_URL, payload, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,28 @@
+from rest_framework import generics, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from batch import dispatch
+from batch.serializers import BatchSerializer
+from core.authentication import TokenAuthentication
+
+
+class BatchView(generics.GenericAPIView):
+  """Run several recipe and user API requests in a single call"""
+  serializer_class = BatchSerializer
+  authentication_classes = (TokenAuthentication,)
+  permission_classes = (IsAuthenticated,)
+
+  def post(self, request):
+    """Run the sub-requests and return one response per sub-request"""
+    key = request.META.get('HTTP_IDEMPOTENCY_KEY', '')
+    if len(key) > dispatch.max_batch_key_length():
+      return Response({'detail': 'Idempotency-Key is too long'},
+                      status=status.HTTP_400_BAD_REQUEST)
+    serializer = self.get_serializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    responses = dispatch.run_batch(
+        request, serializer.validated_data['requests'])
+
+    return Response({'responses': responses}, status=status.HTTP_200_OK)
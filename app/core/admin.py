@@ -1,13 +1,82 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 
 from core import models
 
 
-class UserAdmin(BaseUserAdmin):
+class EstimatedCountPaginator(Paginator):
+  """Paginator taking the count of unfiltered lists from the planner
+  statistics of their table, as counting a large table reads all of it
+
+  Tables estimated under ADMIN_ESTIMATED_COUNT_THRESHOLD rows, and
+  filtered lists, are counted exactly.
+  """
+
+  @cached_property
+  def count(self):
+    queryset = self.object_list
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+      with connection.cursor() as cursor:
+        # Partitioned tables have their rows counted in their partitions
+        cursor.execute(
+            'SELECT sum(greatest(reltuples, 0)) FROM pg_class '
+            'WHERE oid = %s::regclass OR oid IN ('
+            ' SELECT inhrelid FROM pg_inherits'
+            ' WHERE inhparent = %s::regclass)',
+            [queryset.model._meta.db_table] * 2)
+        estimate = cursor.fetchone()[0] or 0
+      if estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+        return int(estimate)
+    return super().count
+
+
+class LargeTableMixin:
+  """Changelists that stay fast on tables with millions of rows
+
+  Counts are estimated by EstimatedCountPaginator and the total of a
+  filtered list is not counted. Each search term matches the start of a
+  `search_fields` value ignoring case, which the text_pattern_ops indexes
+  on their lower case values answer, where the default search would scan
+  for the term anywhere.
+  """
+  paginator = EstimatedCountPaginator
+  show_full_result_count = False
+
+  def get_search_results(self, request, queryset, search_term):
+    terms = search_term.lower().split()
+    if not terms:
+      return queryset, False
+    queryset = queryset.annotate(**{
+        f'{field}_lower': Lower(field) for field in self.search_fields})
+    for term in terms:
+      queryset = queryset.filter(reduce(or_, (
+          Q(**{f'{field}_lower__startswith': term})
+          for field in self.search_fields)))
+    return queryset, False
+
+
+class LargeTableAdmin(LargeTableMixin, admin.ModelAdmin):
+  pass
+
+
+class UserAdmin(LargeTableMixin, BaseUserAdmin):
+  # Pages are still taken with OFFSET, which the primary key index keeps
+  # cheap, as the admin links to pages by number
   ordering = ['id']
   list_display = ['email', 'name']
+  list_filter = ['is_active', 'is_staff', 'is_superuser']
+  search_fields = ['email']
   fieldsets = (
       (None, {'fields': ('email', 'password')}),
       (_('Personal Info'), {'fields': ('name',)}),
@@ -24,6 +93,98 @@ class UserAdmin(BaseUserAdmin):
   )
 
 
+class TagAdmin(LargeTableAdmin):
+  list_display = ['name', 'user', 'canonical']
+  list_select_related = ['user', 'canonical']
+  search_fields = ['name']
+  autocomplete_fields = ['user', 'canonical']
+
+
+class IngredientAdmin(TagAdmin):
+  pass
+
+
+class RecipeAdmin(LargeTableAdmin):
+  list_display = ['title', 'user', 'time_minutes', 'price']
+  list_select_related = ['user']
+  search_fields = ['title']
+  autocomplete_fields = ['user']
+  # Tags and ingredients belong to the recipe's user, so they are entered
+  # by id rather than offered from every user's
+  raw_id_fields = ['tags', 'ingredients']
+
+
+class CatalogueEntryAdmin(LargeTableAdmin):
+  list_display = ['name']
+  search_fields = ['name']
+
+
+class IdempotencyKeyAdmin(LargeTableAdmin):
+  list_display = [
+      'key', 'user', 'method', 'path', 'status_code', 'created_at',
+      'expires_at']
+  list_select_related = ['user']
+  readonly_fields = [
+      'user', 'key', 'method', 'path', 'status_code', 'response_body',
+      'created_at', 'expires_at']
+
+  def has_add_permission(self, request):
+    return False
+
+
+class RecipeShareAdmin(LargeTableAdmin):
+  list_display = ['sender', 'recipient', 'status', 'created_at', 'answered_at']
+  list_filter = ['status']
+  list_select_related = ['sender', 'recipient']
+  readonly_fields = [
+      'sender', 'recipient', 'recipe_ids', 'status', 'created_at',
+      'answered_at']
+
+  def has_add_permission(self, request):
+    return False
+
+
+class SimilarRecipesAdmin(LargeTableAdmin):
+  list_display = ['recipe', 'built_at', 'changed_at']
+  list_select_related = ['recipe']
+  readonly_fields = ['recipe', 'built_at', 'changed_at']
+
+  def has_add_permission(self, request):
+    return False
+
+
+class SlowQueryAdmin(LargeTableAdmin):
+  list_display = ['created_at', 'duration_ms', 'method', 'route', 'user_id']
+  list_filter = ['route']
+  readonly_fields = [
+      'sql', 'params', 'duration_ms', 'route', 'method', 'user_id', 'plan',
+      'created_at']
+
+  def has_add_permission(self, request):
+    return False
+
+
+class UserDeletionAdmin(LargeTableAdmin):
+  list_display = [
+      'user_id', 'status', 'rows_deleted', 'files_deleted', 'created_at',
+      'updated_at', 'finished_at']
+  list_filter = ['status']
+  readonly_fields = [
+      'user_id', 'rows_deleted', 'files_deleted', 'error', 'created_at',
+      'updated_at', 'finished_at']
+
+  def has_add_permission(self, request):
+    return False
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
+admin.site.register(models.Tag, TagAdmin)
+admin.site.register(models.Ingredient, IngredientAdmin)
+admin.site.register(models.Recipe, RecipeAdmin)
+admin.site.register(models.CanonicalTag, CatalogueEntryAdmin)
+admin.site.register(models.CanonicalIngredient, CatalogueEntryAdmin)
+admin.site.register(models.IdempotencyKey, IdempotencyKeyAdmin)
+admin.site.register(models.RecipeShare, RecipeShareAdmin)
+admin.site.register(models.SimilarRecipes, SimilarRecipesAdmin)
+admin.site.register(models.SlowQuery, SlowQueryAdmin)
+admin.site.register(models.UserDeletion, UserDeletionAdmin)
@@ -0,0 +1,175 @@
+import asyncio
+import sys
+import threading
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signals
+from django.core.handlers import base
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import set_script_prefix
+
+
+def build_environ(scope, body):
+  """Return the WSGI environ of an ASGI HTTP request"""
+  server = scope.get('server') or ('localhost', 80)
+  client = scope.get('client') or ('', 0)
+  environ = {
+      'REQUEST_METHOD': scope['method'],
+      'SCRIPT_NAME': scope.get('root_path', ''),
+      'PATH_INFO': scope['path'].encode().decode('latin-1'),
+      'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+      'SERVER_NAME': server[0],
+      'SERVER_PORT': str(server[1]),
+      'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+      'REMOTE_ADDR': client[0],
+      'REMOTE_PORT': str(client[1]),
+      'wsgi.version': (1, 0),
+      'wsgi.url_scheme': scope.get('scheme', 'http'),
+      'wsgi.input': body,
+      'wsgi.errors': sys.stderr,
+      'wsgi.multithread': True,
+      'wsgi.multiprocess': True,
+      'wsgi.run_once': False,
+  }
+  for name, value in scope.get('headers', []):
+    name = name.decode('latin-1').upper().replace('-', '_')
+    if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+      name = f'HTTP_{name}'
+    value = value.decode('latin-1')
+    if name in environ:
+      value = f'{environ[name]},{value}'
+    environ[name] = value
+
+  # The body is complete, so its size holds even for chunked requests
+  environ['CONTENT_LENGTH'] = str(body.seek(0, 2))
+  body.seek(0)
+  return environ
+
+
+class ASGIHandler(base.BaseHandler):
+  """ASGI application running Django views in a bounded thread pool
+
+  Django 2.1 views and the ORM are synchronous, so each request holds one
+  of ASGI_THREADS threads only while its view runs. Reading the request
+  and sending the response happen on the event loop, so slow clients do
+  not tie up a thread.
+  """
+
+  request_class = WSGIRequest
+
+  def __init__(self):
+    super().__init__()
+    self.load_middleware()
+    self.executor = ThreadPoolExecutor(
+        max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi')
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      await self.lifespan(receive, send)
+      return
+    if scope['type'] != 'http':
+      raise ValueError(f'Unsupported ASGI scope type {scope["type"]}')
+
+    body = await self.read_body(receive)
+    if body is None:
+      return
+
+    loop = asyncio.get_event_loop()
+    messages = asyncio.Queue(maxsize=8)
+    stop = threading.Event()
+    job = loop.run_in_executor(
+        self.executor, self.run, scope, body, loop, messages, stop)
+    try:
+      response = await messages.get()
+      if response is not None:
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.response_headers(response),
+        })
+        while True:
+          chunk = await messages.get()
+          if chunk is None:
+            break
+          await send({'type': 'http.response.body', 'body': chunk,
+                      'more_body': True})
+        await send({'type': 'http.response.body'})
+    finally:
+      stop.set()
+      while not job.done():
+        # Make room in case the thread waits to put a message
+        if messages.empty():
+          await asyncio.sleep(0.01)
+        else:
+          messages.get_nowait()
+      body.close()
+      await job
+
+  async def lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        self.executor.shutdown(wait=True)
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+  async def read_body(self, receive):
+    """Return the request body in a file, or None if the client left"""
+    body = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, mode='w+b')
+    while True:
+      message = await receive()
+      if message['type'] == 'http.disconnect':
+        body.close()
+        return None
+      body.write(message.get('body', b''))
+      if not message.get('more_body', False):
+        break
+    body.seek(0)
+    return body
+
+  def handle(self, scope, body):
+    """Run the request through the middleware and view of Django"""
+    environ = build_environ(scope, body)
+    set_script_prefix(environ['SCRIPT_NAME'])
+    signals.request_started.send(sender=self.__class__, environ=environ)
+    request = self.request_class(environ)
+    response = self.get_response(request)
+    response._handler_class = self.__class__
+    return response
+
+  def run(self, scope, body, loop, messages, stop):
+    """Handle a request, putting the response and then its content into
+    `messages` until done or `stop` is set
+
+    All of it happens in one thread: Django closes the database
+    connection of the thread the response is closed in, and streamed
+    content may come from a cursor opened by the view.
+    """
+    def put(message):
+      if not stop.is_set():
+        asyncio.run_coroutine_threadsafe(messages.put(message), loop).result()
+
+    response = None
+    try:
+      response = self.handle(scope, body)
+      put(response)
+      for chunk in response:
+        if stop.is_set():
+          break
+        put(chunk)
+    finally:
+      if response is not None:
+        response.close()
+      put(None)
+
+  def response_headers(self, response):
+    headers = [(name.encode('latin-1'), value.encode('latin-1'))
+               for name, value in response.items()]
+    headers.extend((b'Set-Cookie', cookie.output(header='').strip().encode())
+                   for cookie in response.cookies.values())
+    return headers
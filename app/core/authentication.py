@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import authentication
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+  """Token authentication keeping track of when users were last active
+
+  last_login is moved forward at most every ACTIVITY_UPDATE_INTERVAL
+  seconds, so that most requests make no write.
+  """
+
+  def authenticate_credentials(self, key):
+    user, token = super().authenticate_credentials(key)
+    now = timezone.now()
+    interval = timedelta(seconds=settings.ACTIVITY_UPDATE_INTERVAL)
+    if user.last_login is None or user.last_login < now - interval:
+      get_user_model().objects.filter(pk=user.pk).update(last_login=now)
+      user.last_login = now
+    return user, token
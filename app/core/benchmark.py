@@ -0,0 +1,223 @@
+import io
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.middleware import QueryCounter
+from core.models import Ingredient, Recipe, Tag
+from recipe import similarity
+
+PASSWORD = 'benchmark-password'
+
+
+class Route:
+  """A request made by the benchmark
+
+  `data` may be a callable returning a fresh payload for every request.
+  """
+
+  def __init__(self, name, method, path, data=None, format='json',
+               authenticated=True):
+    self.name = name
+    self.method = method
+    self.path = path
+    self.data = data
+    self.format = format
+    self.authenticated = authenticated
+
+  def payload(self):
+    return self.data() if callable(self.data) else self.data
+
+
+def seed(scale, tags=50, ingredients=300, per_recipe=8, rng=None):
+  """Create a user owning `scale` recipes with tags and ingredients"""
+  rng = rng or random.Random(0)
+  user = get_user_model().objects.create_user(
+      email=f'benchmark-{scale}@example.com', password=PASSWORD,
+      name='Benchmark')
+
+  tag_ids = [t.id for t in Tag.objects.bulk_create(
+      Tag(user=user, name=f'Tag {i}') for i in range(tags))]
+  ingredient_ids = [i.id for i in Ingredient.objects.bulk_create(
+      Ingredient(user=user, name=f'Ingredient {i}')
+      for i in range(ingredients))]
+  recipe_ids = [r.id for r in Recipe.objects.bulk_create(
+      (Recipe(user=user, title=f'Recipe {i}',
+              time_minutes=rng.randint(1, 180),
+              price=rng.randint(100, 99999) / 100)
+       for i in range(scale)), batch_size=5000)]
+
+  Recipe.tags.through.objects.bulk_create(
+      (Recipe.tags.through(recipe_id=r, tag_id=t)
+       for r in recipe_ids for t in rng.sample(tag_ids, 2)),
+      batch_size=10000)
+  Recipe.ingredients.through.objects.bulk_create(
+      (Recipe.ingredients.through(recipe_id=r, ingredient_id=i)
+       for r in recipe_ids
+       for i in rng.sample(ingredient_ids, rng.randint(1, per_recipe))),
+      batch_size=10000)
+
+  return user, recipe_ids, tag_ids, ingredient_ids
+
+
+def image_file():
+  """Return a small JPEG image to upload"""
+  from PIL import Image
+
+  image = io.BytesIO()
+  Image.new('RGB', (10, 10)).save(image, format='JPEG')
+  image.name = 'benchmark.jpg'
+  image.seek(0)
+  return image
+
+
+def routes(user, recipe_ids, tag_ids, ingredient_ids):
+  """Return a request for every route of the API"""
+  recipe_id = recipe_ids[len(recipe_ids) // 2]
+  names = itertools.count()
+  detail = reverse('recipe:recipe-detail', args=[recipe_id])
+
+  def new_recipe():
+    return {'title': 'Benchmark', 'time_minutes': 10, 'price': '5.00',
+            'tags': tag_ids[:2], 'ingredients': ingredient_ids[:5]}
+
+  return [
+      Route('recipe-list', 'get', reverse('recipe:recipe-list')),
+      Route('recipe-list-stream', 'get',
+            reverse('recipe:recipe-list') + '?stream=1'),
+      Route('recipe-detail', 'get', detail),
+      Route('recipe-create', 'post', reverse('recipe:recipe-list'),
+            new_recipe),
+      Route('recipe-update', 'patch', detail, {'title': 'Updated'}),
+      Route('recipe-upload-image', 'post',
+            reverse('recipe:recipe-upload-image', args=[recipe_id]),
+            lambda: {'image': image_file()}, format='multipart'),
+      Route('recipe-stats', 'get', reverse('recipe:recipe-stats')),
+      Route('recipe-cookable', 'get',
+            reverse('recipe:recipe-cookable') + '?missing=1&ingredients=' +
+            ','.join(map(str, ingredient_ids[:30]))),
+      Route('recipe-similar', 'get',
+            reverse('recipe:recipe-similar', args=[recipe_id])),
+      Route('recipe-shopping-list', 'get',
+            reverse('recipe:recipe-shopping-list') + '?recipes=' +
+            ','.join(map(str, recipe_ids[:500]))),
+      Route('tag-list', 'get', reverse('recipe:tag-list')),
+      Route('tag-create', 'post', reverse('recipe:tag-list'),
+            lambda: {'name': f'New tag {next(names)}'}),
+      Route('ingredient-list', 'get', reverse('recipe:ingredient-list')),
+      Route('ingredient-create', 'post', reverse('recipe:ingredient-list'),
+            lambda: {'name': f'New ingredient {next(names)}'}),
+      Route('user-me', 'get', reverse('user:me')),
+      Route('user-update', 'patch', reverse('user:me'), {'name': 'Updated'}),
+      Route('user-create', 'post', reverse('user:create'),
+            lambda: {'email': f'benchmark-new-{next(names)}@example.com',
+                     'password': PASSWORD, 'name': 'New'},
+            authenticated=False),
+      Route('user-token', 'post', reverse('user:token'),
+            {'email': user.email, 'password': PASSWORD},
+            authenticated=False),
+      Route('batch', 'post', reverse('batch:batch'), {'requests': [
+          {'method': 'GET', 'path': detail},
+          {'method': 'GET', 'path': reverse('recipe:tag-list')},
+          {'method': 'GET', 'path': reverse('recipe:ingredient-list')},
+          {'method': 'GET', 'path': reverse('user:me')},
+      ]}),
+  ]
+
+
+def request(client, route):
+  """Make a request and read its whole body"""
+  response = getattr(client, route.method)(
+      route.path, route.payload(), format=route.format)
+  if response.streaming:
+    for _ in response.streaming_content:
+      pass
+  return response
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(clients, route, iterations):
+  """Return latency percentiles, queries and peak memory of a route"""
+  client = clients[route.authenticated]
+  timings = []
+  queries = []
+  statuses = set()
+  for _ in range(iterations):
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+      start = time.perf_counter()
+      response = request(client, route)
+      timings.append((time.perf_counter() - start) * 1000)
+    queries.append(counter.count)
+    statuses.add(response.status_code)
+
+  tracemalloc.start()
+  try:
+    request(client, route)
+    peak = tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+  return {
+      'p50_ms': round(statistics.median(timings), 2),
+      'p95_ms': round(percentile(timings, 0.95), 2),
+      'queries': max(queries),
+      'peak_kib': round(peak / 1024, 1),
+      'statuses': sorted(statuses),
+  }
+
+
+def run_scale(scale, iterations, only=None):
+  """Seed `scale` recipes and measure every route against them"""
+  user, recipe_ids, tag_ids, ingredient_ids = seed(scale)
+  similarity.build_for_user(user.id, 20)
+
+  authenticated = APIClient()
+  token = Token.objects.create(user=user)
+  authenticated.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+  clients = {True: authenticated, False: APIClient()}
+
+  for route in routes(user, recipe_ids, tag_ids, ingredient_ids):
+    if not only or route.name in only:
+      yield route.name, measure(clients, route, iterations)
+
+
+def compare(results, baseline, tolerance, slack_ms=2):
+  """Return descriptions of measurements that got worse than `baseline`
+
+  Latency has to grow by more than `slack_ms` as well as by `tolerance`,
+  so that noise on very fast routes is not reported.
+  """
+  regressions = []
+  for scale, routes_ in results.items():
+    for name, current in routes_.items():
+      previous = baseline.get(scale, {}).get(name)
+      if previous is None:
+        continue
+      if current['queries'] > previous['queries']:
+        regressions.append(
+            f'{scale} {name}: {current["queries"]} queries, '
+            f'was {previous["queries"]}')
+      if current['p95_ms'] > max(previous['p95_ms'] * (1 + tolerance),
+                                 previous['p95_ms'] + slack_ms):
+        regressions.append(
+            f'{scale} {name}: p95 {current["p95_ms"]}ms, '
+            f'was {previous["p95_ms"]}ms')
+      if current['peak_kib'] > previous['peak_kib'] * (1 + tolerance):
+        regressions.append(
+            f'{scale} {name}: peak memory {current["peak_kib"]}KiB, '
+            f'was {previous["peak_kib"]}KiB')
+  return regressions
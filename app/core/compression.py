@@ -0,0 +1,102 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+IDENTITY = 'identity'
+
+
+def available_encodings():
+  """Return the configured encodings that can be produced, preferred first"""
+  return [encoding for encoding in settings.COMPRESSION_ENCODINGS
+          if encoding == 'gzip' or (encoding == 'br' and brotli)]
+
+
+def accepted_encoding(request, encodings=None):
+  """Return the first of `encodings` the client accepts, or None"""
+  accepted = {}
+  for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+    name, _, params = part.partition(';')
+    quality = 1.0
+    params = params.strip()
+    if params.startswith('q='):
+      try:
+        quality = float(params[2:])
+      except ValueError:
+        quality = 0
+    accepted[name.strip().lower()] = quality
+
+  if encodings is None:
+    encodings = available_encodings()
+  for encoding in encodings:
+    if accepted.get(encoding, accepted.get('*', 0)) > 0:
+      return encoding
+  return None
+
+
+def compressible(response):
+  """Whether a response is worth compressing
+
+  Streamed, already encoded and small responses are left alone, as are
+  media types that are compressed already, like images.
+  """
+  content_type = response.get('Content-Type', '').lower()
+  return (not response.streaming and
+          not response.has_header('Content-Encoding') and
+          len(response.content) >= settings.COMPRESSION_MIN_SIZE and
+          not content_type.startswith(settings.COMPRESSION_SKIP_TYPES))
+
+
+def compress(content, encoding, best=False):
+  """Compress `content`, as hard as possible if `best` is set"""
+  if encoding == 'br':
+    quality = 11 if best else settings.COMPRESSION_BROTLI_QUALITY
+    return brotli.compress(content, quality=quality)
+  level = 9 if best else settings.COMPRESSION_GZIP_LEVEL
+  return gzip.compress(content, compresslevel=level)
+
+
+def set_encoding(response, content, encoding):
+  """Replace the body of a response with `content` in `encoding`"""
+  response.content = content
+  response['Content-Length'] = str(len(content))
+  if encoding != IDENTITY:
+    response['Content-Encoding'] = encoding
+    etag = response.get('ETag', '')
+    if etag.startswith('"'):
+      response['ETag'] = f'W/{etag}'
+
+
+def variants(content):
+  """Return `content` keyed by encoding, for caching
+
+  With COMPRESSION_CACHE_VARIANTS the content is compressed once in every
+  available encoding, with the best ratio since the cost is not paid per
+  request. Otherwise only the plain content is kept.
+  """
+  result = {IDENTITY: content}
+  if (not settings.COMPRESSION_CACHE_VARIANTS or
+          len(content) < settings.COMPRESSION_MIN_SIZE):
+    return result
+
+  for encoding in available_encodings():
+    compressed = compress(content, encoding, best=True)
+    if len(compressed) < len(content):
+      result[encoding] = compressed
+  return result
+
+
+def use_variant(response, request, cached):
+  """Give a response the cached variant best suited to the request"""
+  encoding = accepted_encoding(
+      request, [encoding for encoding in available_encodings()
+                if encoding in cached]) or IDENTITY
+  set_encoding(response, cached[encoding], encoding)
+  if len(cached) > 1:
+    patch_vary_headers(response, ('Accept-Encoding',))
+  return response
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+  """PBKDF2 hasher using PASSWORD_PBKDF2_ITERATIONS iterations
+
+  Hashes made with another iteration count are upgraded on the next login.
+  """
+
+  @property
+  def iterations(self):
+    return settings.PASSWORD_PBKDF2_ITERATIONS
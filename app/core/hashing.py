@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from core import metrics
+
+_lock = threading.Lock()
+_executor = None
+_pending = 0
+
+
+class HashingBusy(Exception):
+  """Raised when too many passwords are already waiting to be hashed"""
+
+
+def _run(func, *args):
+  """Run `func` in the hashing pool and return its result
+
+  At most PASSWORD_HASH_THREADS hashes run at once so that logins cannot
+  take all CPUs away from other requests, and no more than
+  PASSWORD_HASH_QUEUE_SIZE logins wait for one.
+  """
+  global _executor, _pending
+  with _lock:
+    if _pending >= settings.PASSWORD_HASH_QUEUE_SIZE:
+      metrics.inc('password_hash_rejections_total')
+      raise HashingBusy
+    if _executor is None:
+      _executor = ThreadPoolExecutor(
+          max_workers=settings.PASSWORD_HASH_THREADS,
+          thread_name_prefix='hashing')
+    _pending += 1
+  try:
+    return _executor.submit(func, *args).result()
+  finally:
+    with _lock:
+      _pending -= 1
+
+
+def _check(raw_password, encoded):
+  upgraded = []
+  valid = hashers.check_password(raw_password, encoded, upgraded.append)
+  if upgraded:
+    return valid, hashers.make_password(raw_password)
+  return valid, None
+
+
+def check_password(user, raw_password):
+  """Check the password of a user in the hashing pool
+
+  The stored hash is replaced when the preferred hasher or its settings
+  have changed since it was made.
+  """
+  valid, upgraded = _run(_check, raw_password, user.password)
+  if upgraded:
+    user.password = upgraded
+    user.save(update_fields=['password'])
+    metrics.inc('password_rehashes_total')
+  return valid
+
+
+def make_password(raw_password):
+  """Hash a password in the hashing pool"""
+  return _run(hashers.make_password, raw_password)
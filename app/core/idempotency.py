@@ -0,0 +1,119 @@
+import functools
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def claim_key(user, key, method, path):
+  """Claim `key` for a request, returning the record and whether we own it
+
+  The unique constraint on (user, key) acts as the in-flight lock: only
+  one request can insert the row, concurrent duplicates find it instead.
+  Expired keys and locks held past IDEMPOTENCY_LOCK_TIMEOUT are taken over.
+  """
+  now = timezone.now()
+  fields = {
+      'method': method,
+      'path': path,
+      'status_code': None,
+      'response_body': '',
+      'created_at': now,
+      'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+  }
+
+  for _ in range(2):
+    try:
+      with transaction.atomic():
+        return IdempotencyKey.objects.create(
+            user=user, key=key, **fields), True
+    except IntegrityError:
+      pass
+
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+      continue
+
+    lock_expiry = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    stale_lock = not record.is_complete and record.created_at <= lock_expiry
+    if record.expires_at > now and not stale_lock:
+      return record, False
+
+    taken = IdempotencyKey.objects.filter(
+        pk=record.pk, created_at=record.created_at).update(**fields)
+    if taken:
+      record.refresh_from_db()
+      return record, True
+
+  return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+def replay(record, method, path):
+  """Return the response for a retried request"""
+  if record.method != method or record.path != path:
+    return Response(
+        {'detail': 'Idempotency-Key was used for a different request'},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+  if not record.is_complete:
+    return Response(
+        {'detail': 'A request with this Idempotency-Key is in progress'},
+        status=status.HTTP_409_CONFLICT,
+        headers={'Retry-After': '1'})
+
+  body = json.loads(record.response_body) if record.response_body else None
+  return Response(body, status=record.status_code,
+                  headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(func):
+  """Make a POST handler safe to retry with an Idempotency-Key header
+
+  The first response for each (user, key) is stored for
+  IDEMPOTENCY_KEY_TTL seconds and replayed for retries. Server errors are
+  not stored so that the request can be retried for real.
+  """
+  @functools.wraps(func)
+  def wrapper(view, request, *args, **kwargs):
+    key = request.META.get(IDEMPOTENCY_HEADER)
+    if not key or not request.user.is_authenticated:
+      return func(view, request, *args, **kwargs)
+
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+      return Response({'detail': 'Idempotency-Key is too long'},
+                      status=status.HTTP_400_BAD_REQUEST)
+
+    record, claimed = claim_key(
+        request.user, key, request.method, request.path)
+    if not claimed:
+      return replay(record, request.method, request.path)
+
+    try:
+      response = func(view, request, *args, **kwargs)
+    except exceptions.APIException as exc:
+      response = view.handle_exception(exc)
+    except Exception:
+      record.delete()
+      raise
+
+    if response.status_code >= 500:
+      record.delete()
+    else:
+      record.status_code = response.status_code
+      record.response_body = json.dumps(
+          getattr(response, 'data', None), cls=JSONEncoder)
+      record.save(update_fields=('status_code', 'response_body'))
+
+    return response
+
+  return wrapper
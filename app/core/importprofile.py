@@ -0,0 +1,42 @@
+import json
+import sys
+import time
+from importlib import _bootstrap
+
+
+def profile(code):
+  """Run `code`, timing the import of every module it loads
+
+  Returns the module name, own seconds, total seconds and nesting depth of
+  each import, in the order they finished. Unlike `python -X importtime`,
+  modules loaded by importlib.import_module, as Django loads settings,
+  apps and URL confs, are counted too.
+  """
+  records = []
+  # Seconds spent in the nested imports of every import under way
+  nested = [0]
+  find_and_load = _bootstrap._find_and_load
+
+  def timed_find_and_load(name, import_):
+    start = time.perf_counter()
+    nested.append(0)
+    try:
+      return find_and_load(name, import_)
+    finally:
+      total = time.perf_counter() - start
+      own = total - nested.pop()
+      nested[-1] += total
+      records.append((name, own, total, len(nested) - 1))
+
+  _bootstrap._find_and_load = timed_find_and_load
+  try:
+    exec(code, {})
+  finally:
+    _bootstrap._find_and_load = find_and_load
+  return records
+
+
+if __name__ == '__main__':
+  # Only the standard library is loaded before profiling, so that this can
+  # run in a new interpreter ahead of everything else
+  print(json.dumps(profile(sys.argv[1])))
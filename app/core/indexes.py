@@ -0,0 +1,71 @@
+from django.db import migrations
+from django.db.backends.utils import truncate_name
+
+
+def _relkind(cursor, table):
+  cursor.execute(
+      'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+  row = cursor.fetchone()
+  return row[0] if row else None
+
+
+def _partitions(cursor, table):
+  cursor.execute(
+      'SELECT inhrelid::regclass::text FROM pg_inherits '
+      'WHERE inhparent = to_regclass(%s) ORDER BY 1', [table])
+  return [row[0] for row in cursor.fetchall()]
+
+
+def _partition_index(connection, name, partition):
+  return truncate_name(f'{name}_{partition}', connection.ops.max_name_length())
+
+
+def create_concurrently(schema_editor, name, table, columns, unique=False):
+  """Build an index without blocking writes to its table
+
+  An index left invalid by an interrupted build is dropped first. A table
+  partitioned by manage.py partition_recipes cannot have an index built
+  concurrently, so the index is created on the table only, each partition
+  gets its own concurrent build, and attaching them all makes it valid.
+  """
+  connection = schema_editor.connection
+  kind = 'UNIQUE INDEX' if unique else 'INDEX'
+  with connection.cursor() as cursor:
+    if _relkind(cursor, table) != 'p':
+      cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+      cursor.execute(
+          f'CREATE {kind} CONCURRENTLY {name} ON {table} ({columns})')
+      return
+
+    # Only takes the lock of the table for as long as it takes to create
+    # an empty index
+    cursor.execute(f'DROP INDEX IF EXISTS {name}')
+    cursor.execute(f'CREATE {kind} {name} ON ONLY {table} ({columns})')
+    for partition in _partitions(cursor, table):
+      index = _partition_index(connection, name, partition)
+      cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+      cursor.execute(
+          f'CREATE {kind} CONCURRENTLY {index} ON {partition} ({columns})')
+      cursor.execute(f'ALTER INDEX {name} ATTACH PARTITION {index}')
+
+
+def drop_concurrently(schema_editor, name, table):
+  """Drop an index built by create_concurrently()
+
+  The index of a partitioned table is dropped along with the indexes of
+  its partitions, which cannot be done concurrently.
+  """
+  with schema_editor.connection.cursor() as cursor:
+    concurrently = '' if _relkind(cursor, table) == 'p' else 'CONCURRENTLY '
+    cursor.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
+
+
+def add_index_concurrently(name, table, columns, unique=False):
+  """Return a migration operation building an index with
+  create_concurrently(), for migrations that are not atomic"""
+  return migrations.RunPython(
+      lambda apps, schema_editor: create_concurrently(
+          schema_editor, name, table, columns, unique),
+      lambda apps, schema_editor: drop_concurrently(
+          schema_editor, name, table),
+  )
@@ -0,0 +1,27 @@
+import importlib
+
+# Every lazy module made, for load_all()
+_modules = []
+
+
+class LazyModule:
+  """Stand-in for a module, imported when one of its attributes is first
+  used, for heavy modules not needed at start up"""
+
+  def __init__(self, name):
+    self._name = name
+    self._module = None
+    _modules.append(self)
+
+  def __getattr__(self, attr):
+    if self._module is None:
+      self._module = importlib.import_module(self._name)
+    return getattr(self._module, attr)
+
+
+def load_all():
+  """Import the modules of every lazy module made so far, for a server
+  master to load them once before forking workers that share them"""
+  for module in _modules:
+    if module._module is None:
+      module._module = importlib.import_module(module._name)
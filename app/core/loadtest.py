@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from core.benchmark import percentile
+
+
+class Connection:
+  """Minimal HTTP/1.1 client connection reused between requests"""
+
+  def __init__(self, host, port):
+    self.host = host
+    self.port = port
+    self.reader = None
+    self.writer = None
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+    self.reader = self.writer = None
+
+  async def request(self, method, path, headers, body=b''):
+    """Send a request and read the whole response
+
+    Returns the status code and the size of the response body.
+    """
+    if self.writer is None:
+      self.reader, self.writer = await asyncio.open_connection(
+          self.host, self.port)
+
+    lines = [f'{method} {path} HTTP/1.1',
+             f'Host: {self.host}:{self.port}',
+             f'Content-Length: {len(body)}']
+    lines.extend(f'{name}: {value}' for name, value in headers.items())
+    self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await self.writer.drain()
+
+    status_line = await self.reader.readline()
+    if not status_line:
+      raise ConnectionError('Connection closed by the server')
+    status = int(status_line.split()[1])
+
+    response_headers = {}
+    while True:
+      line = await self.reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+      name, _, value = line.decode('latin-1').partition(':')
+      response_headers[name.strip().lower()] = value.strip().lower()
+
+    if method == 'HEAD' or status in (204, 304) or status < 200:
+      size = 0
+    elif response_headers.get('transfer-encoding') == 'chunked':
+      size = await self._read_chunked()
+    elif 'content-length' in response_headers:
+      size = int(response_headers['content-length'])
+      await self.reader.readexactly(size)
+    else:
+      size = len(await self.reader.read())
+      self.close()
+
+    if response_headers.get('connection') == 'close':
+      self.close()
+    return status, size
+
+  async def _read_chunked(self):
+    size = 0
+    while True:
+      chunk_size = int((await self.reader.readline()).split(b';')[0], 16)
+      await self.reader.readexactly(chunk_size + 2)
+      size += chunk_size
+      if chunk_size == 0:
+        return size
+
+
+class Results:
+  """Latencies and outcomes of replayed requests by route"""
+
+  def __init__(self):
+    self.latencies = {}
+    self.statuses = {}
+    self.errors = Counter()
+    self.elapsed = 0.0
+
+  def add(self, route, latency, status=None):
+    """Record a response, or a failed request when `status` is None"""
+    self.latencies.setdefault(route, []).append(latency)
+    self.statuses.setdefault(route, Counter())[status] += 1
+    if status is None or status >= 500:
+      self.errors[route] += 1
+
+  def report(self):
+    """Return throughput, latency percentiles and error rate per route"""
+    elapsed = self.elapsed or 1
+    report = {}
+    for route, latencies in sorted(self.latencies.items()):
+      latencies = [latency * 1000 for latency in latencies]
+      report[route] = {
+          'requests': len(latencies),
+          'rps': round(len(latencies) / elapsed, 2),
+          'p50_ms': round(statistics.median(latencies), 2),
+          'p95_ms': round(percentile(latencies, 0.95), 2),
+          'p99_ms': round(percentile(latencies, 0.99), 2),
+          'error_rate': round(self.errors[route] / len(latencies), 4),
+          'statuses': {str(status or 'failed'): count for status, count
+                       in sorted(self.statuses[route].items(),
+                                 key=lambda item: item[0] or 0)},
+      }
+    return report
+
+
+def prepare(record, tokens):
+  """Return the method, path, headers and body to replay a record with"""
+  headers = {'Accept': 'application/json'}
+  token = tokens.get(record.get('user'))
+  if token:
+    headers['Authorization'] = f'Token {token}'
+
+  body = b''
+  if record.get('body') is not None:
+    headers['Content-Type'] = 'application/json'
+    body = json.dumps(record['body']).encode()
+
+  return record['method'], record['path'], headers, body
+
+
+async def replay(records, url, concurrency, tokens, speed=None, timeout=30):
+  """Replay recorded requests against the server at `url`
+
+  `concurrency` workers each take the next record in turn over a
+  connection of their own. With `speed`, records are not sent before
+  their recorded time, sped up by that factor.
+  """
+  parts = urlsplit(url)
+  host = parts.hostname
+  port = parts.port or 80
+  prefix = parts.path.rstrip('/')
+
+  results = Results()
+  pending = iter(records)
+  first_ts = records[0].get('ts', 0) if records else 0
+  start = time.monotonic()
+
+  async def worker():
+    connection = Connection(host, port)
+    for record in pending:
+      if speed:
+        delay = (start + (record.get('ts', 0) - first_ts) / speed -
+                 time.monotonic())
+        if delay > 0:
+          await asyncio.sleep(delay)
+
+      method, path, headers, body = prepare(record, tokens)
+      route = record.get('route') or path
+      sent = time.monotonic()
+      try:
+        status, _ = await asyncio.wait_for(
+            connection.request(method, prefix + path, headers, body),
+            timeout)
+      except (OSError, ValueError, asyncio.TimeoutError,
+              asyncio.IncompleteReadError):
+        connection.close()
+        results.add(route, time.monotonic() - sent)
+      else:
+        results.add(route, time.monotonic() - sent, status)
+    connection.close()
+
+  await asyncio.gather(*(worker() for _ in range(concurrency)))
+  results.elapsed = time.monotonic() - start
+  return results
+
+
+def run(records, url, concurrency, tokens, speed=None, timeout=30):
+  """Replay records on a new event loop and return the results"""
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(
+        replay(records, url, concurrency, tokens, speed, timeout))
+  finally:
+    loop.close()
+
+
+class ServerProcess:
+  """Context manager running the `serve` command in a subprocess on a
+  local port, giving the URL to reach it
+
+  Throttling is turned off unless `env` turns it on, as benchmarks send
+  more requests per user than the rates allow.
+  """
+
+  def __init__(self, port, serve_args=(), env=None):
+    self.port = port
+    self.args = [
+        sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+        'serve', '--bind', f'127.0.0.1:{port}', '--max-requests', '0',
+        *serve_args]
+    self.env = dict(os.environ, THROTTLE_ENABLED='0', **(env or {}))
+
+  def __enter__(self):
+    self.process = subprocess.Popen(
+        self.args, env=self.env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+      if self.process.poll() is not None:
+        raise CommandError(f'Server exited with {self.process.returncode}')
+      try:
+        socket.create_connection(('127.0.0.1', self.port), 1).close()
+        return f'http://127.0.0.1:{self.port}'
+      except OSError:
+        time.sleep(0.2)
+    self.__exit__()
+    raise CommandError('Server did not start')
+
+  def __exit__(self, *exc_info):
+    self.process.terminate()
+    self.process.wait()
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipe import catalogue
+
+
+class Command(BaseCommand):
+  """Django command to link existing tags and ingredients to the shared
+  catalogue and merge the ones a user has twice
+
+  Runs in batches and can be interrupted and run again. Prints the size
+  of the affected tables before and after; deleted rows only free their
+  space to the table once vacuumed, see --vacuum.
+
+  Migration 0012 stops while a user has rows whose names differ only in
+  case, as its unique indexes on (user_id, lower(name)) cannot be built
+  over them; run this command, then migrate again.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument(
+        '--vacuum', action='store_true',
+        help='Vacuum the affected tables before measuring them again')
+
+  def handle(self, *args, **options):
+    before = catalogue.sizes()
+    for kind in catalogue.KINDS:
+      linked = sum(catalogue.link(kind, options['batch_size']))
+      merged = sum(catalogue.merge_duplicates(kind, options['batch_size']))
+      user_bytes, catalogue_bytes = catalogue.name_bytes(kind)
+      self.stdout.write(
+          f'{kind}: linked {linked}, merged {merged} duplicates; names '
+          f'take {user_bytes} bytes in user rows, {catalogue_bytes} in the '
+          f'catalogue')
+
+    if options['vacuum']:
+      with connection.cursor() as cursor:
+        for table, *_ in before:
+          cursor.execute(
+              f'VACUUM ANALYZE {connection.ops.quote_name(table)}')
+
+    self.stdout.write(
+        f'{"table":<28} {"rows":>10} {"table bytes":>22} '
+        f'{"index bytes":>22}')
+    for (table, rows, table_bytes, index_bytes), (_, *after) in zip(
+            before, catalogue.sizes()):
+      self.stdout.write(
+          f'{table:<28} {after[0]:>10} '
+          f'{table_bytes:>10} -> {after[1]:>8} '
+          f'{index_bytes:>10} -> {after[2]:>8}')
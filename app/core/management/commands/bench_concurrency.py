@@ -0,0 +1,85 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core import loadtest
+from core.models import Ingredient, Recipe, Tag
+
+
+class Command(BaseCommand):
+  """Django command to compare how many concurrent clients one WSGI and
+  one ASGI worker serve while every query is slowed down
+
+  Both servers are started with `serve` against the configured database,
+  where a user with some recipes is created for the run and then removed.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument('--concurrency', default='1,10,50')
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Requests to make at every concurrency')
+    parser.add_argument(
+        '--latency-ms', type=float, default=50,
+        help='Delay added to every query')
+    parser.add_argument(
+        '--threads', type=int, default=settings.ASGI_THREADS,
+        help='Thread pool size of the ASGI worker')
+    parser.add_argument('--port', type=int, default=8901)
+
+  def handle(self, *args, **options):
+    levels = [int(level) for level in options['concurrency'].split(',')]
+    user = get_user_model().objects.create_user(
+        email=f'bench-{uuid.uuid4().hex}@example.com', password=None)
+    try:
+      token = Token.objects.create(user=user).key
+      records = self.records(user)
+      records = (records * options['requests'])[:options['requests']]
+      for asgi in (False, True):
+        self.stdout.write('ASGI' if asgi else 'WSGI')
+        serve_args = ['--workers', '1', '--threads', '1']
+        if asgi:
+          serve_args.append('--asgi')
+        env = {'ASGI_THREADS': str(options['threads']),
+               'INJECT_DB_LATENCY_MS': str(options['latency_ms'])}
+        with loadtest.ServerProcess(
+                options['port'] + asgi, serve_args, env) as url:
+          for level in levels:
+            results = loadtest.run(records, url, level, {user.id: token})
+            self.report(level, results)
+    finally:
+      user.delete()
+
+  def records(self, user):
+    """Return requests to every read endpoint on data owned by `user`"""
+    tag = Tag.objects.create(user=user, name='Dinner')
+    ingredient = Ingredient.objects.create(user=user, name='Salt')
+    recipe = None
+    for i in range(10):
+      recipe = Recipe.objects.create(
+          user=user, title=f'Recipe {i}', time_minutes=10, price=5)
+      recipe.tags.add(tag)
+      recipe.ingredients.add(ingredient)
+
+    paths = [
+        reverse('recipe:recipe-list'),
+        reverse('recipe:recipe-detail', args=[recipe.id]),
+        reverse('recipe:tag-list'),
+        reverse('recipe:ingredient-list'),
+        reverse('user:me'),
+    ]
+    return [{'method': 'GET', 'path': path, 'user': user.id,
+             'route': 'read'} for path in paths]
+
+  def report(self, level, results):
+    total = sum(len(latencies) for latencies in results.latencies.values())
+    result = results.report()['read']
+    self.stdout.write(
+        f'  {level:>4} clients {total / results.elapsed:>8.1f} req/s '
+        f'p50 {result["p50_ms"]:>8.1f}ms p95 {result["p95_ms"]:>8.1f}ms '
+        f'errors {result["error_rate"]:>6.1%}')
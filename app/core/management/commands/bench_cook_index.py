@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+
+from django.core.management.base import BaseCommand
+
+from recipe.cook import IngredientIndex
+
+
+class Command(BaseCommand):
+  """Django command to benchmark the "what can I cook" ingredient index"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--ingredients', type=int, default=2000)
+    parser.add_argument('--per-recipe', type=int, default=8)
+    parser.add_argument('--available', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+
+  def handle(self, *args, **options):
+    rng = np.random.RandomState(options['seed'])
+    recipe_ids = np.arange(1, options['recipes'] + 1)
+    pairs = np.column_stack((
+        np.repeat(recipe_ids, options['per_recipe']),
+        rng.randint(1, options['ingredients'] + 1,
+                    options['recipes'] * options['per_recipe'])))
+
+    start = time.perf_counter()
+    index = IngredientIndex(0, recipe_ids, pairs)
+    build_ms = (time.perf_counter() - start) * 1000
+    self.stdout.write(
+        f'Built index of {options["recipes"]} recipes in {build_ms:.1f}ms '
+        f'({index.nbytes / 2 ** 20:.1f}MiB)')
+
+    start = time.perf_counter()
+    for recipe_id in range(1, options['queries'] + 1):
+      index.set_recipe(int(recipe_id), rng.randint(
+          1, options['ingredients'] + 1, options['per_recipe']).tolist())
+    update_us = (time.perf_counter() - start) * 1e6 / options['queries']
+    self.stdout.write(f'Updated one recipe in {update_us:.1f}us on average')
+
+    for max_missing in (0, 1, 2):
+      timings = []
+      matched = 0
+      for _ in range(options['queries']):
+        available = rng.choice(
+            options['ingredients'], options['available'],
+            replace=False) + 1
+        start = time.perf_counter()
+        matched += len(index.match(available.tolist(), max_missing))
+        timings.append((time.perf_counter() - start) * 1000)
+
+      self.stdout.write(
+          f'missing<={max_missing}: p50 {np.percentile(timings, 50):.2f}ms '
+          f'p95 {np.percentile(timings, 95):.2f}ms, '
+          f'{matched / options["queries"]:.0f} recipes matched on average')
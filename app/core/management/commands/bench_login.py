@@ -0,0 +1,69 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core import loadtest
+
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+  """Django command to measure login throughput of a served instance
+
+  Users are created in the configured database for the run and removed
+  afterwards. Their passwords are hashed with --seed-iterations, so that
+  the first round of logins also measures upgrading the hashes when that
+  differs from PASSWORD_PBKDF2_ITERATIONS.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument(
+        '--logins', type=int, default=200, help='Logins in every round')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument(
+        '--seed-iterations', type=int,
+        default=settings.PASSWORD_PBKDF2_ITERATIONS,
+        help='PBKDF2 iterations of the stored hashes')
+    parser.add_argument('--port', type=int, default=8911)
+
+  def handle(self, *args, **options):
+    prefix = f'bench-{uuid.uuid4().hex}'
+    with override_settings(
+            PASSWORD_PBKDF2_ITERATIONS=options['seed_iterations']):
+      password = hashers.make_password(PASSWORD)
+    users = get_user_model().objects.bulk_create(
+        get_user_model()(email=f'{prefix}-{i}@example.com',
+                         password=password)
+        for i in range(options['users']))
+
+    records = [{'method': 'POST', 'path': reverse('user:token'),
+                'route': 'login',
+                'body': {'email': user.email, 'password': PASSWORD}}
+               for user in users]
+    records = (records * options['logins'])[:options['logins']]
+
+    serve_args = ['--workers', str(options['workers']),
+                  '--threads', str(options['threads'])]
+    try:
+      with loadtest.ServerProcess(options['port'], serve_args) as url:
+        for name in ('first', 'repeat'):
+          results = loadtest.run(records, url, options['concurrency'], {})
+          self.report(name, results)
+    finally:
+      get_user_model().objects.filter(email__startswith=prefix).delete()
+
+  def report(self, name, results):
+    result = results.report()['login']
+    statuses = ', '.join(f'{status}: {count}'
+                         for status, count in result['statuses'].items())
+    self.stdout.write(
+        f'{name:<7} {result["rps"]:>8.1f} logins/s '
+        f'p50 {result["p50_ms"]:>8.1f}ms p95 {result["p95_ms"]:>8.1f}ms '
+        f'({statuses})')
@@ -0,0 +1,120 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import partitioning
+
+SCHEMA = 'bench_partitions'
+
+
+class Command(BaseCommand):
+  """Django command to compare per-user reads and vacuums on a plain and
+  a hash partitioned recipe table
+
+  Both tables are built in a scratch schema of the configured database
+  with --users users owning --recipes recipes each, and dropped at the
+  end of the run.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument(
+        '--recipes', type=int, default=100, help='Recipes per user')
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument(
+        '--samples', type=int, default=50, help='Users to query')
+    parser.add_argument(
+        '--touched-users', type=int, default=5,
+        help='Users whose recipes are updated before vacuuming')
+
+  def handle(self, *args, **options):
+    try:
+      partitioning.check_supported()
+    except partitioning.PartitioningError as e:
+      raise CommandError(str(e))
+
+    with connection.cursor() as cursor:
+      cursor.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+      cursor.execute(f'CREATE SCHEMA {SCHEMA}')
+      try:
+        self.build(cursor, options)
+        step = max(options['users'] // options['samples'], 1)
+        users = list(range(1, options['users'] + 1, step))
+        touched = users[:options['touched_users']]
+        for table in ('plain', 'partitioned'):
+          query_ms, buffers = self.query(cursor, table, users)
+          vacuum_ms = self.vacuum(cursor, table, touched)
+          self.stdout.write(
+              f'{table:<12} query p50 {query_ms:>7.2f}ms '
+              f'{buffers:>6.0f} buffers, vacuum {vacuum_ms:>8.1f}ms')
+      finally:
+        cursor.execute(f'DROP SCHEMA {SCHEMA} CASCADE')
+
+  def build(self, cursor, options):
+    columns = ('id bigint NOT NULL, user_id integer NOT NULL, '
+               'title varchar(255) NOT NULL, time_minutes integer NOT NULL, '
+               'price numeric(5, 2) NOT NULL')
+    cursor.execute(f'CREATE TABLE {SCHEMA}.plain ({columns})')
+    cursor.execute(
+        f'CREATE TABLE {SCHEMA}.partitioned ({columns}) '
+        f'PARTITION BY HASH (user_id)')
+    for remainder in range(options['partitions']):
+      cursor.execute(
+          f'CREATE TABLE {SCHEMA}.partitioned_{remainder} PARTITION OF '
+          f'{SCHEMA}.partitioned FOR VALUES WITH '
+          f'(MODULUS {options["partitions"]}, REMAINDER {remainder})')
+
+    for table in ('plain', 'partitioned'):
+      # Rows of a user are spread over the table as recipes get added
+      # over time, rather than inserted together
+      cursor.execute(
+          f'INSERT INTO {SCHEMA}.{table} '
+          f'SELECT n, 1 + n %% %s, %s || n, 10, 5 '
+          f'FROM generate_series(0, %s) AS n',
+          [options['users'], 'Recipe ',
+           options['users'] * options['recipes'] - 1])
+      cursor.execute(f'ALTER TABLE {SCHEMA}.{table} ADD PRIMARY KEY '
+                     f'(id, user_id)')
+      cursor.execute(f'CREATE INDEX ON {SCHEMA}.{table} (user_id)')
+      cursor.execute(f'VACUUM ANALYZE {SCHEMA}.{table}')
+
+  def query(self, cursor, table, users):
+    """Return the median time and buffers of listing a user's recipes"""
+    times, buffers = [], []
+    for user in users:
+      cursor.execute(
+          f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT * FROM '
+          f'{SCHEMA}.{table} WHERE user_id = %s ORDER BY id DESC', [user])
+      plan = cursor.fetchone()[0]
+      if isinstance(plan, str):
+        plan = json.loads(plan)
+      plan = plan[0]
+      times.append(plan['Execution Time'])
+      buffers.append(plan['Plan']['Shared Hit Blocks'] +
+                     plan['Plan']['Shared Read Blocks'])
+    return statistics.median(times), statistics.median(buffers)
+
+  def vacuum(self, cursor, table, users):
+    """Return the time vacuuming takes after updating some users' recipes
+
+    The plain table has to be vacuumed whole, while only the partitions
+    holding the touched users need it when partitioned.
+    """
+    cursor.execute(
+        f'UPDATE {SCHEMA}.{table} SET time_minutes = time_minutes + 1 '
+        f'WHERE user_id = ANY(%s)', [users])
+    if table == 'plain':
+      targets = [f'{SCHEMA}.plain']
+    else:
+      cursor.execute(
+          f'SELECT DISTINCT tableoid::regclass::text FROM '
+          f'{SCHEMA}.partitioned WHERE user_id = ANY(%s)', [users])
+      targets = [row[0] for row in cursor.fetchall()]
+
+    start = time.monotonic()
+    for target in targets:
+      cursor.execute(f'VACUUM {target}')
+    return (time.monotonic() - start) * 1000
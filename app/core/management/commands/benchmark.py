@@ -0,0 +1,72 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+  """Django command to benchmark every API route at several data volumes
+
+  Data is seeded inside a transaction that is rolled back at the end, so
+  the command leaves the database as it found it.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        '--scales', default='1,1000,100000',
+        help='Comma separated numbers of recipes to seed')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument(
+        '--routes', help='Comma separated route names to benchmark')
+    parser.add_argument('--baseline', help='Baseline file to compare with')
+    parser.add_argument(
+        '--save-baseline', help='Write the results to this baseline file')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.25,
+        help='Allowed relative growth of latency and memory')
+
+  def handle(self, *args, **options):
+    scales = [int(scale) for scale in options['scales'].split(',')]
+    only = set(options['routes'].split(',')) if options['routes'] else None
+
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'],
+            THROTTLE_ENABLED=False):
+      results = {str(scale): self.run_scale(scale, options, only)
+                 for scale in scales}
+
+    if options['save_baseline']:
+      with open(options['save_baseline'], 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+      self.stdout.write(f'Baseline saved to {options["save_baseline"]}')
+
+    if options['baseline']:
+      with open(options['baseline']) as f:
+        baseline = json.load(f)
+      regressions = benchmark.compare(
+          results, baseline, options['tolerance'])
+      if regressions:
+        for regression in regressions:
+          self.stdout.write(self.style.ERROR(regression))
+        raise CommandError(f'{len(regressions)} regressions found')
+      self.stdout.write(self.style.SUCCESS('No regressions found'))
+
+  def run_scale(self, scale, options, only):
+    self.stdout.write(f'Seeding {scale} recipes...')
+    results = {}
+    with transaction.atomic():
+      for name, result in benchmark.run_scale(
+              scale, options['iterations'], only):
+        results[name] = result
+        self.stdout.write(
+            f'  {name:<22} p50 {result["p50_ms"]:>9.2f}ms '
+            f'p95 {result["p95_ms"]:>9.2f}ms '
+            f'{result["queries"]:>6} queries '
+            f'{result["peak_kib"]:>10.1f}KiB peak '
+            f'status {",".join(map(str, result["statuses"]))}')
+      transaction.set_rollback(True)
+    return results
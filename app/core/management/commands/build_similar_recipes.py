@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+from recipe import similarity
+
+
+class Command(BaseCommand):
+  """Django command to precompute similar recipes"""
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        '--user', type=int, action='append', dest='users',
+        help='Only rebuild the given user ids')
+    parser.add_argument(
+        '--all', action='store_true',
+        help='Rebuild every user instead of only users with changes')
+    parser.add_argument(
+        '--count', type=int, default=settings.RECIPE_SIMILAR_COUNT)
+
+  def handle(self, *args, **options):
+    if options['users']:
+      user_ids = options['users']
+    elif options['all']:
+      user_ids = Recipe.objects.order_by().values_list(
+          'user_id', flat=True).distinct()
+    else:
+      user_ids = similarity.stale_user_ids()
+
+    for user_id in list(user_ids):
+      start = time.perf_counter()
+      built = similarity.build_for_user(user_id, options['count'])
+      self.stdout.write(
+          f'User {user_id}: {built} recipes in '
+          f'{time.perf_counter() - start:.2f}s')
+
+    self.stdout.write(self.style.SUCCESS('Similar recipes built!'))
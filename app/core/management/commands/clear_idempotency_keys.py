@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+  """Django command to delete expired idempotency keys"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--batch-size', type=int, default=1000)
+
+  def handle(self, *args, **options):
+    now = timezone.now()
+    deleted = 0
+    while True:
+      ids = list(IdempotencyKey.objects.filter(
+          expires_at__lte=now).values_list('id', flat=True)[
+          :options['batch_size']])
+      if not ids:
+        break
+      deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+    self.stdout.write(self.style.SUCCESS(
+        f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,90 @@
+import glob
+import json
+import os
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.authtoken.models import Token
+
+from core import loadtest, recording
+
+
+class Command(BaseCommand):
+  """Django command to replay recorded API traffic against a server
+
+  Records of users found in the database are sent with their API token,
+  others anonymously. Requests whose body was not recorded, like image
+  uploads, are skipped.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        'paths', nargs='*',
+        help='NDJSON files to replay, by default all files in RECORDING_DIR')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument(
+        '--speed', type=float,
+        help='Keep the recorded pace sped up by this factor, instead of '
+             'sending requests as fast as possible')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', help='Write the report to this file')
+
+  def handle(self, *args, **options):
+    paths = options['paths'] or self.default_paths()
+    try:
+      records = recording.load(paths)
+    except (OSError, ValueError) as e:
+      raise CommandError(e)
+
+    replayable = [r for r in records if not r.get('body_omitted')]
+    if len(replayable) < len(records):
+      self.stdout.write(
+          f'Skipping {len(records) - len(replayable)} requests without a '
+          f'recorded body')
+    if not replayable:
+      raise CommandError('No requests to replay')
+
+    tokens = self.tokens({r.get('user') for r in replayable})
+    self.stdout.write(
+        f'Replaying {len(replayable)} requests x{options["repeat"]} '
+        f'against {options["url"]} with {options["concurrency"]} workers')
+    results = loadtest.run(
+        replayable * options['repeat'], options['url'],
+        options['concurrency'], tokens, options['speed'],
+        options['timeout'])
+
+    report = results.report()
+    total = sum(route['requests'] for route in report.values())
+    errors = sum(results.errors.values())
+    for route, result in report.items():
+      self.stdout.write(
+          f'  {route:<32} {result["requests"]:>7} req '
+          f'{result["rps"]:>8.1f} req/s '
+          f'p50 {result["p50_ms"]:>8.1f}ms '
+          f'p95 {result["p95_ms"]:>8.1f}ms '
+          f'p99 {result["p99_ms"]:>8.1f}ms '
+          f'errors {result["error_rate"]:>6.1%}')
+    self.stdout.write(
+        f'{total} requests in {results.elapsed:.1f}s '
+        f'({total / (results.elapsed or 1):.1f} req/s), {errors} errors')
+
+    if options['output']:
+      with open(options['output'], 'w') as f:
+        json.dump(report, f, indent=2)
+
+  def default_paths(self):
+    if not settings.RECORDING_DIR:
+      raise CommandError('Give files to replay or set RECORDING_DIR')
+    return sorted(glob.glob(
+        os.path.join(settings.RECORDING_DIR, '*.ndjson')))
+
+  def tokens(self, user_ids):
+    """Return the API token of every recorded user that exists"""
+    existing = get_user_model().objects.filter(
+        id__in=[i for i in user_ids if i is not None])
+    return {user.id: Token.objects.get_or_create(user=user)[0].key
+            for user in existing}
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import partitioning
+
+
+class Command(BaseCommand):
+  """Django command to move recipe data to tables hash partitioned by user
+
+  The migration runs online in steps: `prepare` creates the partitioned
+  tables and mirrors writes into them, `copy` fills them in batches and
+  can be interrupted and resumed, `swap` puts them in place under a short
+  exclusive lock, and `drop-old` removes the old tables once the swap is
+  known to be good. `abort` undoes `prepare` before the swap.
+
+  Needs PostgreSQL 11 or later. After the swap, foreign keys to recipes,
+  tags and ingredients are no longer enforced by the database, so new
+  ones have to be declared with db_constraint=False.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        'action',
+        choices=['prepare', 'copy', 'swap', 'drop-old', 'abort', 'status'])
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument(
+        '--pause', type=float, default=0,
+        help='Seconds to wait between batches of the copy')
+
+  def handle(self, *args, **options):
+    try:
+      getattr(self, options['action'].replace('-', '_'))(options)
+    except partitioning.PartitioningError as e:
+      raise CommandError(str(e))
+
+  def prepare(self, options):
+    partitioning.prepare(options['partitions'])
+    self.stdout.write(self.style.SUCCESS(
+        f'Created {options["partitions"]} partitions per table, '
+        f'mirroring writes'))
+
+  def copy(self, options):
+    copied = 0
+    for table, count, last_id in partitioning.copy(
+            options['batch_size'], options['pause']):
+      copied += count
+      self.stdout.write(f'{table}: copied {count} rows up to id {last_id}')
+    self.stdout.write(self.style.SUCCESS(f'Copied {copied} rows'))
+
+  def swap(self, options):
+    partitioning.swap()
+    self.stdout.write(self.style.SUCCESS('Partitioned tables in place'))
+
+  def drop_old(self, options):
+    partitioning.drop_old()
+    self.stdout.write(self.style.SUCCESS('Dropped unpartitioned tables'))
+
+  def abort(self, options):
+    partitioning.abort()
+    self.stdout.write(self.style.SUCCESS('Dropped partitioned copies'))
+
+  def status(self, options):
+    for table, state, partitions, last_id in partitioning.status():
+      line = f'{table:<24} {state:<14} {partitions:>3} partitions'
+      if last_id is not None:
+        line += f', copied up to id {last_id}'
+      self.stdout.write(line)
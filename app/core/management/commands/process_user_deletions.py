@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import UserDeletion
+from user import deletion
+
+
+class Command(BaseCommand):
+  """Django command to delete the data of users who deleted their account
+
+  Runs as a worker picking up queued deletions, or with --once until none
+  are left.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        '--batch-size', type=int, default=settings.USER_DELETION_BATCH_SIZE)
+    parser.add_argument(
+        '--pause', type=float, default=settings.USER_DELETION_PAUSE,
+        help='Seconds to wait between batches')
+    parser.add_argument(
+        '--once', action='store_true',
+        help='Exit when no deletions are queued')
+
+  def handle(self, *args, **options):
+    while True:
+      job = deletion.claim(settings.USER_DELETION_STALE_AFTER)
+      if job is None:
+        if options['once']:
+          break
+        time.sleep(settings.USER_DELETION_POLL_INTERVAL)
+        continue
+
+      self.stdout.write(f'Deleting user {job.user_id}')
+      for job in deletion.run(job, options['batch_size']):
+        if job.status == UserDeletion.RUNNING:
+          self.stdout.write(
+              f'  {job.rows_deleted} rows, {job.files_deleted} files')
+          time.sleep(options['pause'])
+
+      if job.status == UserDeletion.DONE:
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted user {job.user_id}: {job.rows_deleted} rows, '
+            f'{job.files_deleted} files'))
+      else:
+        self.stderr.write(f'Deleting user {job.user_id} failed')
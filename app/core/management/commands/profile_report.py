@@ -0,0 +1,43 @@
+import pstats
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+  """Django command to aggregate request profiles into hot functions"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--dir', help='Directory holding the profiles')
+    parser.add_argument('--route', help='Only use profiles of this route')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument(
+        '--sort', default='cumulative',
+        choices=('cumulative', 'tottime', 'ncalls'))
+
+  def handle(self, *args, **options):
+    paths = []
+    routes = defaultdict(list)
+    for path in profiling.profile_paths(options['dir']):
+      info = profiling.load_info(path)
+      if options['route'] and info.get('route') != options['route']:
+        continue
+      paths.append(path)
+      routes[(info.get('route'), info.get('action'))].append(info)
+
+    if not paths:
+      self.stdout.write('No profiles found')
+      return
+
+    self.stdout.write(f'{len(paths)} profiles')
+    for (route, action), infos in sorted(routes.items(), key=str):
+      duration = sum(i.get('duration_ms', 0) for i in infos) / len(infos)
+      queries = sum(i.get('queries', 0) for i in infos) / len(infos)
+      self.stdout.write(
+          f'  {route} ({action}): {len(infos)} requests, '
+          f'{duration:.1f}ms and {queries:.1f} queries on average')
+
+    stats = pstats.Stats(*paths, stream=self.stdout)
+    stats.sort_stats(options['sort']).print_stats(options['top'])
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import startup
+
+
+class Command(BaseCommand):
+  """Django command to report what starting the application costs
+
+  The application is loaded in a new interpreter, as a server loads it
+  before its first request, and the modules and packages that took the
+  longest to import are listed. With --cold-start, a server is started as
+  well and the time until it answers its first request is checked against
+  COLD_START_TARGET_MS.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        '--api-only', action='store_true',
+        help='Load the application as API_ONLY servers do')
+    parser.add_argument(
+        '--limit', type=int, default=20,
+        help='Modules and packages to list')
+    parser.add_argument('--cold-start', action='store_true')
+    parser.add_argument('--port', type=int, default=8911)
+    parser.add_argument(
+        '--path', default='/api/recipe/tags/',
+        help='Path of the first request')
+    parser.add_argument(
+        '--no-warm-up', action='store_true',
+        help='Start the server without warming up its worker')
+    parser.add_argument(
+        '--target-ms', type=int, default=settings.COLD_START_TARGET_MS)
+
+  def handle(self, *args, **options):
+    imports, elapsed = startup.profile_imports(options['api_only'])
+    limit = options['limit']
+    own = sum(imported.own for imported in imports)
+    self.stdout.write(
+        f'{len(imports)} modules imported in {own * 1000:.0f}ms, '
+        f'interpreter ran {elapsed * 1000:.0f}ms')
+
+    self.stdout.write(f'\n{"own ms":>8} {"total ms":>9}  module')
+    for imported in sorted(imports, key=lambda i: -i.own)[:limit]:
+      self.stdout.write(
+          f'{imported.own * 1000:8.1f} {imported.total * 1000:9.1f}  '
+          f'{imported.module}')
+
+    self.stdout.write(f'\n{"own ms":>8}  package')
+    for package, time in startup.by_package(imports).most_common(limit):
+      self.stdout.write(f'{time * 1000:8.1f}  {package}')
+
+    if options['cold_start']:
+      self.cold_start(options)
+
+  def cold_start(self, options):
+    serve_args = ['--no-warm-up'] if options['no_warm_up'] else []
+    elapsed_ms = 1000 * startup.first_response(
+        options['port'], options['path'], options['api_only'], serve_args)
+    message = (f'\nFirst response {elapsed_ms:.0f}ms after start, '
+               f'target {options["target_ms"]}ms')
+    if elapsed_ms > options['target_ms']:
+      raise CommandError(message.strip())
+    self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,158 @@
+import gc
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.urls import get_resolver
+
+from gunicorn.app.base import BaseApplication
+
+from core import lazy, metrics
+
+ASGI_WORKER = 'uvicorn.workers.UvicornWorker'
+
+
+def expect_warm_ups(server):
+  # Warm up as many workers as the server starts with, or restarts with on
+  # HUP, but not the ones replacing workers recycled after
+  # SERVER_MAX_REQUESTS, which would warm up again and again
+  server.warm_ups = server.num_workers
+
+
+def pre_fork(server, worker):
+  # Move everything loaded so far out of the collector's reach, so that
+  # collections in the workers do not write to and copy shared pages
+  gc.freeze()
+  worker.warm_up = getattr(server, 'warm_ups', 0) > 0
+  if worker.warm_up:
+    server.warm_ups -= 1
+
+
+def post_fork(server, worker):
+  # Connections must not be shared between processes
+  connections.close_all()
+
+
+def post_worker_init(worker):
+  # Fill caches before the first request rather than during it
+  if not worker.warm_up:
+    return
+  from recipe import warmup
+  try:
+    warmup.warm_worker()
+  except Exception:
+    worker.log.exception('Warming up the worker failed')
+
+
+def worker_exit(server, worker):
+  # Keep the metrics of workers recycled after SERVER_MAX_REQUESTS in the
+  # archive rather than in a file per worker
+  metrics.registry.flush()
+  metrics.archive(worker.pid)
+
+
+def child_exit(server, worker):
+  # Workers killed without running worker_exit leave their last flush
+  metrics.archive(worker.pid)
+
+
+class Application(BaseApplication):
+  """Gunicorn application serving app.wsgi with the given config"""
+
+  def __init__(self, options):
+    self.options = options
+    super().__init__()
+
+  def load_config(self):
+    for key, value in self.options.items():
+      self.cfg.set(key, value)
+
+  def load(self):
+    if self.options.get('worker_class') == ASGI_WORKER:
+      from app.asgi import application
+    else:
+      from app.wsgi import application
+
+    # Import every view, serializer and model up front rather than on the
+    # first request, so that with preloading they are shared by the workers
+    get_resolver().url_patterns
+    if self.cfg.preload_app:
+      # So are the modules the application loads lazily, such as numpy,
+      # which workers loaded without preloading only import once used
+      lazy.load_all()
+    return application
+
+
+class Command(BaseCommand):
+  """Django command to run the application under a prefork server
+
+  The application is loaded before the workers are forked unless
+  --no-preload is given. Send HUP to gracefully restart the workers with
+  new settings. With preloading, code changes need a new master process:
+  send USR2, then QUIT to the old master once the new one is up.
+
+  With --asgi, app.asgi is served by uvicorn workers, each running views in
+  a pool of ASGI_THREADS threads.
+
+  The workers a server starts or restarts with warm up before taking
+  requests unless --no-warm-up is given, see recipe.warmup.warm_worker.
+  Workers replacing recycled ones do not.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument('--bind', default=settings.SERVER_BIND)
+    parser.add_argument(
+        '--workers', type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument(
+        '--threads', type=int, default=settings.SERVER_THREADS,
+        help='Threads per worker, keep-alive needs more than one')
+    parser.add_argument(
+        '--keepalive', type=int, default=settings.SERVER_KEEPALIVE,
+        help='Seconds to wait for the next request on a connection')
+    parser.add_argument(
+        '--max-requests', type=int, default=settings.SERVER_MAX_REQUESTS,
+        help='Recycle a worker after this many requests, 0 to never')
+    parser.add_argument(
+        '--timeout', type=int, default=settings.SERVER_TIMEOUT)
+    parser.add_argument(
+        '--asgi', action='store_true',
+        help='Serve app.asgi with uvicorn workers instead of app.wsgi')
+    parser.add_argument(
+        '--no-preload', action='store_false', dest='preload',
+        default=settings.SERVER_PRELOAD)
+    parser.add_argument(
+        '--no-warm-up', action='store_false', dest='warm_up',
+        default=settings.SERVER_WARM_UP)
+
+  def handle(self, *args, **options):
+    Application(self.config(options)).run()
+
+  def config(self, options):
+    """Return the gunicorn settings for the given options"""
+    config = {
+        'bind': options['bind'],
+        'workers': options['workers'] or 2 * os.cpu_count() + 1,
+        'threads': options['threads'],
+        'keepalive': options['keepalive'],
+        'max_requests': options['max_requests'],
+        'max_requests_jitter': options['max_requests'] // 10,
+        'timeout': options['timeout'],
+        'graceful_timeout': options['timeout'],
+        'preload_app': options['preload'],
+        'accesslog': '-',
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+        'worker_exit': worker_exit,
+        'child_exit': child_exit,
+    }
+    if options['asgi']:
+      config['worker_class'] = ASGI_WORKER
+    if options['warm_up']:
+      config['when_ready'] = expect_warm_ups
+      config['on_reload'] = expect_warm_ups
+      config['post_worker_init'] = post_worker_init
+    if os.path.isdir('/dev/shm'):
+      # Worker heartbeats must not block on a slow container filesystem
+      config['worker_tmp_dir'] = '/dev/shm'
+    return config
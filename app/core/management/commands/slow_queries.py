@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from core.models import SlowQuery
+
+
+class Command(BaseCommand):
+  """Django command to show the latest slow queries"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--route', help='Only show queries of this route')
+    parser.add_argument(
+        '--plans', action='store_true', help='Show query plans')
+    parser.add_argument(
+        '--clear', action='store_true', help='Delete all slow queries')
+
+  def handle(self, *args, **options):
+    if options['clear']:
+      SlowQuery.objects.all().delete()
+      self.stdout.write(self.style.SUCCESS('Slow queries cleared'))
+      return
+
+    queries = SlowQuery.objects.all()
+    if options['route']:
+      queries = queries.filter(route=options['route'])
+
+    for query in queries[:options['limit']]:
+      self.stdout.write(self.style.WARNING(
+          f'{query.created_at:%Y-%m-%d %H:%M:%S} {query.duration_ms:.1f}ms '
+          f'{query.method} {query.route} user={query.user_id}'))
+      self.stdout.write(query.sql)
+      self.stdout.write(f'params: {query.params}')
+      if options['plans'] and query.plan:
+        self.stdout.write(query.plan)
+      self.stdout.write('')
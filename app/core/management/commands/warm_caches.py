@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import warmup
+
+
+class Command(BaseCommand):
+  """Django command to fill the caches of recently active users, such as
+  after a deploy emptied them
+
+  Users are taken as active from the last time their token was used. The
+  caches filled must be shared with the server, so the command refuses to
+  run without SHARED_CACHE, as it would only fill a cache of its own.
+  """
+
+  def add_arguments(self, parser):
+    parser.add_argument(
+        '--days', type=int, default=settings.WARM_UP_DAYS,
+        help='Warm users active in the last days')
+    parser.add_argument(
+        '--limit', type=int, help='Warm at most this many users')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument(
+        '--max-queries-per-second', type=float,
+        help='Cap on the database queries of all threads together')
+
+  def handle(self, *args, **options):
+    if not settings.SHARED_CACHE:
+      raise CommandError(
+          'No cache is shared with the server; set CACHE_LOCATION')
+    users = warmup.active_users(options['days'], options['limit'])
+    warmed, failed = [], []
+    start = time.monotonic()
+
+    def on_warmed(user, error=None):
+      if error is None:
+        warmed.append(user)
+      else:
+        failed.append(user)
+        self.stderr.write(f'Warming user {user.id} failed: {error}')
+
+    warmup.warm_users(
+        users, options['concurrency'], options['max_queries_per_second'],
+        on_warmed)
+
+    self.stdout.write(self.style.SUCCESS(
+        f'Warmed {len(warmed)} of {len(users)} users in '
+        f'{time.monotonic() - start:.1f}s'))
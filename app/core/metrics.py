@@ -0,0 +1,228 @@
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    'http_requests_total': (
+        'counter', 'Requests by route, method and status code'),
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency by route'),
+    'http_request_db_queries_total': (
+        'counter', 'Database queries made while handling requests'),
+    'http_request_db_seconds_total': (
+        'counter', 'Time spent in database queries while handling requests'),
+    'http_response_bytes_total': (
+        'counter', 'Size of response bodies'),
+    'cache_requests_total': (
+        'counter', 'Application cache lookups by cache and result'),
+    'password_hash_rejections_total': (
+        'counter', 'Logins turned away because the hashing pool was full'),
+    'password_rehashes_total': (
+        'counter', 'Password hashes upgraded on login'),
+    'throttled_requests_total': (
+        'counter', 'Requests turned away by throttling, by scope'),
+}
+
+# Metrics of exited processes, added up, see archive
+ARCHIVE_FILE = 'metrics-archive.json'
+
+
+def _process_path(pid):
+  return os.path.join(settings.METRICS_DIR, f'metrics-{pid}.json')
+
+
+def _write_json(path, data):
+  tmp_path = f'{path}.tmp'
+  with open(tmp_path, 'w') as f:
+    json.dump(data, f)
+  os.replace(tmp_path, path)
+
+
+class Registry:
+  """Metrics of the current process
+
+  Updates only touch in-memory dicts. They are written to a file of their
+  own in METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds so that
+  the metrics endpoint of any worker can add up every worker's numbers.
+  """
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.counters = {}
+    self.histograms = {}
+    self.last_flush = time.monotonic()
+
+  def inc(self, name, labels, value=1):
+    key = (name, labels)
+    with self.lock:
+      self.counters[key] = self.counters.get(key, 0) + value
+
+  def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+    key = (name, labels)
+    with self.lock:
+      histogram = self.histograms.get(key)
+      if histogram is None:
+        histogram = self.histograms[key] = [[0] * (len(buckets) + 1), 0, 0]
+      histogram[0][bisect.bisect_left(buckets, value)] += 1
+      histogram[1] += value
+      histogram[2] += 1
+
+  def snapshot(self):
+    with self.lock:
+      return {
+          'counters': [[name, labels, value] for (name, labels), value
+                       in self.counters.items()],
+          'histograms': [[name, labels, list(h[0]), h[1], h[2]]
+                         for (name, labels), h in self.histograms.items()],
+      }
+
+  def flush(self):
+    """Write the metrics of this process to its file in METRICS_DIR"""
+    self.last_flush = time.monotonic()
+    if not settings.METRICS_DIR:
+      return
+
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    _write_json(_process_path(os.getpid()), self.snapshot())
+
+  def maybe_flush(self):
+    if time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL:
+      self.flush()
+
+
+registry = Registry()
+
+
+def labels(**kwargs):
+  """Return labels in the hashable form used by the registry"""
+  return tuple(sorted(kwargs.items()))
+
+
+def inc(name, value=1, **kwargs):
+  registry.inc(name, labels(**kwargs), value)
+
+
+def observe(name, value, **kwargs):
+  registry.observe(name, labels(**kwargs), value)
+
+
+def record_cache_lookup(cache_name, hit):
+  """Count a lookup in an application cache"""
+  inc('cache_requests_total', cache=cache_name,
+      result='hit' if hit else 'miss')
+
+
+def merge(snapshots):
+  """Return the counters and histograms of snapshots added together"""
+  counters = {}
+  histograms = {}
+  for snapshot in snapshots:
+    for name, label_pairs, value in snapshot['counters']:
+      key = (name, tuple(map(tuple, label_pairs)))
+      counters[key] = counters.get(key, 0) + value
+    for name, label_pairs, buckets, total, count in snapshot['histograms']:
+      key = (name, tuple(map(tuple, label_pairs)))
+      merged = histograms.setdefault(key, [[0] * len(buckets), 0, 0])
+      merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+      merged[1] += total
+      merged[2] += count
+
+  return counters, histograms
+
+
+def archive(pid):
+  """Add the metrics file of an exited process to the archive and remove
+  it, so that files do not pile up as workers are recycled
+
+  Processes exiting together take turns through a lock file.
+  """
+  if not settings.METRICS_DIR:
+    return
+
+  os.makedirs(settings.METRICS_DIR, exist_ok=True)
+  path = _process_path(pid)
+  archive_path = os.path.join(settings.METRICS_DIR, ARCHIVE_FILE)
+  with open(f'{archive_path}.lock', 'w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    snapshots = []
+    for snapshot_path in (archive_path, path):
+      try:
+        with open(snapshot_path) as f:
+          snapshots.append(json.load(f))
+      except (OSError, ValueError):
+        if snapshot_path == path:
+          return
+    counters, histograms = merge(snapshots)
+    _write_json(archive_path, {
+        'counters': [[name, labels, value] for (name, labels), value
+                     in counters.items()],
+        'histograms': [[name, labels, *h] for (name, labels), h
+                       in histograms.items()],
+    })
+    os.remove(path)
+
+
+def collect():
+  """Return the metrics of all processes added together"""
+  if settings.METRICS_DIR:
+    registry.flush()
+    snapshots = []
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+      try:
+        with open(path) as f:
+          snapshots.append(json.load(f))
+      except (OSError, ValueError):
+        continue
+  else:
+    snapshots = [registry.snapshot()]
+
+  return merge(snapshots)
+
+
+def _escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _format_labels(label_pairs, **extra):
+  pairs = list(label_pairs) + sorted(extra.items())
+  if not pairs:
+    return ''
+  return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render():
+  """Render all metrics in the Prometheus text exposition format"""
+  counters, histograms = collect()
+  lines = []
+
+  for name, (kind, description) in DESCRIPTIONS.items():
+    lines.append(f'# HELP {name} {description}')
+    lines.append(f'# TYPE {name} {kind}')
+
+    for (metric, label_pairs), value in sorted(counters.items()):
+      if metric == name:
+        lines.append(f'{name}{_format_labels(label_pairs)} {value}')
+
+    for (metric, label_pairs), (buckets, total, count) in sorted(
+            histograms.items()):
+      if metric != name:
+        continue
+      cumulative = 0
+      for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+        cumulative += bucket
+        lines.append(
+            f'{name}_bucket{_format_labels(label_pairs, le=bound)} '
+            f'{cumulative}')
+      lines.append(f'{name}_sum{_format_labels(label_pairs)} {total}')
+      lines.append(f'{name}_count{_format_labels(label_pairs)} {count}')
+
+  return '\n'.join(lines) + '\n'
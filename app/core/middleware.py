@@ -0,0 +1,208 @@
+import cProfile
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+
+from core import compression, metrics, profiling, recording, slow_queries
+
+
+class QueryCounter:
+  """Database execute wrapper counting queries and the time spent in them"""
+
+  def __init__(self):
+    self.count = 0
+    self.duration = 0.0
+
+  def __call__(self, execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+      return execute(sql, params, many, context)
+    finally:
+      self.count += 1
+      self.duration += time.perf_counter() - start
+
+
+def route_name(request):
+  """Return the name of the route a request was resolved to"""
+  match = getattr(request, 'resolver_match', None)
+  if match is None:
+    return 'unmatched'
+  return match.view_name
+
+
+def delay_query(execute, sql, params, many, context):
+  time.sleep(settings.INJECT_DB_LATENCY_MS / 1000)
+  return execute(sql, params, many, context)
+
+
+class LatencyInjectionMiddleware:
+  """Delay every query by INJECT_DB_LATENCY_MS to see how the server copes
+  with a slow database. Not loaded when the setting is 0.
+  """
+
+  def __init__(self, get_response):
+    if not settings.INJECT_DB_LATENCY_MS:
+      raise MiddlewareNotUsed
+    self.get_response = get_response
+
+  def __call__(self, request):
+    with connection.execute_wrapper(delay_query):
+      return self.get_response(request)
+
+
+class MetricsMiddleware:
+  """Record latency, query count, DB time and response size per route"""
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with connection.execute_wrapper(counter):
+      response = self.get_response(request)
+    duration = time.perf_counter() - start
+
+    route = route_name(request)
+    metrics.inc('http_requests_total', route=route, method=request.method,
+                status=response.status_code)
+    metrics.observe('http_request_duration_seconds', duration, route=route)
+    metrics.inc('http_request_db_queries_total', counter.count, route=route)
+    metrics.inc('http_request_db_seconds_total', counter.duration,
+                route=route)
+    if not response.streaming:
+      metrics.inc('http_response_bytes_total', len(response.content),
+                  route=route)
+    metrics.registry.maybe_flush()
+
+    return response
+
+
+class CompressionMiddleware:
+  """Compress responses of at least COMPRESSION_MIN_SIZE bytes with the
+  preferred encoding the client accepts
+  """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    response = self.get_response(request)
+    if not compression.compressible(response):
+      return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = compression.accepted_encoding(request)
+    if encoding is None:
+      return response
+
+    compressed = compression.compress(response.content, encoding)
+    if len(compressed) < len(response.content):
+      compression.set_encoding(response, compressed, encoding)
+    return response
+
+
+class SlowQueryMiddleware:
+  """Log queries slower than SLOW_QUERY_THRESHOLD_MS with their request"""
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    if settings.SLOW_QUERY_THRESHOLD_MS is None:
+      return self.get_response(request)
+
+    recorder = slow_queries.SlowQueryRecorder(settings.SLOW_QUERY_THRESHOLD_MS)
+    with connection.execute_wrapper(recorder):
+      response = self.get_response(request)
+
+    if recorder.queries:
+      user = getattr(request, 'user', None)
+      user_id = user.id if user is not None and user.is_authenticated else None
+      slow_queries.record(
+          recorder.queries, route_name(request), request.method, user_id)
+
+    return response
+
+
+class ProfilingMiddleware:
+  """Run sampled requests, or requests carrying the X-Profile token, under
+  cProfile and save the profile with the route, action and query count
+  """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    if not profiling.should_profile(request):
+      return self.get_response(request)
+
+    profiler = cProfile.Profile()
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with connection.execute_wrapper(counter):
+      profiler.enable()
+      try:
+        response = self.get_response(request)
+      finally:
+        profiler.disable()
+
+    user = getattr(request, 'user', None)
+    name = profiling.save(profiler, {
+        'route': route_name(request),
+        'action': getattr(request, 'view_action', None),
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': (time.perf_counter() - start) * 1000,
+        'queries': counter.count,
+        'user_id': user.id if user and user.is_authenticated else None,
+    })
+    if profiling.PROFILE_HEADER in request.META:
+      response['X-Profile-Id'] = name
+
+    return response
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    """Remember which viewset action handles the request"""
+    actions = getattr(view_func, 'actions', None) or {}
+    request.view_action = actions.get(request.method.lower())
+
+
+class RecordingMiddleware:
+  """Log a RECORDING_SAMPLE_RATE fraction of requests to RECORDING_DIR as
+  NDJSON, in the format replayed by the loadtest command
+  """
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    if not recording.should_record():
+      return self.get_response(request)
+
+    # The body can only be read before the view consumes the stream
+    body, omitted = recording.request_body(request)
+    ts = time.time()
+    start = time.perf_counter()
+    response = self.get_response(request)
+
+    user = getattr(request, 'user', None)
+    record = {
+        'ts': ts,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'route': route_name(request),
+        'user': user.id if user and user.is_authenticated else None,
+        'body': body,
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+    }
+    if omitted:
+      record['body_omitted'] = True
+    recording.write(record)
+
+    return response
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.15 on 2026-10-19 09:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRecipes',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.Recipe')),
+                ('neighbors', models.BinaryField()),
+                ('built_at', models.DateTimeField()),
+                ('changed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_slowquery'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX core_user_email_lower_idx '
+            'ON core_user (lower(email))',
+            'DROP INDEX core_user_email_lower_idx',
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+from core.indexes import add_index_concurrently
+
+INDEXES = (
+    ('core_tag_user_lower_name_uniq', 'core_tag'),
+    ('core_ingredient_user_lower_name_uniq', 'core_ingredient'),
+)
+
+
+def check_duplicates(apps, schema_editor):
+    """Stop before building the unique indexes if rows of a user still
+    differ only in case, as the index builds would fail on them"""
+    with schema_editor.connection.cursor() as cursor:
+        for _, table in INDEXES:
+            cursor.execute(
+                f'SELECT 1 FROM {table} GROUP BY user_id, lower(name) '
+                f'HAVING count(*) > 1 LIMIT 1')
+            if cursor.fetchone():
+                raise RuntimeError(
+                    f'{table} has rows of a user whose names differ only '
+                    f'in case; run manage.py backfill_catalogue to merge '
+                    f'them, then migrate again')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_catalogue'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+    ] + [
+        add_index_concurrently(
+            name, table, 'user_id, lower(name)', unique=True)
+        for name, table in INDEXES
+    ]
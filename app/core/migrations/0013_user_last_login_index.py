@@ -0,0 +1,16 @@
+from django.db import migrations
+
+from core.indexes import add_index_concurrently
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0012_tag_ingredient_user_lower_name_unique'),
+    ]
+
+    operations = [
+        add_index_concurrently(
+            'core_user_last_login_idx', 'core_user', 'last_login'),
+    ]
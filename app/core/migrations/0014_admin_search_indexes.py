@@ -0,0 +1,28 @@
+from django.db import migrations
+
+from core.indexes import add_index_concurrently
+
+# Prefix searches of the admin, on lower case values as they run them
+INDEXES = (
+    ('core_user_email_pattern_idx', 'core_user', 'lower(email)'),
+    ('core_tag_name_pattern_idx', 'core_tag', 'lower(name)'),
+    ('core_ingredient_name_pattern_idx', 'core_ingredient', 'lower(name)'),
+    ('core_recipe_title_pattern_idx', 'core_recipe', 'lower(title)'),
+    ('core_canonicaltag_name_pattern_idx', 'core_canonicaltag',
+     'lower(name)'),
+    ('core_canonicalingredient_name_pattern_idx', 'core_canonicalingredient',
+     'lower(name)'),
+)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0013_user_last_login_index'),
+    ]
+
+    operations = [
+        add_index_concurrently(name, table, f'{column} text_pattern_ops')
+        for name, table, column in INDEXES
+    ]
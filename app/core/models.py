@@ -1,9 +1,11 @@
 import uuid
 import os
-from django.db import models
+from django.db import connection, models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
 from django.core import validators
+from django.db.models.functions import Lower
 
 
 def recipe_image_file_path(instance, filename):
@@ -28,6 +30,16 @@ class UserManager(BaseUserManager):
 
     return user
 
+  def get_by_natural_key(self, email):
+    """Returns the user with an email, ignoring case unless that is
+    ambiguous. Matches the lower(email) index.
+    """
+    users = list(self.annotate(email_lower=Lower('email')).filter(
+        email_lower=email.lower())[:2])
+    if len(users) == 1:
+      return users[0]
+    return self.get(email=email)
+
   def create_superuser(self, email, password):
     """Creates a superuser"""
     user = self.create_user(email=email, password=password)
@@ -50,19 +62,99 @@ class User(AbstractBaseUser, PermissionsMixin):
   USERNAME_FIELD = 'email'
 
 
+def normalize_name(name):
+  """Return the catalogue name of a tag or ingredient name"""
+  return ' '.join(name.split()).lower()
+
+
+class CatalogueManager(models.Manager):
+
+  def ids_for(self, names):
+    """Return catalogue ids by normalized name for names, adding missing
+    entries in one statement"""
+    names = sorted({normalize_name(name) for name in names})
+    if not names:
+      return {}
+    table = connection.ops.quote_name(self.model._meta.db_table)
+    with connection.cursor() as cursor:
+      # Existing entries are read rather than updated on conflict, which
+      # would lock and rewrite rows shared by every user. Entries another
+      # transaction adds meanwhile are not in the snapshot of the
+      # statement, and are read by a second one.
+      cursor.execute(
+          f'WITH inserted AS (INSERT INTO {table} (name) '
+          f'SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING '
+          f'RETURNING name, id) '
+          f'SELECT name, id FROM inserted UNION ALL '
+          f'SELECT name, id FROM {table} WHERE name = ANY(%s)',
+          [names, names])
+      ids = dict(cursor.fetchall())
+      missing = [name for name in names if name not in ids]
+      if missing:
+        cursor.execute(
+            f'SELECT name, id FROM {table} WHERE name = ANY(%s)', [missing])
+        ids.update(cursor.fetchall())
+      return ids
+
+
+class CatalogueEntry(models.Model):
+  """Name shared by the tags or ingredients of all users"""
+  name = models.CharField(max_length=255, unique=True)
+
+  objects = CatalogueManager()
+
+  class Meta:
+    abstract = True
+
+  def __str__(self):
+    return self.name
+
+
+class CanonicalTag(CatalogueEntry):
+  """Catalogue entry that tags of any user refer to"""
+
+
+class CanonicalIngredient(CatalogueEntry):
+  """Catalogue entry that ingredients of any user refer to"""
+
+
+def link_canonical(instance, catalogue, kwargs):
+  """Point a tag or ingredient about to be saved at its catalogue entry"""
+  name = normalize_name(instance.name)
+  instance.canonical_id = catalogue.objects.ids_for([name])[name]
+  if kwargs.get('update_fields') is not None:
+    kwargs['update_fields'] = set(kwargs['update_fields']) | {'canonical'}
+
+
 class Tag(models.Model):
-  """Tag to be used for a recipe"""
+  """Tag to be used for a recipe, under the user's own name for a
+  catalogue entry"""
   name = models.CharField(max_length=255)
   user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+  canonical = models.ForeignKey(
+      CanonicalTag, null=True, on_delete=models.PROTECT,
+      related_name='aliases')
+
+  def save(self, *args, **kwargs):
+    link_canonical(self, CanonicalTag, kwargs)
+    super().save(*args, **kwargs)
 
   def __str__(self):
     return self.name
 
 
 class Ingredient(models.Model):
-  """Ingredient to be used for a recipe"""
+  """Ingredient to be used for a recipe, under the user's own name for a
+  catalogue entry"""
   name = models.CharField(max_length=255)
   user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+  canonical = models.ForeignKey(
+      CanonicalIngredient, null=True, on_delete=models.PROTECT,
+      related_name='aliases')
+
+  def save(self, *args, **kwargs):
+    link_canonical(self, CanonicalIngredient, kwargs)
+    super().save(*args, **kwargs)
 
   def __str__(self):
     return self.name
@@ -82,3 +174,130 @@ class Recipe(models.Model):
 
   def __str__(self):
     return self.title
+
+
+class IdempotencyKey(models.Model):
+  """Response stored for a client supplied Idempotency-Key"""
+  user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+  key = models.CharField(max_length=255)
+  method = models.CharField(max_length=10)
+  path = models.CharField(max_length=255)
+  status_code = models.PositiveSmallIntegerField(null=True)
+  response_body = models.TextField(blank=True)
+  created_at = models.DateTimeField()
+  expires_at = models.DateTimeField(db_index=True)
+
+  class Meta:
+    unique_together = ('user', 'key')
+
+  @property
+  def is_complete(self):
+    """Whether the original request has finished and can be replayed"""
+    return self.status_code is not None
+
+  def __str__(self):
+    return self.key
+
+
+class RecipeShare(models.Model):
+  """Recipes offered by a user to another, copied once the recipient
+  accepts them
+
+  Keeps the ids of the recipes rather than links to them: the recipes are
+  copied as they are on acceptance, and those deleted meanwhile are left
+  out.
+  """
+  PENDING = 'pending'
+  ACCEPTED = 'accepted'
+  DECLINED = 'declined'
+  STATUS_CHOICES = (
+      (PENDING, 'Pending'),
+      (ACCEPTED, 'Accepted'),
+      (DECLINED, 'Declined'),
+  )
+
+  sender = models.ForeignKey(
+      settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+      related_name='shares_sent')
+  recipient = models.ForeignKey(
+      settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+      related_name='shares_received')
+  recipe_ids = ArrayField(models.IntegerField())
+  status = models.CharField(
+      max_length=10, choices=STATUS_CHOICES, default=PENDING)
+  created_at = models.DateTimeField(auto_now_add=True)
+  answered_at = models.DateTimeField(null=True)
+
+  class Meta:
+    index_together = ('recipient', 'status')
+
+  def __str__(self):
+    return f'{self.sender_id} to {self.recipient_id} {self.status}'
+
+
+class SimilarRecipes(models.Model):
+  """Precomputed most similar recipes of a recipe
+
+  `neighbors` holds packed (recipe id, similarity) pairs, most similar
+  first, see recipe.similarity. The row is stale when the recipe changed
+  after the build started.
+  """
+  recipe = models.OneToOneField(
+      'Recipe', on_delete=models.CASCADE, primary_key=True)
+  neighbors = models.BinaryField()
+  built_at = models.DateTimeField()
+  changed_at = models.DateTimeField(null=True)
+
+  def __str__(self):
+    return str(self.recipe_id)
+
+
+class SlowQuery(models.Model):
+  """A database query that took longer than SLOW_QUERY_THRESHOLD_MS"""
+  sql = models.TextField()
+  params = models.TextField(blank=True)
+  duration_ms = models.FloatField()
+  route = models.CharField(max_length=255)
+  method = models.CharField(max_length=10)
+  user_id = models.IntegerField(null=True)
+  plan = models.TextField(blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    ordering = ('-id',)
+    verbose_name_plural = 'slow queries'
+
+  def __str__(self):
+    return f'{self.duration_ms:.0f}ms {self.route}'
+
+
+class UserDeletion(models.Model):
+  """Deletion of a user and their data, run in the background
+
+  Keeps the user id rather than a foreign key so that the progress stays
+  around after the user is gone. `updated_at` moves with every batch, so
+  running jobs that stop moving are picked up again.
+  """
+  PENDING = 'pending'
+  RUNNING = 'running'
+  DONE = 'done'
+  FAILED = 'failed'
+  STATUS_CHOICES = (
+      (PENDING, 'Pending'),
+      (RUNNING, 'Running'),
+      (DONE, 'Done'),
+      (FAILED, 'Failed'),
+  )
+
+  user_id = models.IntegerField(unique=True)
+  status = models.CharField(
+      max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+  rows_deleted = models.PositiveIntegerField(default=0)
+  files_deleted = models.PositiveIntegerField(default=0)
+  error = models.TextField(blank=True)
+  created_at = models.DateTimeField(auto_now_add=True)
+  updated_at = models.DateTimeField(auto_now=True)
+  finished_at = models.DateTimeField(null=True)
+
+  def __str__(self):
+    return f'{self.user_id} {self.status}'
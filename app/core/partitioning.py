@@ -0,0 +1,280 @@
+import re
+import time
+
+from django.db import connection, transaction
+
+from core.models import Ingredient, Recipe, Tag
+
+PARTITIONED_SUFFIX = '_partitioned'
+UNPARTITIONED_SUFFIX = '_unpartitioned'
+PROGRESS_TABLE = 'core_partition_progress'
+
+
+class PartitioningError(Exception):
+  """Raised when a step of the migration cannot run in the current state"""
+
+
+def tables():
+  """Return (table, partition key) of the tables to partition
+
+  Recipes, tags and ingredients are partitioned by user. The through
+  tables of the many to many fields have no user column, and Django does
+  not allow adding one without giving up `.add()` on the relations, so
+  they are partitioned by recipe.
+  """
+  return [
+      (Tag._meta.db_table, 'user_id'),
+      (Ingredient._meta.db_table, 'user_id'),
+      (Recipe._meta.db_table, 'user_id'),
+      (Recipe.tags.through._meta.db_table, 'recipe_id'),
+      (Recipe.ingredients.through._meta.db_table, 'recipe_id'),
+  ]
+
+
+def qn(name):
+  return connection.ops.quote_name(name)
+
+
+def relkind(cursor, table):
+  """Return the kind of a relation, 'p' for partitioned tables, or None"""
+  cursor.execute(
+      'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [table])
+  row = cursor.fetchone()
+  return row[0] if row else None
+
+
+def check_supported():
+  if connection.vendor != 'postgresql' or connection.pg_version < 110000:
+    raise PartitioningError('Hash partitioning needs PostgreSQL 11 or later')
+
+
+def constraint_statements(cursor, table, key):
+  """Return statements giving the partitioned copy of `table` its keys,
+  indexes and foreign keys
+
+  Unique constraints have to include the partition key. Foreign keys to
+  the other partitioned tables are left out as PostgreSQL cannot check
+  them; Django still cascades deletes itself.
+  """
+  partitioned = {name for name, _ in tables()}
+  new = qn(table + PARTITIONED_SUFFIX)
+  statements = []
+  constraints = connection.introspection.get_constraints(cursor, table)
+  for name, constraint in sorted(constraints.items()):
+    columns = constraint['columns']
+    if not columns or constraint['check']:
+      continue
+    if None in columns:
+      # Expression indexes, such as the ones on lower(name), are copied
+      # from their definition
+      cursor.execute('SELECT pg_get_indexdef(%s::regclass)', [name])
+      statements.append(re.sub(
+          r' INDEX \S+ ON \S+ ', f' INDEX ON {new} ', cursor.fetchone()[0],
+          count=1))
+      continue
+    if constraint['primary_key'] or constraint['unique']:
+      if key not in columns:
+        columns = columns + [key]
+      kind = 'PRIMARY KEY' if constraint['primary_key'] else 'UNIQUE'
+      statements.append(
+          f'ALTER TABLE {new} ADD {kind} ({", ".join(map(qn, columns))})')
+    elif constraint['foreign_key']:
+      target, target_column = constraint['foreign_key']
+      if target not in partitioned:
+        statements.append(
+            f'ALTER TABLE {new} ADD FOREIGN KEY ({qn(columns[0])}) '
+            f'REFERENCES {qn(target)} ({qn(target_column)}) '
+            f'DEFERRABLE INITIALLY DEFERRED')
+    elif constraint['index'] and constraint.get('type') in ('idx', 'btree'):
+      statements.append(
+          f'CREATE INDEX ON {new} ({", ".join(map(qn, columns))})')
+  return statements
+
+
+def mirror_statements(table, key):
+  """Return statements copying every later write of `table` to its
+  partitioned copy, until the tables are swapped
+  """
+  new = qn(table + PARTITIONED_SUFFIX)
+  function = qn(f'{table}_mirror')
+  return [
+      f'''CREATE FUNCTION {function}() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    DELETE FROM {new} WHERE id = OLD.id AND {qn(key)} = OLD.{qn(key)};
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO {new} SELECT NEW.* ON CONFLICT DO NOTHING;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql''',
+      f'CREATE TRIGGER {function} AFTER INSERT OR UPDATE OR DELETE '
+      f'ON {qn(table)} FOR EACH ROW EXECUTE PROCEDURE {function}()',
+  ]
+
+
+def prepare(partitions):
+  """Create the partitioned copies of the tables and start mirroring"""
+  check_supported()
+  with transaction.atomic(), connection.cursor() as cursor:
+    if relkind(cursor, PROGRESS_TABLE):
+      raise PartitioningError('A migration is already in progress')
+    cursor.execute(
+        f'CREATE TABLE {PROGRESS_TABLE} (table_name text PRIMARY KEY, '
+        f'last_id bigint NOT NULL DEFAULT 0, done boolean NOT NULL '
+        f'DEFAULT false)')
+
+    for table, key in tables():
+      if relkind(cursor, table) == 'p':
+        raise PartitioningError(f'{table} is partitioned already')
+      new = table + PARTITIONED_SUFFIX
+      # Defaults include the id sequence, which is kept by the copy
+      cursor.execute(
+          f'CREATE TABLE {qn(new)} (LIKE {qn(table)} INCLUDING DEFAULTS) '
+          f'PARTITION BY HASH ({qn(key)})')
+      for remainder in range(partitions):
+        cursor.execute(
+            f'CREATE TABLE {qn(f"{table}_part_{remainder}")} '
+            f'PARTITION OF {qn(new)} FOR VALUES WITH '
+            f'(MODULUS {partitions}, REMAINDER {remainder})')
+      for statement in constraint_statements(cursor, table, key):
+        cursor.execute(statement)
+      for statement in mirror_statements(table, key):
+        cursor.execute(statement)
+      cursor.execute(
+          f'INSERT INTO {PROGRESS_TABLE} (table_name) VALUES (%s)', [table])
+
+
+def copy(batch_size, pause=0):
+  """Copy the rows that existed before mirroring started, in id order
+
+  Every batch is a transaction of its own and locks its rows, so that
+  concurrent updates and deletes are mirrored after the batch lands.
+  Progress is kept so that an interrupted copy resumes where it stopped.
+  Yields (table, rows copied, last id) after every batch.
+  """
+  check_supported()
+  for table, _ in tables():
+    new = qn(table + PARTITIONED_SUFFIX)
+    while True:
+      with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT last_id, done FROM {PROGRESS_TABLE} '
+            f'WHERE table_name = %s FOR UPDATE', [table])
+        row = cursor.fetchone()
+        if row is None:
+          raise PartitioningError('Run prepare first')
+        last_id, done = row
+        if done:
+          break
+
+        cursor.execute(
+            f'WITH batch AS (SELECT * FROM {qn(table)} WHERE id > %s '
+            f'ORDER BY id LIMIT %s FOR SHARE), '
+            f'copied AS (INSERT INTO {new} SELECT * FROM batch '
+            f'ON CONFLICT DO NOTHING) '
+            f'SELECT count(*), max(id) FROM batch', [last_id, batch_size])
+        count, max_id = cursor.fetchone()
+        cursor.execute(
+            f'UPDATE {PROGRESS_TABLE} SET last_id = %s, done = %s '
+            f'WHERE table_name = %s',
+            [max_id or last_id, count == 0, table])
+
+      if count == 0:
+        break
+      yield table, count, max_id
+      time.sleep(pause)
+
+
+def swap():
+  """Put the partitioned tables in place of the old ones
+
+  Foreign keys referencing the old tables are dropped, since PostgreSQL
+  cannot have them reference a partitioned table on its own. The old
+  tables are kept under a new name until drop_old() is called.
+  """
+  check_supported()
+  names = [table for table, _ in tables()]
+  with transaction.atomic(), connection.cursor() as cursor:
+    if not relkind(cursor, PROGRESS_TABLE):
+      raise PartitioningError('Run prepare first')
+    cursor.execute(
+        f'SELECT table_name FROM {PROGRESS_TABLE} WHERE NOT done')
+    unfinished = [row[0] for row in cursor.fetchall()]
+    if unfinished:
+      raise PartitioningError(
+          f'Copy has not finished for {", ".join(unfinished)}')
+
+    cursor.execute(
+        f'LOCK TABLE {", ".join(map(qn, names))} IN ACCESS EXCLUSIVE MODE')
+    cursor.execute(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = ANY(%s::regclass[])", [names])
+    for relation, constraint in cursor.fetchall():
+      cursor.execute(
+          f'ALTER TABLE {relation} DROP CONSTRAINT {qn(constraint)}')
+
+    for table, _ in tables():
+      cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+      sequence = cursor.fetchone()[0]
+      cursor.execute(f'DROP TRIGGER {qn(table + "_mirror")} ON {qn(table)}')
+      cursor.execute(f'DROP FUNCTION {qn(table + "_mirror")}()')
+      cursor.execute(
+          f'ALTER TABLE {qn(table)} '
+          f'RENAME TO {qn(table + UNPARTITIONED_SUFFIX)}')
+      cursor.execute(
+          f'ALTER TABLE {qn(table + PARTITIONED_SUFFIX)} '
+          f'RENAME TO {qn(table)}')
+      if sequence:
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+
+    cursor.execute(f'DROP TABLE {PROGRESS_TABLE}')
+
+
+def drop_old():
+  """Drop the unpartitioned tables left by swap()"""
+  with connection.cursor() as cursor:
+    old = [table + UNPARTITIONED_SUFFIX for table, _ in tables()]
+    cursor.execute(f'DROP TABLE IF EXISTS {", ".join(map(qn, old))}')
+
+
+def abort():
+  """Undo prepare(), dropping the partitioned copies"""
+  with transaction.atomic(), connection.cursor() as cursor:
+    for table, _ in tables():
+      if relkind(cursor, table + PARTITIONED_SUFFIX):
+        cursor.execute(
+            f'DROP TRIGGER IF EXISTS {qn(table + "_mirror")} ON {qn(table)}')
+        cursor.execute(f'DROP FUNCTION IF EXISTS {qn(table + "_mirror")}()')
+        cursor.execute(f'DROP TABLE {qn(table + PARTITIONED_SUFFIX)}')
+    cursor.execute(f'DROP TABLE IF EXISTS {PROGRESS_TABLE}')
+
+
+def status():
+  """Return (table, state, partitions, rows copied up to id) per table"""
+  result = []
+  with connection.cursor() as cursor:
+    in_progress = relkind(cursor, PROGRESS_TABLE) is not None
+    for table, _ in tables():
+      cursor.execute(
+          'SELECT count(*) FROM pg_inherits WHERE inhparent = '
+          'to_regclass(%s)', [table])
+      partitions = cursor.fetchone()[0]
+      last_id = None
+      if relkind(cursor, table) == 'p':
+        state = 'partitioned'
+      elif in_progress:
+        cursor.execute(
+            f'SELECT last_id, done FROM {PROGRESS_TABLE} '
+            f'WHERE table_name = %s', [table])
+        last_id, done = cursor.fetchone()
+        state = 'copied' if done else 'copying'
+        cursor.execute(
+            'SELECT count(*) FROM pg_inherits WHERE inhparent = '
+            'to_regclass(%s)', [table + PARTITIONED_SUFFIX])
+        partitions = cursor.fetchone()[0]
+      else:
+        state = 'unpartitioned'
+      result.append((table, state, partitions, last_id))
+  return result
@@ -0,0 +1,64 @@
+import glob
+import itertools
+import json
+import os
+import random
+import re
+import time
+
+from django.conf import settings
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+_sequence = itertools.count()
+
+
+def should_profile(request):
+  """Whether a request is asked for with the profiling token or sampled"""
+  token = settings.PROFILING_TOKEN
+  if token and request.META.get(PROFILE_HEADER) == token:
+    return True
+  return random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def profile_paths(directory=None):
+  """Return the stored profiles, oldest first"""
+  directory = directory or settings.PROFILING_DIR
+  return sorted(glob.glob(os.path.join(directory, '*.prof')),
+                key=os.path.getmtime)
+
+
+def rotate(directory):
+  """Delete the oldest profiles beyond PROFILING_MAX_FILES"""
+  paths = profile_paths(directory)
+  for path in paths[:max(len(paths) - settings.PROFILING_MAX_FILES, 0)]:
+    for stale in (path, path[:-len('.prof')] + '.json'):
+      try:
+        os.remove(stale)
+      except FileNotFoundError:
+        pass
+
+
+def save(profiler, info):
+  """Write a profile and its request details, returning the profile name"""
+  directory = settings.PROFILING_DIR
+  os.makedirs(directory, exist_ok=True)
+  route = re.sub(r'[^\w.-]+', '_', info['route'])
+  name = (f'{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-'
+          f'{next(_sequence)}-{route}')
+
+  profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+  with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+    json.dump(info, f)
+  rotate(directory)
+
+  return name
+
+
+def load_info(path):
+  """Return the request details stored next to a profile"""
+  try:
+    with open(path[:-len('.prof')] + '.json') as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
@@ -0,0 +1,86 @@
+import json
+import os
+import random
+import threading
+
+from django.conf import settings
+
+REDACTED = '[redacted]'
+
+_lock = threading.Lock()
+_files = {}
+
+
+def should_record():
+  """Whether the current request is sampled for recording"""
+  return (bool(settings.RECORDING_DIR) and
+          random.random() < settings.RECORDING_SAMPLE_RATE)
+
+
+def request_body(request):
+  """Return the decoded JSON body of a request
+
+  Returns (body, omitted) where `omitted` tells that the request had a body
+  which is not JSON, such as an image upload, or is larger than
+  RECORDING_MAX_BODY_SIZE, and was left out. Such bodies are never read,
+  so that uploads are neither buffered in memory nor held against
+  DATA_UPLOAD_MAX_MEMORY_SIZE here.
+  """
+  try:
+    length = int(request.META.get('CONTENT_LENGTH') or 0)
+  except ValueError:
+    length = 0
+  if not length:
+    return None, False
+  if (request.content_type != 'application/json' or
+          length > settings.RECORDING_MAX_BODY_SIZE):
+    return None, True
+  try:
+    return redact(json.loads(request.body)), False
+  except ValueError:
+    return None, True
+
+
+def redact(data):
+  """Blank out the values of RECORDING_REDACT_FIELDS anywhere in `data`"""
+  if isinstance(data, dict):
+    return {key: REDACTED if key in settings.RECORDING_REDACT_FIELDS
+            else redact(value) for key, value in data.items()}
+  if isinstance(data, list):
+    return [redact(value) for value in data]
+  return data
+
+
+def _file():
+  """Return the log file of this process, opening it after a fork"""
+  pid = os.getpid()
+  directory = settings.RECORDING_DIR
+  f = _files.get((pid, directory))
+  if f is None:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'requests-{pid}.ndjson')
+    f = _files[pid, directory] = open(path, 'a', buffering=1)
+  return f
+
+
+def write(record):
+  """Append a request to the log of this process as one JSON line"""
+  line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+  with _lock:
+    _file().write(line)
+
+
+def load(paths):
+  """Return the requests recorded in the given files, oldest first"""
+  records = []
+  for path in paths:
+    with open(path) as f:
+      for number, line in enumerate(f, 1):
+        if not line.strip():
+          continue
+        try:
+          records.append(json.loads(line))
+        except ValueError:
+          raise ValueError(f'{path}:{number}: not a JSON line')
+  records.sort(key=lambda record: record.get('ts', 0))
+  return records
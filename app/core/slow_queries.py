@@ -0,0 +1,75 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from core.models import SlowQuery
+
+
+class SlowQueryRecorder:
+  """Database execute wrapper keeping queries slower than a threshold"""
+
+  def __init__(self, threshold_ms):
+    self.threshold = threshold_ms / 1000
+    self.queries = []
+
+  def __call__(self, execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+      return execute(sql, params, many, context)
+    finally:
+      duration = time.perf_counter() - start
+      if duration >= self.threshold:
+        self.queries.append((sql, params, many, duration))
+
+
+# Statements EXPLAIN can plan
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def explain(sql, params, analyze=False):
+  """Return the EXPLAIN output of a query
+
+  The plan is estimated unless `analyze` is set, in which case SELECTs
+  are run again under EXPLAIN (ANALYZE, BUFFERS) for their actual timings
+  and buffer counts. Either way the explain runs in a savepoint that is
+  rolled back, and other statements are only estimated, so nothing the
+  query does is kept.
+  """
+  if connection.vendor != 'postgresql':
+    return ''
+  statement = sql.lstrip().upper()
+  if not statement.startswith(EXPLAINABLE):
+    return ''
+  options = '(ANALYZE, BUFFERS) ' if analyze and statement.startswith(
+      'SELECT') else ''
+
+  try:
+    with transaction.atomic(), connection.cursor() as cursor:
+      cursor.execute(f'EXPLAIN {options}{sql}', params)
+      plan = '\n'.join(row[0] for row in cursor.fetchall())
+      transaction.set_rollback(True)
+      return plan
+  except DatabaseError as exc:
+    return f'EXPLAIN failed: {exc}'
+
+
+def record(queries, route, method, user_id):
+  """Store slow queries, keeping only the latest SLOW_QUERY_BUFFER_SIZE"""
+  for sql, params, many, duration in queries:
+    plan = ''
+    if not many and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE:
+      plan = explain(sql, params, settings.SLOW_QUERY_EXPLAIN_ANALYZE)
+
+    entry = SlowQuery.objects.create(
+        sql=sql,
+        params=repr(params)[:10000],
+        duration_ms=duration * 1000,
+        route=route,
+        method=method,
+        user_id=user_id,
+        plan=plan,
+    )
+    SlowQuery.objects.filter(
+        id__lte=entry.id - settings.SLOW_QUERY_BUFFER_SIZE).delete()
@@ -0,0 +1,63 @@
+import collections
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from core.loadtest import ServerProcess
+
+# What a server loads before its first request: the settings, apps and
+# models, then every URL pattern and so every view
+BOOT = ('import app.wsgi; '
+        'from django.urls import get_resolver; '
+        'get_resolver().url_patterns')
+
+Import = collections.namedtuple('Import', 'module own total depth')
+
+
+def profile_imports(api_only=False):
+  """Load the application as a server would in a new interpreter, returning
+  its imports, see core.importprofile, and the seconds the interpreter ran
+  """
+  env = dict(os.environ, API_ONLY='1' if api_only else '0')
+  start = time.monotonic()
+  result = subprocess.run(
+      [sys.executable, '-m', 'core.importprofile', BOOT],
+      cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE,
+      stderr=subprocess.PIPE, universal_newlines=True)
+  elapsed = time.monotonic() - start
+  if result.returncode:
+    raise CommandError(f'Loading the application failed:\n{result.stderr}')
+  records = json.loads(result.stdout.splitlines()[-1])
+  return [Import(*record) for record in records], elapsed
+
+
+def by_package(imports):
+  """Return the own import time of every top level package"""
+  totals = collections.Counter()
+  for imported in imports:
+    totals[imported.module.split('.')[0]] += imported.own
+  return totals
+
+
+def first_response(port, path, api_only=False, serve_args=()):
+  """Start a server with one worker and return the seconds until it
+  answered a request to `path`
+
+  Any response counts, an error status included, as it went through the
+  whole stack.
+  """
+  start = time.monotonic()
+  with ServerProcess(port, ['--workers', '1', *serve_args],
+                     {'API_ONLY': '1' if api_only else '0'}) as url:
+    try:
+      urllib.request.urlopen(url + path, timeout=60).close()
+    except urllib.error.HTTPError:
+      pass
+    return time.monotonic() - start
@@ -0,0 +1,69 @@
+import itertools
+
+from django.db import connections, transaction
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.renderers import JSONRenderer
+
+
+def row_fields(serializer, sources=None):
+  """Return the readable fields of `serializer` with the row key holding
+  the value of each, which is the field's source unless `sources` maps
+  its name to another key"""
+  sources = sources or {}
+  return [(name, sources.get(name, field.source), field)
+          for name, field in serializer.fields.items()
+          if not field.write_only]
+
+
+def represent(row, fields):
+  """Return the representation of a row as `serializer.data` would give
+  it for the object the row was read from
+
+  Related fields hold primary keys already, which represent themselves.
+  """
+  data = {}
+  for name, key, field in fields:
+    value = row[key]
+    if value is None or isinstance(field, (ManyRelatedField, RelatedField)):
+      data[name] = value
+    else:
+      data[name] = field.to_representation(value)
+  return data
+
+
+def json_array(rows, serializer, chunk_size, sources=None,
+               idle_timeout=None):
+  """Yield the JSON array of the representations of `rows` in pieces
+
+  `rows` is a values() queryset read from a server-side cursor
+  `chunk_size` rows at a time, holding a key per field of `serializer`,
+  see row_fields, with primary keys for related fields. Every chunk is
+  represented and rendered before the next one is read, so memory does not
+  grow with the number of rows, and no model instances are built.
+
+  The cursor's transaction, and the snapshot holding back vacuum, stay
+  open until the client has read the last chunk. With `idle_timeout`,
+  PostgreSQL ends the connection, and so the response, when the client
+  takes longer than that many seconds to read a chunk.
+  """
+  fields = row_fields(serializer, sources)
+  renderer = JSONRenderer()
+  first = True
+  # Inside a transaction the cursor is not held past it, which would make
+  # PostgreSQL materialize the whole result before the first row
+  with transaction.atomic(using=rows.db):
+    if idle_timeout:
+      with connections[rows.db].cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('idle_in_transaction_session_timeout', "
+            "%s, true)", [str(int(idle_timeout * 1000))])
+    rows = rows.iterator(chunk_size=chunk_size)
+    while True:
+      chunk = list(itertools.islice(rows, chunk_size))
+      if not chunk:
+        break
+      data = [represent(row, fields) for row in chunk]
+      # Render the chunk as an array and drop its brackets
+      yield (b'[' if first else b',') + renderer.render(data)[1:-1]
+      first = False
+  yield b'[]' if first else b']'
@@ -0,0 +1,19 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+  """Runs the tests with throttling off
+
+  Buckets outlive the tests and would be shared between them, so tests of
+  throttling turn it on with a store of their own.
+  """
+
+  def setup_test_environment(self, **kwargs):
+    super().setup_test_environment(**kwargs)
+    self.settings = override_settings(THROTTLE_ENABLED=False)
+    self.settings.enable()
+
+  def teardown_test_environment(self, **kwargs):
+    self.settings.disable()
+    super().teardown_test_environment(**kwargs)
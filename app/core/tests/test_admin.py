@@ -1,7 +1,12 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 
+from core.admin import EstimatedCountPaginator
+from core.models import Recipe, Tag
+
 
 class AdminSiteTests(TestCase):
 
@@ -39,3 +44,53 @@ class AdminSiteTests(TestCase):
     res = self.client.get(url)
 
     self.assertEqual(res.status_code, 200)
+
+  def test_changelists(self):
+    """Test that the list of every registered model loads, with a query
+    count that does not grow with its rows"""
+    for i in range(3):
+      user = get_user_model().objects.create_user(
+          email=f'cook{i}@vinson.sg', password='password123')
+      tag = Tag.objects.create(user=user, name=f'Tag {i}')
+      recipe = Recipe.objects.create(
+          user=user, title=f'Recipe {i}', time_minutes=5, price=1)
+      recipe.tags.add(tag)
+
+    for model in admin.site._registry:
+      url = reverse(
+          f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+      with self.subTest(model=model.__name__):
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+
+    with self.assertNumQueries(5):
+      self.client.get(reverse('admin:core_recipe_changelist'))
+
+  def test_search_prefix(self):
+    """Test that searches match the start of values, ignoring case"""
+    other = get_user_model().objects.create_user(
+        email='other.user@vinson.sg', password='password123')
+    url = reverse('admin:core_user_changelist')
+
+    res = self.client.get(url, {'q': 'USER@'})
+    self.assertContains(res, self.user.email)
+    self.assertNotContains(res, other.email)
+
+    res = self.client.get(url, {'q': 'vinson'})
+    self.assertNotContains(res, self.user.email)
+
+  @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+  def test_estimated_count(self):
+    """Test that unfiltered lists of large tables are counted from the
+    table statistics"""
+    for name in ('Vegan', 'Dessert'):
+      Tag.objects.create(user=self.user, name=name)
+    with connection.cursor() as cursor:
+      cursor.execute('ANALYZE core_tag')
+    Tag.objects.create(user=self.user, name='Dinner')
+
+    self.assertEqual(
+        EstimatedCountPaginator(Tag.objects.order_by('id'), 10).count, 2)
+    self.assertEqual(
+        EstimatedCountPaginator(
+            Tag.objects.filter(name='Vegan').order_by('id'), 10).count, 1)
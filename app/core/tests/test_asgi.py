@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core.asgi import ASGIHandler
+from core.models import Tag
+
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def call(application, method, path, headers=(), body=b''):
+  """Send a request to an ASGI application, returning the response start
+  message and the body"""
+  scope = {
+      'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+      'headers': [(name.encode(), value.encode()) for name, value in headers],
+      'server': ('testserver', 80),
+  }
+  requests = [{'type': 'http.request', 'body': body[:5],
+               'more_body': True},
+              {'type': 'http.request', 'body': body[5:]}]
+  messages = []
+
+  async def receive():
+    return requests.pop(0)
+
+  async def send(message):
+    messages.append(message)
+
+  loop = asyncio.new_event_loop()
+  try:
+    loop.run_until_complete(application(scope, receive, send))
+  finally:
+    loop.close()
+  return messages[0], b''.join(m.get('body', b'') for m in messages[1:])
+
+
+class ASGIHandlerTests(TransactionTestCase):
+  """Tests serving the API through ASGI"""
+
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password', name='Vinson')
+    self.token = Token.objects.create(user=self.user)
+    self.application = ASGIHandler()
+
+  def tearDown(self):
+    self.application.executor.shutdown()
+
+  def test_read(self):
+    """Test retrieving the user over ASGI"""
+    start, body = call(
+        self.application, 'GET', ME_URL,
+        [('Authorization', f'Token {self.token.key}')])
+
+    self.assertEqual(start['status'], 200)
+    self.assertIn((b'Content-Type', b'application/json'), start['headers'])
+    self.assertEqual(json.loads(body)['email'], 'vinson@vinson.sg')
+
+  def test_write(self):
+    """Test creating a tag from a body sent in several messages"""
+    start, _ = call(
+        self.application, 'POST', TAGS_URL,
+        [('Authorization', f'Token {self.token.key}'),
+         ('Content-Type', 'application/json')],
+        json.dumps({'name': 'Vegan'}).encode())
+
+    self.assertEqual(start['status'], 201)
+    self.assertTrue(Tag.objects.filter(user=self.user, name='Vegan').exists())
+
+  def test_unauthorized(self):
+    """Test that authentication is required as over WSGI"""
+    start, _ = call(self.application, 'GET', TAGS_URL)
+
+    self.assertEqual(start['status'], 401)
@@ -1,9 +1,17 @@
-from unittest.mock import patch
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import Mock, patch
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from core.management.commands import serve
+from core.models import Recipe
+
 
 class CommandTests(TestCase):
 
@@ -21,3 +29,66 @@ class CommandTests(TestCase):
       gi.side_effect = [OperationalError] * 5 + [True]
       call_command('wait_for_db')
       self.assertEqual(gi.call_count, 6)
+
+  def test_benchmark(self):
+    """Test benchmarking routes and comparing against a baseline"""
+    with tempfile.TemporaryDirectory() as tmp:
+      baseline = os.path.join(tmp, 'baseline.json')
+      out = StringIO()
+      call_command('benchmark', '--scales', '1', '--iterations', '1',
+                   '--routes', 'recipe-list,user-token',
+                   '--save-baseline', baseline, stdout=out)
+
+      with open(baseline) as f:
+        results = json.load(f)
+      self.assertEqual(set(results['1']), {'recipe-list', 'user-token'})
+      self.assertEqual(results['1']['user-token']['statuses'], [200])
+      self.assertFalse(Recipe.objects.exists())
+
+      results['1']['recipe-list']['queries'] = 0
+      with open(baseline, 'w') as f:
+        json.dump(results, f)
+      with self.assertRaises(CommandError):
+        call_command('benchmark', '--scales', '1', '--iterations', '1',
+                     '--routes', 'recipe-list', '--baseline', baseline,
+                     stdout=out)
+
+  @patch('core.management.commands.serve.Application')
+  def test_serve(self, application):
+    """Test serving the application with preloaded, recycled workers"""
+    call_command('serve', '--workers', '3', '--threads', '4',
+                 '--max-requests', '500')
+
+    config = application.call_args[0][0]
+    self.assertEqual(config['workers'], 3)
+    self.assertEqual(config['threads'], 4)
+    self.assertEqual(config['max_requests'], 500)
+    self.assertEqual(config['max_requests_jitter'], 50)
+    self.assertTrue(config['preload_app'])
+    self.assertIn('post_worker_init', config)
+    application.return_value.run.assert_called_once_with()
+
+  @patch('core.lazy.load_all')
+  def test_serve_preloads_lazy_modules(self, load_all):
+    """Test that a preloading master imports the lazily loaded modules
+    for its workers to share, and that workers loading the application
+    themselves leave them to first use"""
+    serve.Application({'preload_app': False}).load()
+    load_all.assert_not_called()
+
+    serve.Application({'preload_app': True}).load()
+    load_all.assert_called_once_with()
+
+  @patch('recipe.warmup.warm_worker')
+  @patch('gc.freeze')
+  def test_serve_warms_up_once(self, _, warm_worker):
+    """Test that only the workers a server starts with warm up, not the
+    ones replacing recycled workers"""
+    server = Mock(num_workers=2)
+    serve.expect_warm_ups(server)
+    for _ in range(3):
+      worker = Mock()
+      serve.pre_fork(server, worker)
+      serve.post_worker_init(worker)
+
+    self.assertEqual(warm_worker.call_count, 2)
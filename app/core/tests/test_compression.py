@@ -0,0 +1,82 @@
+import gzip
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.http import HttpResponse
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import compression
+from core.middleware import CompressionMiddleware
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def compressed_response(content, content_type='application/json', **headers):
+  """Return `content` as passed through the compression middleware"""
+  request = RequestFactory().get('/', **headers)
+  middleware = CompressionMiddleware(
+      lambda request: HttpResponse(content, content_type=content_type))
+  return middleware(request)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionTests(TransactionTestCase):
+  """Tests compression of responses"""
+
+  def test_compress_large_response(self):
+    """Tests that large responses are gzipped for clients accepting it"""
+    content = json.dumps([{'title': 'Recipe'}] * 50).encode()
+    res = compressed_response(content, HTTP_ACCEPT_ENCODING='gzip')
+
+    self.assertEqual(res['Content-Encoding'], 'gzip')
+    self.assertEqual(res['Vary'], 'Accept-Encoding')
+    self.assertEqual(int(res['Content-Length']), len(res.content))
+    self.assertEqual(gzip.decompress(res.content), content)
+
+  def test_brotli_preferred(self):
+    """Tests that brotli is used when both encodings are accepted"""
+    if compression.brotli is None:
+      self.skipTest('brotli is not installed')
+    content = json.dumps([{'title': 'Recipe'}] * 50).encode()
+    res = compressed_response(content, HTTP_ACCEPT_ENCODING='gzip, br')
+
+    self.assertEqual(res['Content-Encoding'], 'br')
+    self.assertEqual(compression.brotli.decompress(res.content), content)
+
+  def test_not_compressed(self):
+    """Tests that small responses, images and refused encodings are sent
+    as they are"""
+    content = b'x' * 1000
+    for res in (
+        compressed_response(b'{}', HTTP_ACCEPT_ENCODING='gzip'),
+        compressed_response(content, 'image/png', HTTP_ACCEPT_ENCODING='gzip'),
+        compressed_response(content, HTTP_ACCEPT_ENCODING='gzip;q=0'),
+        compressed_response(content),
+    ):
+      self.assertFalse(res.has_header('Content-Encoding'))
+
+  @override_settings(SHARED_CACHE=True)
+  def test_cached_list_variants(self):
+    """Tests that cached lists are served with their compressed variant"""
+    user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    client = APIClient()
+    client.force_authenticate(user)
+    for i in range(5):
+      Recipe.objects.create(
+          user=user, title=f'Recipe {i}', time_minutes=10, price=5)
+
+    plain = client.get(RECIPES_URL)
+    cached = client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+    self.assertFalse(hasattr(cached, 'data'))
+    self.assertEqual(cached['Content-Encoding'], 'gzip')
+    self.assertEqual(gzip.decompress(cached.content), plain.content)
+
+    Recipe.objects.create(user=user, title='New', time_minutes=10, price=5)
+    res = client.get(RECIPES_URL)
+    self.assertEqual(len(res.data), 6)
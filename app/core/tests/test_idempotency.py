@@ -0,0 +1,116 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.idempotency import claim_key
+from core.models import IdempotencyKey, Recipe, Tag
+
+TAGS_URL = reverse('recipe:tag-list')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class IdempotencyTests(TestCase):
+  """Tests retrying POST requests with an Idempotency-Key"""
+
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  def test_retry_replays_response(self):
+    """Tests that a retried create does not create a second row"""
+    payload = {'title': 'Steak', 'time_minutes': 10, 'price': 5.00}
+
+    res_1 = self.client.post(
+        RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='abc')
+    res_2 = self.client.post(
+        RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='abc')
+
+    self.assertEqual(res_1.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(res_2.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(res_1.data, res_2.data)
+    self.assertEqual(res_2['Idempotent-Replayed'], 'true')
+    self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+  def test_requests_without_key_are_not_deduplicated(self):
+    """Tests that requests without a key behave as before"""
+    self.client.post(TAGS_URL, {'name': 'Vegan'})
+    res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+    self.assertFalse(IdempotencyKey.objects.exists())
+
+  def test_keys_are_scoped_to_user(self):
+    """Tests that the same key from another user is a new request"""
+    other = get_user_model().objects.create_user(
+        email='another@vinson.sg', password='password')
+    other_client = APIClient()
+    other_client.force_authenticate(other)
+
+    self.client.post(TAGS_URL, {'name': 'Vegan'}, HTTP_IDEMPOTENCY_KEY='k')
+    other_client.post(TAGS_URL, {'name': 'Vegan'}, HTTP_IDEMPOTENCY_KEY='k')
+
+    self.assertEqual(Tag.objects.count(), 2)
+
+  def test_key_reused_for_other_request(self):
+    """Tests that reusing a key on another endpoint is rejected"""
+    self.client.post(TAGS_URL, {'name': 'Vegan'}, HTTP_IDEMPOTENCY_KEY='k')
+    res = self.client.post(
+        RECIPES_URL, {'title': 'Steak', 'time_minutes': 1, 'price': 1},
+        HTTP_IDEMPOTENCY_KEY='k')
+
+    self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+    self.assertFalse(Recipe.objects.exists())
+
+  def test_in_flight_request_conflicts(self):
+    """Tests that a duplicate of an unfinished request is not executed"""
+    claim_key(self.user, 'k', 'POST', TAGS_URL)
+
+    res = self.client.post(
+        TAGS_URL, {'name': 'Vegan'}, HTTP_IDEMPOTENCY_KEY='k')
+
+    self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+    self.assertIn('Retry-After', res)
+    self.assertFalse(Tag.objects.exists())
+
+  def test_stale_lock_is_taken_over(self):
+    """Tests that a key held by a dead request can be claimed again"""
+    record, claimed = claim_key(self.user, 'k', 'POST', TAGS_URL)
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        created_at=timezone.now() - timedelta(hours=1))
+
+    record, claimed = claim_key(self.user, 'k', 'POST', TAGS_URL)
+
+    self.assertTrue(claimed)
+
+  def test_failed_validation_is_stored(self):
+    """Tests that client errors are replayed like any other response"""
+    res_1 = self.client.post(TAGS_URL, {}, HTTP_IDEMPOTENCY_KEY='k')
+    res_2 = self.client.post(TAGS_URL, {}, HTTP_IDEMPOTENCY_KEY='k')
+
+    self.assertEqual(res_1.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(res_2.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(res_2['Idempotent-Replayed'], 'true')
+
+  def test_clear_expired_keys(self):
+    """Tests that the cleanup command only removes expired keys"""
+    claim_key(self.user, 'fresh', 'POST', TAGS_URL)
+    expired, _ = claim_key(self.user, 'expired', 'POST', TAGS_URL)
+    IdempotencyKey.objects.filter(pk=expired.pk).update(
+        expires_at=timezone.now() - timedelta(seconds=1))
+
+    call_command('clear_idempotency_keys', stdout=StringIO())
+
+    self.assertEqual(
+        list(IdempotencyKey.objects.values_list('key', flat=True)),
+        ['fresh'])
@@ -0,0 +1,106 @@
+import glob
+import json
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class MetricsTests(TestCase):
+  """Tests request metrics and the metrics endpoint"""
+
+  def setUp(self):
+    metrics.registry = metrics.Registry()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  @override_settings(SHARED_CACHE=True)
+  def test_request_metrics(self):
+    """Tests that requests are recorded per route"""
+    self.client.get(TAGS_URL)
+    self.client.get(TAGS_URL)
+
+    res = self.client.get(METRICS_URL)
+    content = res.content.decode()
+
+    self.assertEqual(res.status_code, 200)
+    self.assertIn(
+        'http_requests_total{method="GET",route="recipe:tag-list",'
+        'status="200"} 2', content)
+    self.assertIn(
+        'http_request_duration_seconds_count{route="recipe:tag-list"} 2',
+        content)
+    self.assertIn(
+        'http_request_duration_seconds_bucket{route="recipe:tag-list",'
+        'le="+Inf"} 2', content)
+    # The second list is served from the cache without querying
+    self.assertIn(
+        'http_request_db_queries_total{route="recipe:tag-list"} 1', content)
+    self.assertIn(
+        'cache_requests_total{cache="tag_list",result="hit"} 1', content)
+
+  def test_metrics_of_all_processes(self):
+    """Tests that metrics files written by other workers are added up"""
+    with tempfile.TemporaryDirectory() as metrics_dir:
+      other = metrics.Registry()
+      other.inc('http_requests_total', metrics.labels(
+          method='GET', route='recipe:tag-list', status=200), 5)
+      with open(os.path.join(metrics_dir, 'metrics-1.json'), 'w') as f:
+        json.dump(other.snapshot(), f)
+
+      with override_settings(METRICS_DIR=metrics_dir):
+        self.client.get(TAGS_URL)
+        content = self.client.get(METRICS_URL).content.decode()
+
+    self.assertIn(
+        'http_requests_total{method="GET",route="recipe:tag-list",'
+        'status="200"} 6', content)
+
+  def test_archive_exited_processes(self):
+    """Tests that metrics of exited workers are kept in one archive"""
+    with tempfile.TemporaryDirectory() as metrics_dir:
+      for pid in (1, 2):
+        other = metrics.Registry()
+        other.inc('http_requests_total', metrics.labels(
+            method='GET', route='recipe:tag-list', status=200), pid)
+        other.observe('http_request_duration_seconds',
+                      metrics.labels(route='recipe:tag-list'), 0.2)
+        with open(os.path.join(metrics_dir, f'metrics-{pid}.json'),
+                  'w') as f:
+          json.dump(other.snapshot(), f)
+
+      with override_settings(METRICS_DIR=metrics_dir):
+        metrics.archive(1)
+        metrics.archive(2)
+        metrics.archive(3)
+        counters, histograms = metrics.collect()
+        files = sorted(glob.glob(os.path.join(metrics_dir, '*.json')))
+
+    self.assertEqual(
+        [os.path.basename(path) for path in files],
+        [f'metrics-{os.getpid()}.json', metrics.ARCHIVE_FILE])
+    self.assertEqual(counters[('http_requests_total', metrics.labels(
+        method='GET', route='recipe:tag-list', status=200))], 3)
+    self.assertEqual(histograms[('http_request_duration_seconds',
+                                 metrics.labels(route='recipe:tag-list'))][2],
+                     2)
+
+  @override_settings(METRICS_TOKEN='secret')
+  def test_metrics_token(self):
+    """Tests that a configured token is required to read metrics"""
+    res = self.client.get(METRICS_URL)
+    self.assertEqual(res.status_code, 403)
+
+    res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+    self.assertEqual(res.status_code, 200)
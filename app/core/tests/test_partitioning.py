@@ -0,0 +1,126 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import TransactionTestCase
+
+from core import partitioning
+from core.models import Ingredient, Recipe, Tag
+from recipe import catalogue
+
+
+def count(table):
+  with connection.cursor() as cursor:
+    cursor.execute(f'SELECT count(*) FROM {partitioning.qn(table)}')
+    return cursor.fetchone()[0]
+
+
+class PartitioningTests(TransactionTestCase):
+  """Tests moving recipe data to hash partitioned tables"""
+
+  def setUp(self):
+    if connection.vendor != 'postgresql' or connection.pg_version < 110000:
+      self.skipTest('Hash partitioning needs PostgreSQL 11 or later')
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    for i in range(5):
+      recipe = Recipe.objects.create(
+          user=self.user, title=f'Recipe {i}', time_minutes=10, price=5)
+      recipe.tags.add(Tag.objects.create(user=self.user, name=f'Tag {i}'))
+    self.addCleanup(partitioning.abort)
+
+  def test_online_migration(self):
+    """Test that rows copied in batches and rows written meanwhile all end
+    up in the partitioned tables, which the ORM then uses"""
+    out = StringIO()
+    call_command('partition_recipes', 'prepare', '--partitions', '4',
+                 stdout=out)
+    Recipe.objects.filter(title='Recipe 0').update(title='Renamed')
+    Recipe.objects.filter(title='Recipe 1').delete()
+    Ingredient.objects.create(user=self.user, name='Salt')
+
+    with self.assertRaises(CommandError):
+      call_command('partition_recipes', 'swap', stdout=out)
+    call_command('partition_recipes', 'copy', '--batch-size', '2', stdout=out)
+
+    for table, _ in partitioning.tables():
+      self.assertEqual(
+          count(table), count(table + partitioning.PARTITIONED_SUFFIX))
+    self.assertIn(f'{Tag._meta.db_table:<24} copied', self.status())
+
+    with transaction.atomic():
+      call_command('partition_recipes', 'swap', stdout=out)
+      self.assertIn(f'{Tag._meta.db_table:<24} partitioned', self.status())
+
+      recipe = Recipe.objects.create(
+          user=self.user, title='New', time_minutes=5, price=1)
+      recipe.tags.add(Tag.objects.get(name='Tag 2'))
+      self.assertEqual(
+          sorted(Recipe.objects.values_list('title', flat=True)),
+          ['New', 'Recipe 2', 'Recipe 3', 'Recipe 4', 'Renamed'])
+      self.assertEqual(recipe.tags.get().name, 'Tag 2')
+      self.assertEqual(
+          catalogue.ids_for_names('tags', self.user.id, ['tag 2']),
+          [recipe.tags.get().id])
+      transaction.set_rollback(True)
+
+  def test_migrations_after_swap(self):
+    """Test that the index migrations run on the partitioned tables, with
+    the indexes of every partition attached"""
+    out = StringIO()
+    call_command('partition_recipes', 'prepare', '--partitions', '4',
+                 stdout=out)
+    call_command('partition_recipes', 'copy', stdout=out)
+    foreign_keys = self.foreign_keys()
+    call_command('partition_recipes', 'swap', stdout=out)
+    self.addCleanup(self.unswap, foreign_keys)
+
+    call_command('migrate', 'core', '0011', verbosity=0)
+    call_command('migrate', 'core', verbosity=0)
+
+    with connection.cursor() as cursor:
+      for name in ('core_tag_user_lower_name_uniq',
+                   'core_recipe_title_pattern_idx'):
+        cursor.execute(
+            'SELECT indisvalid, (SELECT count(*) FROM pg_inherits '
+            'WHERE inhparent = indexrelid) FROM pg_index '
+            'WHERE indexrelid = to_regclass(%s)', [name])
+        self.assertEqual(cursor.fetchone(), (True, 4))
+    with self.assertRaises(IntegrityError):
+      Tag.objects.create(user=self.user, name='TAG 0')
+
+  def foreign_keys(self):
+    with connection.cursor() as cursor:
+      cursor.execute(
+          "SELECT conrelid::regclass::text, conname, "
+          "pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'f' "
+          "AND confrelid = ANY(%s::regclass[])",
+          [[table for table, _ in partitioning.tables()]])
+      return cursor.fetchall()
+
+  def unswap(self, foreign_keys):
+    """Put the unpartitioned tables back, with the foreign keys to them
+    and the indexes of the migrations"""
+    qn = partitioning.qn
+    with transaction.atomic(), connection.cursor() as cursor:
+      for table, _ in partitioning.tables():
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+        cursor.execute(f'DROP TABLE {qn(table)}')
+        cursor.execute(
+            f'ALTER TABLE {qn(table + partitioning.UNPARTITIONED_SUFFIX)} '
+            f'RENAME TO {qn(table)}')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id')
+      for relation, name, definition in foreign_keys:
+        cursor.execute(
+            f'ALTER TABLE {relation} ADD CONSTRAINT {qn(name)} {definition}')
+    call_command('migrate', 'core', '0011', verbosity=0)
+    call_command('migrate', 'core', verbosity=0)
+
+  def status(self):
+    out = StringIO()
+    call_command('partition_recipes', 'status', stdout=out)
+    return out.getvalue()
@@ -0,0 +1,73 @@
+import glob
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import profiling
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class ProfilingTests(TestCase):
+  """Tests on-demand request profiling"""
+
+  def setUp(self):
+    self.profile_dir = tempfile.TemporaryDirectory()
+    self.settings = override_settings(
+        PROFILING_DIR=self.profile_dir.name, PROFILING_TOKEN='secret')
+    self.settings.enable()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  def tearDown(self):
+    self.settings.disable()
+    self.profile_dir.cleanup()
+
+  def test_profile_on_request(self):
+    """Tests that requests with the token are profiled"""
+    res = self.client.get(TAGS_URL, HTTP_X_PROFILE='secret')
+
+    paths = profiling.profile_paths()
+    self.assertEqual(len(paths), 1)
+    self.assertIn(res['X-Profile-Id'], paths[0])
+    info = profiling.load_info(paths[0])
+    self.assertEqual(info['route'], 'recipe:tag-list')
+    self.assertEqual(info['action'], 'list')
+    self.assertEqual(info['queries'], 1)
+    self.assertEqual(info['user_id'], self.user.id)
+
+  def test_not_profiled_without_token(self):
+    """Tests that other requests are not profiled"""
+    self.client.get(TAGS_URL)
+    self.client.get(TAGS_URL, HTTP_X_PROFILE='wrong')
+
+    self.assertEqual(profiling.profile_paths(), [])
+
+  @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_FILES=2)
+  def test_sampled_profiles_rotate(self):
+    """Tests that only the latest profiles are kept"""
+    for _ in range(4):
+      self.client.get(TAGS_URL)
+
+    self.assertEqual(len(profiling.profile_paths()), 2)
+    self.assertEqual(
+        len(glob.glob(os.path.join(self.profile_dir.name, '*.json'))), 2)
+
+  def test_report(self):
+    """Tests aggregating profiles into hot functions"""
+    self.client.get(TAGS_URL, HTTP_X_PROFILE='secret')
+    out = StringIO()
+
+    call_command('profile_report', '--top', '5', stdout=out)
+
+    self.assertIn('recipe:tag-list (list): 1 requests', out.getvalue())
+    self.assertIn('cumulative', out.getvalue())
@@ -0,0 +1,142 @@
+import glob
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import recording
+from core.models import Recipe, Tag
+
+TAGS_URL = reverse('recipe:tag-list')
+TOKEN_URL = reverse('user:token')
+
+
+class RecordingTests(TestCase):
+  """Tests recording of API traffic"""
+
+  def setUp(self):
+    self.recording_dir = tempfile.TemporaryDirectory()
+    self.settings = override_settings(RECORDING_DIR=self.recording_dir.name)
+    self.settings.enable()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client = APIClient()
+
+  def tearDown(self):
+    self.settings.disable()
+    self.recording_dir.cleanup()
+
+  def records(self):
+    return recording.load(
+        glob.glob(os.path.join(self.recording_dir.name, '*.ndjson')))
+
+  def test_requests_recorded(self):
+    """Tests that requests are logged with their route, user and body"""
+    self.client.force_authenticate(self.user)
+    self.client.post(TAGS_URL, {'name': 'Vegan'}, format='json')
+    self.client.get(TAGS_URL + '?assigned_only=1')
+
+    records = self.records()
+    self.assertEqual(len(records), 2)
+    self.assertEqual(records[0]['method'], 'POST')
+    self.assertEqual(records[0]['route'], 'recipe:tag-list')
+    self.assertEqual(records[0]['user'], self.user.id)
+    self.assertEqual(records[0]['body'], {'name': 'Vegan'})
+    self.assertEqual(records[0]['status'], 201)
+    self.assertEqual(records[1]['path'], TAGS_URL + '?assigned_only=1')
+    self.assertIsNone(records[1]['body'])
+
+  def test_passwords_redacted(self):
+    """Tests that passwords are not written to the log"""
+    self.client.post(TOKEN_URL, {
+        'email': 'vinson@vinson.sg', 'password': 'password'}, format='json')
+
+    record = self.records()[0]
+    self.assertEqual(record['body']['email'], 'vinson@vinson.sg')
+    self.assertEqual(record['body']['password'], recording.REDACTED)
+    self.assertIsNone(record['user'])
+
+  @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100,
+                     RECORDING_MAX_BODY_SIZE=50)
+  def test_large_bodies_omitted(self):
+    """Tests that uploads and large JSON bodies are left out without
+    reading them"""
+    self.client.force_authenticate(self.user)
+    recipe = Recipe.objects.create(
+        user=self.user, title='Curry', time_minutes=5, price=1)
+    image = BytesIO()
+    Image.new('RGB', (10, 10)).save(image, format='JPEG')
+    image.seek(0)
+    image.name = 'curry.jpg'
+
+    res = self.client.post(
+        reverse('recipe:recipe-upload-image', args=[recipe.id]),
+        {'image': image}, format='multipart')
+    self.client.post(TAGS_URL, {'name': 'V' * 60}, format='json')
+
+    self.assertEqual(res.status_code, 200)
+    records = self.records()
+    self.assertEqual([record['body_omitted'] for record in records],
+                     [True, True])
+    self.assertEqual([record['body'] for record in records], [None, None])
+    recipe.refresh_from_db()
+    recipe.image.delete()
+
+  @override_settings(RECORDING_SAMPLE_RATE=0)
+  def test_not_sampled(self):
+    """Tests that nothing is recorded with a zero sample rate"""
+    self.client.get(TAGS_URL)
+
+    self.assertEqual(self.records(), [])
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+  """Tests replaying recorded traffic against a running server"""
+
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+
+  def test_replay(self):
+    """Tests that recorded requests are replayed as their user"""
+    records = [
+        {'ts': 1, 'method': 'POST', 'path': TAGS_URL,
+         'route': 'recipe:tag-list', 'user': self.user.id,
+         'body': {'name': 'Vegan'}},
+        {'ts': 2, 'method': 'GET', 'path': TAGS_URL,
+         'route': 'recipe:tag-list', 'user': self.user.id, 'body': None},
+        {'ts': 3, 'method': 'GET', 'path': TAGS_URL,
+         'route': 'recipe:tag-list', 'user': None, 'body': None},
+        {'ts': 4, 'method': 'POST', 'path': '/api/recipe/recipes/1/upload/',
+         'route': 'recipe:recipe-upload-image', 'user': self.user.id,
+         'body': None, 'body_omitted': True},
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+      log = os.path.join(tmp, 'requests.ndjson')
+      with open(log, 'w') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+      output = os.path.join(tmp, 'report.json')
+
+      call_command('loadtest', log, '--url', self.live_server_url,
+                   '--concurrency', '1', '--output', output,
+                   stdout=StringIO())
+
+      with open(output) as f:
+        report = json.load(f)
+
+    self.assertEqual(list(report), ['recipe:tag-list'])
+    self.assertEqual(report['recipe:tag-list']['requests'], 3)
+    self.assertEqual(report['recipe:tag-list']['statuses'],
+                     {'200': 1, '201': 1, '401': 1})
+    self.assertEqual(report['recipe:tag-list']['error_rate'], 0)
+    self.assertTrue(
+        Tag.objects.filter(user=self.user, name='Vegan').exists())
@@ -0,0 +1,99 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import slow_queries
+from core.models import SlowQuery
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class SlowQueryTests(TestCase):
+  """Tests the slow query log"""
+
+  def setUp(self):
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client = APIClient()
+    self.client.force_authenticate(self.user)
+
+  @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+  def test_slow_queries_recorded(self):
+    """Tests that slow queries are stored with their request"""
+    self.client.get(TAGS_URL)
+
+    query = SlowQuery.objects.get()
+    self.assertIn('core_tag', query.sql)
+    self.assertEqual(query.route, 'recipe:tag-list')
+    self.assertEqual(query.method, 'GET')
+    self.assertEqual(query.user_id, self.user.id)
+    self.assertEqual(query.plan, '')
+
+  @override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+  def test_disabled(self):
+    """Tests that nothing is recorded without a threshold"""
+    self.client.get(TAGS_URL)
+
+    self.assertFalse(SlowQuery.objects.exists())
+
+  @override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_RATE=1)
+  def test_explain_sampled_queries(self):
+    """Tests that sampled queries are stored with their estimated plan,
+    without running them again"""
+    self.client.get(TAGS_URL)
+
+    plan = SlowQuery.objects.get().plan
+    self.assertIn('cost=', plan)
+    self.assertNotIn('actual time', plan)
+
+  @override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_EXPLAIN_RATE=1,
+                     SLOW_QUERY_EXPLAIN_ANALYZE=True)
+  def test_explain_analyze(self):
+    """Tests that sampled SELECTs can be analyzed for their actual plan,
+    while writes are still only estimated"""
+    self.client.get(TAGS_URL)
+    self.assertIn('actual time', SlowQuery.objects.get().plan)
+
+    plan = slow_queries.explain(
+        'UPDATE core_tag SET name = name', [], analyze=True)
+    self.assertIn('cost=', plan)
+    self.assertNotIn('actual time', plan)
+
+  def test_explain_rolled_back(self):
+    """Tests that analyzing a query keeps nothing it did"""
+    plan = slow_queries.explain(
+        "SELECT set_config('application_name', 'explained', true)", [],
+        analyze=True)
+
+    self.assertIn('actual time', plan)
+    with connection.cursor() as cursor:
+      cursor.execute('SHOW application_name')
+      self.assertNotEqual(cursor.fetchone()[0], 'explained')
+
+  @override_settings(SLOW_QUERY_BUFFER_SIZE=3)
+  def test_buffer_is_bounded(self):
+    """Tests that only the latest queries are kept"""
+    for i in range(5):
+      slow_queries.record(
+          [(f'SELECT {i}', (), False, 1.0)], 'route', 'GET', None)
+
+    self.assertEqual(
+        list(SlowQuery.objects.values_list('sql', flat=True)),
+        ['SELECT 4', 'SELECT 3', 'SELECT 2'])
+
+  def test_command(self):
+    """Tests listing slow queries with the management command"""
+    slow_queries.record(
+        [('SELECT 1', (), False, 1.5)], 'recipe:tag-list', 'GET', 7)
+    out = StringIO()
+
+    call_command('slow_queries', stdout=out)
+
+    self.assertIn('1500.0ms GET recipe:tag-list user=7', out.getvalue())
+    self.assertIn('SELECT 1', out.getvalue())
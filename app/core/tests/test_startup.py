@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+
+from django.test import SimpleTestCase
+
+from core import importprofile, lazy, startup
+
+
+class StartupTests(SimpleTestCase):
+  """Tests profiling what starting the application loads"""
+
+  def package(self, name, **modules):
+    """Make an importable package of the given module sources"""
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    os.mkdir(os.path.join(tmp.name, name))
+    for module, source in dict(modules, __init__='').items():
+      with open(os.path.join(tmp.name, name, f'{module}.py'), 'w') as f:
+        f.write(source)
+    sys.path.insert(0, tmp.name)
+    self.addCleanup(sys.path.remove, tmp.name)
+    for module in (name, *(f'{name}.{module}' for module in modules)):
+      self.addCleanup(sys.modules.pop, module, None)
+
+  def test_profile(self):
+    """Test that imports are timed with their nesting, including those of
+    importlib.import_module"""
+    self.package('startup_pkg', outer='from startup_pkg import inner',
+                 inner='', other='')
+    records = importprofile.profile(
+        'import importlib; importlib.import_module("startup_pkg.other"); '
+        'import startup_pkg.outer')
+    modules = {module: depth for module, _, _, depth in records}
+
+    self.assertEqual(modules['startup_pkg.other'], 0)
+    self.assertEqual(modules['startup_pkg.outer'], 0)
+    self.assertEqual(modules['startup_pkg.inner'], 1)
+    for _, own, total, _ in records:
+      self.assertLessEqual(own, total)
+
+  def test_lazy_module(self):
+    """Test that lazy modules are imported once their attributes are used"""
+    self.package('lazy_pkg', heavy='VALUE = 1')
+    heavy = lazy.LazyModule('lazy_pkg.heavy')
+    self.assertNotIn('lazy_pkg.heavy', sys.modules)
+
+    self.assertEqual(heavy.VALUE, 1)
+    self.assertIn('lazy_pkg.heavy', sys.modules)
+
+  def test_load_all(self):
+    """Test that preloading imports every lazy module"""
+    self.package('preload_pkg', heavy='VALUE = 1')
+    heavy = lazy.LazyModule('preload_pkg.heavy')
+
+    lazy.load_all()
+    self.assertIn('preload_pkg.heavy', sys.modules)
+    self.assertEqual(heavy.VALUE, 1)
+
+  def test_heavy_modules_not_loaded(self):
+    """Test that numpy and Pillow wait for the code using them, and that
+    API only servers do not load the admin"""
+    imports, _ = startup.profile_imports()
+    modules = {imported.module for imported in imports}
+    self.assertNotIn('numpy', modules)
+    self.assertNotIn('PIL', modules)
+    self.assertIn('core.admin', modules)
+
+    imports, _ = startup.profile_imports(api_only=True)
+    self.assertNotIn('core.admin', {imported.module for imported in imports})
@@ -0,0 +1,159 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.throttling import BucketStore
+
+TAGS_URL = reverse('recipe:tag-list')
+TOKEN_URL = reverse('user:token')
+
+
+def rates(**overrides):
+  """Return REST_FRAMEWORK settings with some throttle rates replaced"""
+  return dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=dict(
+      settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **overrides))
+
+
+class BucketStoreTests(TestCase):
+  """Tests the token buckets shared between processes"""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, 'throttle')
+
+  def test_take(self):
+    """Tests that buckets allow bursts and refill over time"""
+    store = BucketStore(self.path, 64)
+
+    self.assertEqual(store.take('a', 2, 1, now=100), 0)
+    self.assertEqual(store.take('a', 2, 1, now=100), 0)
+    self.assertAlmostEqual(store.take('a', 2, 1, now=100), 1)
+    self.assertAlmostEqual(store.take('a', 2, 1, now=100.75), 0.25)
+    self.assertEqual(store.take('a', 2, 1, now=101), 0)
+    self.assertEqual(store.take('b', 2, 1, now=101), 0)
+
+  def test_shared(self):
+    """Tests that stores opening the same file share their buckets"""
+    BucketStore(self.path, 64).take('a', 1, 1, now=100)
+
+    self.assertAlmostEqual(
+        BucketStore(self.path, 64).take('a', 1, 1, now=100), 1)
+
+  def test_full_store_reuses_oldest(self):
+    """Tests that a full store forgets the least recently used bucket"""
+    store = BucketStore(self.path, 1)
+    store.take('a', 1, 1, now=100)
+    store.take('b', 1, 1, now=101)
+
+    self.assertEqual(store.take('a', 1, 1, now=101), 0)
+
+
+class ThrottlingApiTests(TestCase):
+  """Tests throttling of API requests"""
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    store = override_settings(
+        THROTTLE_ENABLED=True,
+        THROTTLE_STORE_PATH=os.path.join(tmp.name, 'throttle'))
+    store.enable()
+    self.addCleanup(store.disable)
+
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client = APIClient()
+
+  @override_settings(REST_FRAMEWORK=rates(write='1/min'))
+  def test_writes_throttled(self):
+    """Tests that writes over budget get a 429 with Retry-After, while
+    reads go on"""
+    self.client.force_authenticate(self.user)
+
+    self.assertEqual(
+        self.client.post(TAGS_URL, {'name': 'Vegan'}).status_code,
+        status.HTTP_201_CREATED)
+    res = self.client.post(TAGS_URL, {'name': 'Dinner'})
+
+    self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    self.assertEqual(res['Retry-After'], '60')
+    self.assertEqual(self.client.get(TAGS_URL).status_code,
+                     status.HTTP_200_OK)
+
+  @override_settings(REST_FRAMEWORK=rates(login='2/min'))
+  def test_login_throttled_per_account(self):
+    """Tests that logins are limited per account and client"""
+    payload = {'email': 'vinson@vinson.sg', 'password': 'wrong'}
+    for _ in range(2):
+      self.assertEqual(self.client.post(TOKEN_URL, payload).status_code,
+                       status.HTTP_400_BAD_REQUEST)
+
+    res = self.client.post(TOKEN_URL, payload)
+    self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    self.assertIn('Retry-After', res)
+
+    res = self.client.post(
+        TOKEN_URL, {'email': 'other@vinson.sg', 'password': 'wrong'})
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+  @override_settings(REST_FRAMEWORK=rates(login='2/min', login_ip='3/min'))
+  def test_login_throttled_per_client(self):
+    """Tests that logins from a client are limited across accounts"""
+    for i in range(3):
+      res = self.client.post(
+          TOKEN_URL, {'email': f'{i}@vinson.sg', 'password': 'wrong'})
+      self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    res = self.client.post(
+        TOKEN_URL, {'email': '3@vinson.sg', 'password': 'wrong'})
+    self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    res = self.client.post(
+        TOKEN_URL, {'email': 'vinson@vinson.sg', 'password': 'password'},
+        REMOTE_ADDR='10.0.0.2')
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+  @override_settings(REST_FRAMEWORK=rates(login='2/min', login_ip='1/min'))
+  def test_login_forwarded_for_ignored(self):
+    """Tests that clients cannot get a new bucket by sending another
+    X-Forwarded-For address when no proxy sets it"""
+    payload = {'email': 'vinson@vinson.sg', 'password': 'wrong'}
+    self.assertEqual(self.client.post(TOKEN_URL, payload).status_code,
+                     status.HTTP_400_BAD_REQUEST)
+
+    res = self.client.post(
+        TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.3')
+    self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+  @override_settings(THROTTLE_ENABLED=False,
+                     REST_FRAMEWORK=rates(write='1/min'))
+  def test_disabled(self):
+    """Tests that nothing is throttled when throttling is off"""
+    self.client.force_authenticate(self.user)
+    for name in ('Vegan', 'Dinner'):
+      self.assertEqual(
+          self.client.post(TAGS_URL, {'name': name}).status_code,
+          status.HTTP_201_CREATED)
+
+  @override_settings(REST_FRAMEWORK=rates(upload='1/min'))
+  def test_upload_budget(self):
+    """Tests that image uploads have a budget of their own"""
+    self.client.force_authenticate(self.user)
+    recipe = Recipe.objects.create(
+        user=self.user, title='Curry', time_minutes=5, price=1)
+    url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+
+    self.assertEqual(self.client.post(url, {'image': 'x'}).status_code,
+                     status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.client.post(url, {'image': 'x'}).status_code,
+                     status.HTTP_429_TOO_MANY_REQUESTS)
+    self.assertEqual(self.client.post(TAGS_URL, {'name': 'Vegan'}).status_code,
+                     status.HTTP_201_CREATED)
@@ -0,0 +1,199 @@
+import functools
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+
+# Key hash, tokens left and time of the last update of a bucket
+SLOT = struct.Struct('=Qdd')
+PROBES = 8
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@functools.lru_cache(maxsize=65536)
+def key_digest(key):
+  """Return a hash of a bucket key that is the same in every process,
+  never 0 as that marks empty slots"""
+  return int.from_bytes(
+      hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+
+class BucketStore:
+  """Token buckets kept in a memory mapped file, shared by every process
+  of a node that opens the same path
+
+  Buckets are found by open addressing on a stable hash of their key.
+  When the slots probed are all taken, the least recently updated one is
+  reused. Updates are not locked across processes, so two workers taking
+  the last token of a bucket at the same instant may both get it: the
+  store errs on the side of letting requests through rather than paying
+  for a lock on every request.
+  """
+
+  def __init__(self, path, slots):
+    self.path = path
+    self.slots = slots
+    self.lock = threading.Lock()
+    self.map = None
+
+  def _open(self):
+    size = self.slots * SLOT.size
+    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+      if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+      self.map = mmap.mmap(fd, size)
+    finally:
+      os.close(fd)
+
+  def take(self, key, capacity, rate, now=None):
+    """Take a token from the bucket of `key`, which holds up to `capacity`
+    tokens refilled at `rate` per second
+
+    Returns 0 when a token was taken, otherwise the seconds until one is
+    available.
+    """
+    digest = key_digest(key)
+    now = time.time() if now is None else now
+    with self.lock:
+      if self.map is None:
+        self._open()
+
+      start = digest % self.slots
+      oldest, oldest_updated = None, math.inf
+      for probe in range(PROBES):
+        offset = (start + probe) % self.slots * SLOT.size
+        slot_key, tokens, updated = SLOT.unpack_from(self.map, offset)
+        if slot_key == digest:
+          break
+        # Empty slots were never updated and are reused first
+        if updated < oldest_updated:
+          oldest, oldest_updated = offset, updated
+      else:
+        offset, tokens, updated = oldest, capacity, now
+
+      tokens = min(capacity, tokens + (now - updated) * rate)
+      if tokens >= 1:
+        SLOT.pack_into(self.map, offset, digest, tokens - 1, now)
+        return 0
+      SLOT.pack_into(self.map, offset, digest, tokens, now)
+      return (1 - tokens) / rate
+
+  def clear(self):
+    with self.lock:
+      if self.map is None:
+        self._open()
+      self.map[:] = bytes(len(self.map))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+  """Return the bucket store of this process"""
+  global _store
+  with _store_lock:
+    if _store is None or _store.path != settings.THROTTLE_STORE_PATH:
+      _store = BucketStore(
+          settings.THROTTLE_STORE_PATH, settings.THROTTLE_STORE_SLOTS)
+    return _store
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+  """Return the capacity and refill rate per second of a rate such as
+  '100/min', as understood by DRF's throttles"""
+  num, period = rate.split('/')
+  num = int(num)
+  return num, num / PERIODS[period[0]]
+
+
+class BucketThrottle(BaseThrottle):
+  """Throttle taking a token per request from a bucket of its scope
+
+  Rates come from DEFAULT_THROTTLE_RATES: a rate of '60/min' allows
+  bursts of 60 requests, refilled at one per second. Scopes without a
+  rate are not throttled.
+  """
+  scope = None
+
+  def get_scope(self, request, view):
+    return self.scope
+
+  def get_key(self, request, view):
+    """Return who the bucket belongs to, or None to not throttle"""
+    if request.user and request.user.is_authenticated:
+      return f'user:{request.user.pk}'
+    return f'ip:{self.get_ident(request)}'
+
+  def allow_request(self, request, view):
+    self.wait_seconds = None
+    if not settings.THROTTLE_ENABLED:
+      return True
+    scope = self.get_scope(request, view)
+    rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+    key = self.get_key(request, view) if rate else None
+    if key is None:
+      return True
+
+    capacity, refill = parse_rate(rate)
+    self.wait_seconds = get_store().take(f'{scope}:{key}', capacity, refill)
+    if self.wait_seconds:
+      metrics.inc('throttled_requests_total', scope=scope)
+      return False
+    return True
+
+  def wait(self):
+    return self.wait_seconds
+
+
+class UserRateThrottle(BucketThrottle):
+  """Budget for all requests of a user, or of an anonymous client"""
+  scope = 'user'
+
+
+class WriteRateThrottle(BucketThrottle):
+  """Budget for requests that change data"""
+  scope = 'write'
+
+  def get_key(self, request, view):
+    if request.method in SAFE_METHODS:
+      return None
+    return super().get_key(request, view)
+
+
+class ScopedRateThrottle(BucketThrottle):
+  """Budget for the views or actions sharing their `throttle_scope`"""
+
+  def get_scope(self, request, view):
+    return getattr(view, 'throttle_scope', None)
+
+
+class LoginRateThrottle(BucketThrottle):
+  """Budget for logins to an account from a client"""
+  scope = 'login'
+
+  def get_key(self, request, view):
+    email = ''
+    if hasattr(request.data, 'get'):
+      email = str(request.data.get('email', '')).lower()
+    return f'ip:{self.get_ident(request)}:{email}'
+
+
+class LoginIPRateThrottle(BucketThrottle):
+  """Budget for logins from a client, whichever accounts they are to"""
+  scope = 'login_ip'
+
+  def get_key(self, request, view):
+    return f'ip:{self.get_ident(request)}'
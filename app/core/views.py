@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from core import metrics
+
+
+def metrics_view(request):
+  """Expose the metrics of all workers in the Prometheus text format"""
+  if settings.METRICS_TOKEN:
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    if request.META.get('HTTP_AUTHORIZATION') != expected:
+      return HttpResponseForbidden()
+
+  return HttpResponse(
+      metrics.render(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,58 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Per-user data versions never expire on their own. If one is evicted it is
+# restarted from the current time so that it never goes back to a version
+# that entries cached earlier were stored under.
+
+
+def _version_key(user_id):
+  return f'recipe:version:{user_id}'
+
+
+def _initial_version():
+  return int(time.time() * 1000)
+
+
+def get_user_version(user_id):
+  """Return the current version of the user's recipe data"""
+  key = _version_key(user_id)
+  version = cache.get(key)
+  if version is None:
+    cache.add(key, _initial_version(), None)
+    version = cache.get(key)
+  return version
+
+
+def bump_user_version(user_id):
+  """Invalidate everything cached for the user, returning the new version"""
+  key = _version_key(user_id)
+  try:
+    return cache.incr(key)
+  except ValueError:
+    version = _initial_version()
+    cache.set(key, version, None)
+    return version
+
+
+def bump_user_version_on_commit(user_id, then=None):
+  """Bump the user's data version once the current transaction commits,
+  or at once outside of one, then call `then` with the new version
+
+  A read between a bump and the commit of the write would cache data from
+  before the write under the new version.
+  """
+  def bump():
+    version = bump_user_version(user_id)
+    if then is not None:
+      then(version)
+  transaction.on_commit(bump)
+
+
+def user_cache_key(user_id, name, version=None):
+  """Return the cache key of `name` for the current version of user data"""
+  if version is None:
+    version = get_user_version(user_id)
+  return f'recipe:{name}:{user_id}:{version}'
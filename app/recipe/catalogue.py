@@ -0,0 +1,167 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import (
+    CanonicalIngredient, CanonicalTag, Ingredient, Recipe, SimilarRecipes, Tag,
+    normalize_name)
+from recipe import cache, cook
+
+# (user owned model, catalogue, through table of recipes, through column)
+KINDS = {
+    'tags': (Tag, CanonicalTag, Recipe.tags.through, 'tag_id'),
+    'ingredients': (Ingredient, CanonicalIngredient,
+                    Recipe.ingredients.through, 'ingredient_id'),
+}
+
+
+def qn(name):
+  return connection.ops.quote_name(name)
+
+
+def ids_for_names(kind, user_id, names):
+  """Return ids of a user's tags or ingredients with these names, ignoring
+  case, adding the missing ones in one statement
+
+  Relies on the unique index on (user_id, lower(name)). Names only
+  differing in case are taken as one, spelled as first given.
+  """
+  model, catalogue, _, _ = KINDS[kind]
+  unique = {}
+  for name in names:
+    unique.setdefault(name.lower(), name)
+  if not unique:
+    return []
+
+  names = list(unique.values())
+  canonical_ids = catalogue.objects.ids_for(names)
+  table = qn(model._meta.db_table)
+  with connection.cursor() as cursor:
+    # Existing rows are read rather than updated on conflict, which would
+    # lock and rewrite them. Rows another transaction adds meanwhile are
+    # not in the snapshot of the statement, and are read by a second one.
+    cursor.execute(
+        f'WITH inserted AS (INSERT INTO {table} (user_id, name, '
+        f'canonical_id) SELECT %s, n.name, n.canonical_id '
+        f'FROM unnest(%s::text[], %s::int[]) AS n(name, canonical_id) '
+        f'ON CONFLICT (user_id, lower(name)) DO NOTHING RETURNING id) '
+        f'SELECT id FROM inserted UNION ALL '
+        f'SELECT id FROM {table} WHERE user_id = %s '
+        f'AND lower(name) IN (SELECT lower(unnest(%s::text[])))',
+        [user_id, names, [canonical_ids[normalize_name(name)]
+                          for name in names], user_id, names])
+    ids = [row[0] for row in cursor.fetchall()]
+    if len(ids) < len(names):
+      cursor.execute(
+          f'SELECT id FROM {table} WHERE user_id = %s '
+          f'AND lower(name) IN (SELECT lower(unnest(%s::text[]))) '
+          f'AND NOT id = ANY(%s)', [user_id, names, ids])
+      ids += [row[0] for row in cursor.fetchall()]
+    return ids
+
+
+def link(kind, batch_size):
+  """Point rows saved before the catalogue existed at their entries,
+  adding missing entries. Yields the rows linked by every batch.
+  """
+  model, catalogue, _, _ = KINDS[kind]
+  table = qn(model._meta.db_table)
+  while True:
+    rows = list(model.objects.filter(canonical__isnull=True).order_by(
+        'id').values_list('id', 'name')[:batch_size])
+    if not rows:
+      return
+    with transaction.atomic():
+      ids = catalogue.objects.ids_for(name for _, name in rows)
+      with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} AS t SET canonical_id = v.canonical_id '
+            f'FROM unnest(%s::int[], %s::int[]) AS v(id, canonical_id) '
+            f'WHERE t.id = v.id',
+            [[row_id for row_id, _ in rows],
+             [ids[normalize_name(name)] for _, name in rows]])
+    yield len(rows)
+
+
+def merge_duplicates(kind, batch_size):
+  """Merge rows of a user that have the same catalogue entry into the
+  oldest of them, moving their recipes over
+
+  Works through `batch_size` users at a time. Yields the rows removed by
+  every batch that had any.
+  """
+  model, _, through, column = KINDS[kind]
+  table = qn(model._meta.db_table)
+  through_table = qn(through._meta.db_table)
+  last_user_id = 0
+  while True:
+    user_ids = list(get_user_model().objects.filter(
+        id__gt=last_user_id).order_by('id').values_list(
+        'id', flat=True)[:batch_size])
+    if not user_ids:
+      return
+    last_user_id = user_ids[-1]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+      cursor.execute(
+          f'SELECT user_id, array_agg(id ORDER BY id) FROM {table} '
+          f'WHERE user_id = ANY(%s) AND canonical_id IS NOT NULL '
+          f'GROUP BY user_id, canonical_id HAVING count(*) > 1',
+          [user_ids])
+      groups = cursor.fetchall()
+      if not groups:
+        continue
+
+      duplicates, keep = [], []
+      for _, ids in groups:
+        duplicates.extend(ids[1:])
+        keep.extend([ids[0]] * (len(ids) - 1))
+
+      cursor.execute(
+          f'INSERT INTO {through_table} (recipe_id, {qn(column)}) '
+          f'SELECT t.recipe_id, m.keep FROM {through_table} AS t '
+          f'JOIN unnest(%s::int[], %s::int[]) AS m(duplicate, keep) '
+          f'ON t.{qn(column)} = m.duplicate ON CONFLICT DO NOTHING',
+          [duplicates, keep])
+      cursor.execute(
+          f'DELETE FROM {through_table} WHERE {qn(column)} = ANY(%s) '
+          f'RETURNING recipe_id', [duplicates])
+      recipe_ids = {row[0] for row in cursor.fetchall()}
+      cursor.execute(
+          f'DELETE FROM {table} WHERE id = ANY(%s)', [duplicates])
+      removed = cursor.rowcount
+      SimilarRecipes.objects.filter(recipe_id__in=recipe_ids).update(
+          changed_at=timezone.now())
+
+    for user_id, _ in groups:
+      cache.bump_user_version(user_id)
+      cook.drop_index(user_id)
+    yield removed
+
+
+def sizes():
+  """Return (table, estimated rows, table bytes, index bytes) of the
+  tables the catalogue affects"""
+  result = []
+  with connection.cursor() as cursor:
+    for model, catalogue, through, _ in KINDS.values():
+      for table in (model._meta.db_table, catalogue._meta.db_table,
+                    through._meta.db_table):
+        cursor.execute(
+            'SELECT greatest(reltuples, 0)::bigint, pg_table_size(oid), '
+            'pg_indexes_size(oid) FROM pg_class WHERE oid = %s::regclass',
+            [table])
+        result.append((table, *cursor.fetchone()))
+  return result
+
+
+def name_bytes(kind):
+  """Return the bytes taken by names of user owned rows, and by the same
+  names once in the catalogue"""
+  model, catalogue, _, _ = KINDS[kind]
+  with connection.cursor() as cursor:
+    cursor.execute(
+        f'SELECT (SELECT coalesce(sum(octet_length(name)), 0) FROM '
+        f'{qn(model._meta.db_table)}), (SELECT coalesce('
+        f'sum(octet_length(name)), 0) FROM {qn(catalogue._meta.db_table)})')
+    return cursor.fetchone()
@@ -0,0 +1,235 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core import metrics
+from core.lazy import LazyModule
+from core.models import Recipe
+from recipe import cache as recipe_cache
+
+# The signal handlers load this module for the cached indexes at start up,
+# while numpy is only needed once an index is built
+np = LazyModule('numpy')
+
+
+class GrowableArray:
+  """One dimensional numpy array with amortised O(1) appends"""
+
+  def __init__(self, values, dtype):
+    values = np.asarray(values, dtype=dtype)
+    self.size = len(values)
+    self.data = np.zeros(max(self.size, 16), dtype=dtype)
+    self.data[:self.size] = values
+
+  @property
+  def values(self):
+    return self.data[:self.size]
+
+  def extend(self, values):
+    """Append `values`, returning the position of the first one"""
+    start = self.size
+    end = start + len(values)
+    if end > len(self.data):
+      self.data = np.resize(self.data, max(end, 2 * len(self.data)))
+    self.data[start:end] = values
+    self.size = end
+    return start
+
+
+class IngredientIndex:
+  """Ingredients of every recipe of a user as flat integer arrays
+
+  Row `r` stands for the recipe `recipe_ids[r]` and every entry `e` says
+  that row `entry_rows[e]` needs the ingredient in column `entry_cols[e]`.
+  Columns are numbered in the order ingredients are first seen.
+
+  A changed recipe is appended as a new row and its old row is cleared by
+  setting its recipe id to 0. The arrays are compacted once more than half
+  of the entries belong to cleared rows. Changes and matches of an index
+  hold its `lock`.
+  """
+
+  def __init__(self, version, recipe_ids, pairs=()):
+    recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    ingredient_ids, cols = np.unique(pairs[:, 1], return_inverse=True)
+    order = np.argsort(recipe_ids)
+    rows = order[np.searchsorted(recipe_ids, pairs[:, 0], sorter=order)]
+
+    self.version = version
+    self.rows = {int(r): row for row, r in enumerate(recipe_ids)}
+    self.columns = {int(i): col for col, i in enumerate(ingredient_ids)}
+    self.recipe_ids = GrowableArray(recipe_ids, np.int64)
+    self.row_sizes = GrowableArray(
+        np.bincount(rows, minlength=len(recipe_ids)), np.int32)
+    self.entry_rows = GrowableArray(rows, np.int32)
+    self.entry_cols = GrowableArray(cols, np.int32)
+    self.dead_entries = 0
+    self.lock = threading.Lock()
+
+  @property
+  def nbytes(self):
+    """Memory used by the index arrays"""
+    return sum(array.data.nbytes for array in (
+        self.recipe_ids, self.row_sizes, self.entry_rows, self.entry_cols))
+
+  def _column(self, ingredient_id):
+    col = self.columns.get(ingredient_id)
+    if col is None:
+      col = self.columns[ingredient_id] = len(self.columns)
+    return col
+
+  def _clear_row(self, row):
+    self.recipe_ids.data[row] = 0
+    self.dead_entries += int(self.row_sizes.data[row])
+
+  def _compact(self):
+    live = self.recipe_ids.values != 0
+    new_rows = np.cumsum(live) - 1
+    entry_rows = self.entry_rows.values
+    keep = live[entry_rows]
+
+    recipe_ids = self.recipe_ids.values[live]
+    self.rows = {int(r): row for row, r in enumerate(recipe_ids)}
+    self.recipe_ids = GrowableArray(recipe_ids, np.int64)
+    self.row_sizes = GrowableArray(self.row_sizes.values[live], np.int32)
+    self.entry_rows = GrowableArray(new_rows[entry_rows[keep]], np.int32)
+    self.entry_cols = GrowableArray(self.entry_cols.values[keep], np.int32)
+    self.dead_entries = 0
+
+  def set_recipe(self, recipe_id, ingredient_ids):
+    """Add a recipe or replace its ingredients"""
+    row = self.rows.get(recipe_id)
+    if row is not None:
+      self._clear_row(row)
+
+    cols = sorted({self._column(i) for i in ingredient_ids})
+    row = self.rows[recipe_id] = self.recipe_ids.extend([recipe_id])
+    self.row_sizes.extend([len(cols)])
+    self.entry_rows.extend([row] * len(cols))
+    self.entry_cols.extend(cols)
+
+    if self.dead_entries * 2 > self.entry_rows.size:
+      self._compact()
+
+  def remove_recipe(self, recipe_id):
+    """Remove a recipe"""
+    row = self.rows.pop(recipe_id, None)
+    if row is not None:
+      self._clear_row(row)
+
+  def match(self, ingredient_ids, max_missing=0):
+    """Return (recipe id, missing count) of recipes needing at most
+    `max_missing` ingredients besides `ingredient_ids`, fewest missing first
+    """
+    available = np.zeros(len(self.columns), dtype=bool)
+    cols = [self.columns[i] for i in ingredient_ids if i in self.columns]
+    available[cols] = True
+
+    recipe_ids = self.recipe_ids.values
+    needed = self.entry_rows.values[~available[self.entry_cols.values]]
+    missing = np.bincount(needed, minlength=len(recipe_ids))
+    found = np.flatnonzero((missing <= max_missing) & (recipe_ids != 0))
+    found = found[np.lexsort((-recipe_ids[found], missing[found]))]
+
+    return [(int(recipe_ids[row]), int(missing[row])) for row in found]
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def build_index(user_id):
+  """Build the ingredient index of a user from the database"""
+  version = recipe_cache.get_user_version(user_id)
+  rows = Recipe.objects.filter(user_id=user_id).values_list(
+      'id', 'ingredients').order_by()
+  recipe_ids = set()
+  pairs = []
+  for recipe_id, ingredient_id in rows:
+    recipe_ids.add(recipe_id)
+    if ingredient_id is not None:
+      pairs.append((recipe_id, ingredient_id))
+
+  return IngredientIndex(version, sorted(recipe_ids), pairs)
+
+
+def _store(user_id, index):
+  _indexes[user_id] = index
+  _indexes.move_to_end(user_id)
+  while len(_indexes) > settings.RECIPE_COOK_INDEX_MAX_USERS:
+    _indexes.popitem(last=False)
+
+
+def get_index(user_id):
+  """Return an up to date ingredient index of a user
+
+  With a shared cache, indexes are kept in process memory and checked
+  against the shared data version of the user, so a change made through
+  another process leads to a rebuild here. Without one that change would
+  go unseen, so an index is built for every call.
+  """
+  if not settings.SHARED_CACHE:
+    metrics.record_cache_lookup('cook_index', False)
+    return build_index(user_id)
+
+  version = recipe_cache.get_user_version(user_id)
+  with _lock:
+    index = _indexes.get(user_id)
+    if index is not None and index.version == version:
+      _indexes.move_to_end(user_id)
+      metrics.record_cache_lookup('cook_index', True)
+      return index
+
+  metrics.record_cache_lookup('cook_index', False)
+  index = build_index(user_id)
+  with _lock:
+    _store(user_id, index)
+  return index
+
+
+def index_changed(user_id, version, recipe=None, deleted=False):
+  """Bring a cached index to `version` after a write by this process
+
+  `recipe` is the recipe whose ingredients changed, if any. The index is
+  dropped when it missed an earlier change so that it is rebuilt. Only
+  the index of the user is locked while it changes, and not while the
+  ingredients of the recipe are read.
+  """
+  with _lock:
+    index = _indexes.get(user_id)
+  if index is None:
+    return
+
+  ingredient_ids = None
+  if recipe is not None and not deleted:
+    ingredient_ids = list(recipe.ingredients.values_list('id', flat=True))
+
+  with index.lock:
+    if index.version != version - 1:
+      with _lock:
+        if _indexes.get(user_id) is index:
+          del _indexes[user_id]
+      return
+
+    if recipe is not None and deleted:
+      index.remove_recipe(recipe.id)
+    elif recipe is not None:
+      index.set_recipe(recipe.id, ingredient_ids)
+    index.version = version
+
+
+def drop_index(user_id):
+  """Forget the cached index of a user"""
+  with _lock:
+    _indexes.pop(user_id, None)
+
+
+def find_cookable(user_id, ingredient_ids, max_missing=0):
+  """Return (recipe id, missing count) of the user's recipes that can be
+  made from `ingredient_ids` with at most `max_missing` others
+  """
+  index = get_index(user_id)
+  with index.lock:
+    return index.match(ingredient_ids, max_missing)
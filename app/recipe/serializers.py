@@ -1,8 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, RecipeShare
+from recipe import catalogue
 
 
-class TagSerializer(serializers.ModelSerializer):
+class UniqueNameMixin:
+  """Reject names the user already has for another object, in any case
+
+  The unique index on (user_id, lower(name)) catches names saved by a
+  concurrent request after the check, which are rejected the same way.
+  """
+
+  def duplicate_name_error(self):
+    return serializers.ValidationError(
+        f'{self.Meta.model._meta.verbose_name.capitalize()} with this '
+        f'name already exists')
+
+  def validate_name(self, value):
+    user = self.context['request'].user
+    others = self.Meta.model.objects.filter(user=user, name__iexact=value)
+    if self.instance is not None:
+      others = others.exclude(pk=self.instance.pk)
+    if others.exists():
+      raise self.duplicate_name_error()
+    return value
+
+  def save(self, **kwargs):
+    try:
+      with transaction.atomic():
+        return super().save(**kwargs)
+    except IntegrityError:
+      raise serializers.ValidationError(
+          {'name': self.duplicate_name_error().detail})
+
+
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
   """Serializer for tag objects"""
 
   class Meta:
@@ -11,7 +46,7 @@ class TagSerializer(serializers.ModelSerializer):
     read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
 
   class Meta:
     model = Ingredient
@@ -23,16 +58,41 @@ class RecipeSerializer(serializers.ModelSerializer):
   """Serializer for a recipe object"""
 
   ingredients = serializers.PrimaryKeyRelatedField(
-      many=True, queryset=Ingredient.objects.all())
+      many=True, queryset=Ingredient.objects.all(), required=False)
   tags = serializers.PrimaryKeyRelatedField(
-      many=True, queryset=Tag.objects.all())
+      many=True, queryset=Tag.objects.all(), required=False)
+  ingredient_names = serializers.ListField(
+      child=serializers.CharField(max_length=255), write_only=True,
+      required=False)
+  tag_names = serializers.ListField(
+      child=serializers.CharField(max_length=255), write_only=True,
+      required=False)
 
   class Meta:
     model = Recipe
-    fields = ('id', 'title', 'time_minutes',
-              'price', 'link', 'ingredients', 'tags')
+    fields = ('id', 'title', 'time_minutes', 'price', 'link', 'ingredients',
+              'tags', 'ingredient_names', 'tag_names')
     read_only_fields = ('id',)
 
+  def resolve_names(self, validated_data, user_id):
+    """Add the tags and ingredients given by name to those given by id,
+    creating the ones the user does not have yet"""
+    for kind in ('tags', 'ingredients'):
+      names = validated_data.pop(f'{kind[:-1]}_names', None)
+      if names is not None:
+        validated_data[kind] = list(validated_data.get(kind, [])) + (
+            catalogue.ids_for_names(kind, user_id, names))
+
+  @transaction.atomic
+  def create(self, validated_data):
+    self.resolve_names(validated_data, validated_data['user'].id)
+    return super().create(validated_data)
+
+  @transaction.atomic
+  def update(self, instance, validated_data):
+    self.resolve_names(validated_data, instance.user_id)
+    return super().update(instance, validated_data)
+
 
 class RecipeDetailSerializer(RecipeSerializer):
   """Serialize a recipe detail"""
@@ -40,6 +100,68 @@ class RecipeDetailSerializer(RecipeSerializer):
   tags = TagSerializer(many=True, read_only=True)
 
 
+class SimilarRecipeSerializer(RecipeSerializer):
+  """Serialize a recipe similar to another one"""
+  similarity = serializers.FloatField(read_only=True)
+
+  class Meta(RecipeSerializer.Meta):
+    fields = RecipeSerializer.Meta.fields + ('similarity',)
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+  """Serialize an ingredient needed by some of the given recipes"""
+  id = serializers.IntegerField()
+  name = serializers.CharField()
+  recipes = serializers.ListField(child=serializers.IntegerField())
+
+
+class RecipeCopySerializer(serializers.Serializer):
+  """Serializer for copying recipes to their owner or sharing them with
+  another user
+
+  The recipient is looked up but never rejected, see
+  recipe.sharing.share_recipes: unknown emails validate to None.
+  """
+  recipes = serializers.ListField(
+      child=serializers.IntegerField(), min_length=1,
+      max_length=settings.RECIPE_COPY_MAX_RECIPES)
+  recipient = serializers.EmailField(required=False)
+
+  def validate_recipient(self, value):
+    try:
+      return get_user_model()._default_manager.get_by_natural_key(value)
+    except ObjectDoesNotExist:
+      return None
+
+  def validate_recipes(self, value):
+    user = self.context['request'].user
+    found = set(Recipe.objects.filter(
+        user=user, id__in=value).values_list('id', flat=True))
+    missing = sorted(set(value) - found)
+    if missing:
+      raise serializers.ValidationError(
+          f'Recipes not found: {", ".join(map(str, missing))}')
+    return value
+
+
+class RecipeCopyResultSerializer(serializers.Serializer):
+  """Serialize a copy of a recipe"""
+  recipe = serializers.IntegerField()
+  copy = serializers.IntegerField()
+
+
+class RecipeShareSerializer(serializers.ModelSerializer):
+  """Serialize a share of recipes offered to the user"""
+  sender = serializers.EmailField(source='sender.email', read_only=True)
+  recipes = serializers.ListField(
+      source='recipe_ids', child=serializers.IntegerField(), read_only=True)
+
+  class Meta:
+    model = RecipeShare
+    fields = ('id', 'sender', 'recipes', 'created_at')
+    read_only_fields = fields
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
   """Serializer for uplaoding images to recipe"""
 
@@ -47,3 +169,29 @@ class RecipeImageSerializer(serializers.ModelSerializer):
     model = Recipe
     fields = ('id', 'image')
     read_only_fields = ('id',)
+
+
+class RecipeCountSerializer(serializers.Serializer):
+  """Serializer for the number of recipes using a tag or ingredient"""
+  id = serializers.IntegerField()
+  name = serializers.CharField()
+  count = serializers.IntegerField()
+
+
+class TimeBucketSerializer(serializers.Serializer):
+  """Serializer for one bucket of the preparation time histogram"""
+  min_minutes = serializers.IntegerField()
+  max_minutes = serializers.IntegerField()
+  count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+  """Serializer for statistics over a user's recipes"""
+  count = serializers.IntegerField()
+  average_price = serializers.DecimalField(
+      max_digits=7, decimal_places=2, allow_null=True)
+  median_price = serializers.DecimalField(
+      max_digits=7, decimal_places=2, allow_null=True)
+  time_minutes_histogram = TimeBucketSerializer(many=True)
+  top_tags = RecipeCountSerializer(many=True)
+  top_ingredients = RecipeCountSerializer(many=True)
@@ -0,0 +1,139 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Recipe, RecipeShare
+from recipe import cache, cook
+from recipe.catalogue import KINDS, qn
+
+# Columns copied as they are, the image included, so that copies share
+# the stored file
+COPIED_COLUMNS = ('title', 'time_minutes', 'price', 'link', 'image')
+
+
+def _add_missing(cursor, kind, recipe_ids, recipient_id):
+  """Give the recipient the tags or ingredients of the recipes they do not
+  have under any case of the name yet"""
+  model, _, through, column = KINDS[kind]
+  table = qn(model._meta.db_table)
+  cursor.execute(
+      f'INSERT INTO {table} (user_id, name, canonical_id) '
+      f'SELECT DISTINCT ON (lower(t.name)) %s, t.name, t.canonical_id '
+      f'FROM {table} AS t JOIN {qn(through._meta.db_table)} AS r '
+      f'ON r.{qn(column)} = t.id WHERE r.recipe_id = ANY(%s) '
+      f'ORDER BY lower(t.name), t.id '
+      f'ON CONFLICT (user_id, lower(name)) DO NOTHING',
+      [recipient_id, recipe_ids])
+
+
+def _copy_batch(cursor, recipe_ids, recipient_id):
+  """Copy recipes to the recipient, returning the (recipe id, copy id)
+  pairs
+
+  Ids of the copies are drawn before inserting them, so that every copy
+  is known with the recipe it came from.
+  """
+  table = qn(Recipe._meta.db_table)
+  columns = ', '.join(qn(column) for column in COPIED_COLUMNS)
+  cursor.execute(
+      f'WITH source AS (SELECT id AS source_id, '
+      f"nextval(pg_get_serial_sequence(%s, 'id')) AS id, {columns} "
+      f'FROM {table} WHERE id = ANY(%s) ORDER BY id), '
+      f'copied AS (INSERT INTO {table} (id, user_id, {columns}) '
+      f'SELECT id, %s, {columns} FROM source) '
+      f'SELECT source_id, id FROM source ORDER BY source_id',
+      [Recipe._meta.db_table, recipe_ids, recipient_id])
+  pairs = cursor.fetchall()
+
+  source_ids = [source_id for source_id, _ in pairs]
+  copy_ids = [copy_id for _, copy_id in pairs]
+  for model, _, through, column in KINDS.values():
+    table = qn(model._meta.db_table)
+    # Links of the copies point at the recipient's rows of the same name
+    cursor.execute(
+        f'INSERT INTO {qn(through._meta.db_table)} (recipe_id, '
+        f'{qn(column)}) SELECT m.copy_id, mine.id '
+        f'FROM unnest(%s::int[], %s::int[]) AS m(source_id, copy_id) '
+        f'JOIN {qn(through._meta.db_table)} AS r '
+        f'ON r.recipe_id = m.source_id '
+        f'JOIN {table} AS t ON t.id = r.{qn(column)} '
+        f'JOIN {table} AS mine ON mine.user_id = %s '
+        f'AND lower(mine.name) = lower(t.name)',
+        [source_ids, copy_ids, recipient_id])
+  return pairs
+
+
+def _copy(recipe_ids, owner_id, recipient_id, batch_size):
+  """Copy recipes in the current transaction, see copy_recipes"""
+  pairs = []
+  with connection.cursor() as cursor:
+    recipe_ids = list(Recipe.objects.filter(
+        user_id=owner_id, id__in=recipe_ids).order_by('id').values_list(
+        'id', flat=True))
+    for kind in KINDS:
+      _add_missing(cursor, kind, recipe_ids, recipient_id)
+    for start in range(0, len(recipe_ids), batch_size):
+      pairs += _copy_batch(
+          cursor, recipe_ids[start:start + batch_size], recipient_id)
+  return pairs
+
+
+def _invalidate(recipient_id):
+  # Rows were added without signals. Views copying recipes run in the
+  # transaction of their Idempotency-Key, which may not have committed yet
+  cache.bump_user_version_on_commit(
+      recipient_id, lambda version: cook.drop_index(recipient_id))
+
+
+def copy_recipes(recipe_ids, owner_id, recipient_id, batch_size):
+  """Copy recipes of the owner to the recipient, who may be the owner,
+  returning the (recipe id, copy id) pairs by recipe id
+
+  Everything is copied in the database: the recipient gets the tags and
+  ingredients they lack, then the recipes are copied `batch_size` at a
+  time along with their links. Recipes the owner does not have are left
+  out. All or none of the recipes are copied.
+  """
+  with transaction.atomic():
+    pairs = _copy(recipe_ids, owner_id, recipient_id, batch_size)
+  _invalidate(recipient_id)
+  return pairs
+
+
+def share_recipes(recipe_ids, sender, recipient):
+  """Offer recipes of the sender to the recipient, if there is one
+
+  Nothing is copied until the recipient accepts the share. Unknown and
+  inactive recipients are skipped without telling the sender, so that
+  sharing does not reveal which emails have accounts.
+  """
+  if recipient is not None and recipient.is_active:
+    RecipeShare.objects.create(
+        sender=sender, recipient=recipient, recipe_ids=recipe_ids)
+
+
+def _answer(share, status):
+  """Mark a pending share as answered, returning whether it was pending"""
+  return RecipeShare.objects.filter(
+      id=share.id, status=RecipeShare.PENDING).update(
+      status=status, answered_at=timezone.now()) == 1
+
+
+def accept_share(share, batch_size):
+  """Copy the recipes of a pending share to its recipient, returning the
+  (recipe id, copy id) pairs, or None if the share was answered meanwhile
+
+  The share is marked as accepted in the transaction copying the recipes,
+  so that they are copied once.
+  """
+  with transaction.atomic():
+    if not _answer(share, RecipeShare.ACCEPTED):
+      return None
+    pairs = _copy(
+        share.recipe_ids, share.sender_id, share.recipient_id, batch_size)
+  _invalidate(share.recipient_id)
+  return pairs
+
+
+def decline_share(share):
+  """Decline a pending share, returning whether it was pending"""
+  return _answer(share, RecipeShare.DECLINED)
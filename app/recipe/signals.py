@@ -0,0 +1,89 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import cache, cook, similarity
+
+
+def _invalidate(user_id, **change):
+  """Invalidate cached data of a user once the write commits, bringing the
+  cached ingredient index along with `change`, see cook.index_changed"""
+  cache.bump_user_version_on_commit(
+      user_id, lambda version: cook.index_changed(user_id, version, **change))
+
+
+def _drop_index(user_id):
+  """Invalidate cached data of a user once the write commits, dropping
+  the cached ingredient index rather than bringing it along"""
+  cache.bump_user_version_on_commit(
+      user_id, lambda version: cook.drop_index(user_id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+def user_data_saved(sender, instance, **kwargs):
+  """Invalidate cached data of the owner of a saved or deleted object"""
+  _invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+  """Invalidate cached data of the owner of a deleted ingredient"""
+  _drop_index(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+  """Invalidate cached data of the owner of a saved recipe"""
+  _invalidate(instance.user_id, recipe=instance if created else None)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+  """Invalidate cached data of the owner of a deleted recipe"""
+  _invalidate(instance.user_id, recipe=instance, deleted=True)
+
+
+def _mark_similar_changed(sender, instance, action, reverse, pk_set):
+  """Flag stored similar recipes of the recipes whose relations changed
+
+  Clearing the recipes of a tag or ingredient gives no ids afterwards, so
+  its recipes are flagged before they are cleared.
+  """
+  if not reverse:
+    if action != 'pre_clear':
+      similarity.mark_changed([instance.id])
+  elif action == 'pre_clear':
+    similarity.mark_changed(sender.objects.filter(**{
+        instance._meta.model_name: instance}).values('recipe_id'))
+  elif action != 'post_clear':
+    similarity.mark_changed(pk_set)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+  """Invalidate cached data when tags of a recipe change"""
+  if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+    return
+
+  _mark_similar_changed(sender, instance, action, reverse, pk_set)
+  if action != 'pre_clear':
+    _invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+  """Invalidate cached data when ingredients of a recipe change"""
+  if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+    return
+
+  _mark_similar_changed(sender, instance, action, reverse, pk_set)
+  if action == 'pre_clear':
+    return
+
+  if reverse:
+    _drop_index(instance.user_id)
+  else:
+    _invalidate(instance.user_id, recipe=instance)
@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.lazy import LazyModule
+from core.models import Recipe, SimilarRecipes
+
+# Loading this module for the signal handlers must not load numpy at
+# start up
+np = LazyModule('numpy')
+
+NEIGHBOR_DTYPE = [('id', '<i4'), ('score', '<f4')]
+
+
+def pack_neighbors(recipe_ids, scores):
+  """Pack neighbor ids and scores into the stored binary format"""
+  neighbors = np.empty(len(recipe_ids), dtype=NEIGHBOR_DTYPE)
+  neighbors['id'] = recipe_ids
+  neighbors['score'] = scores
+  return neighbors.tobytes()
+
+
+def unpack_neighbors(data):
+  """Return the (recipe id, score) pairs of packed neighbors"""
+  neighbors = np.frombuffer(bytes(data), dtype=NEIGHBOR_DTYPE)
+  return [(int(n['id']), float(n['score'])) for n in neighbors]
+
+
+def load_features(user_id):
+  """Return the recipe ids of a user and (recipe id, feature) pairs
+
+  Ingredients and tags are both features; they are told apart by the
+  lowest bit of the feature number.
+  """
+  recipe_ids = list(Recipe.objects.filter(user_id=user_id).order_by(
+      'id').values_list('id', flat=True))
+  ingredients = Recipe.ingredients.through.objects.filter(
+      recipe__user_id=user_id).values_list('recipe_id', 'ingredient_id')
+  tags = Recipe.tags.through.objects.filter(
+      recipe__user_id=user_id).values_list('recipe_id', 'tag_id')
+
+  pairs = [(r, i * 2) for r, i in ingredients]
+  pairs.extend((r, t * 2 + 1) for r, t in tags)
+
+  return recipe_ids, pairs
+
+
+def compute_neighbors(recipe_ids, pairs, count):
+  """Return the `count` most similar recipes of every recipe
+
+  Similarity is the Jaccard index of the features of two recipes. Only
+  recipes sharing a feature are compared, by walking the inverted lists of
+  the features of each recipe.
+  """
+  recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+  pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+  rows = np.searchsorted(recipe_ids, pairs[:, 0])
+  _, features = np.unique(pairs[:, 1], return_inverse=True)
+
+  sizes = np.bincount(rows, minlength=len(recipe_ids))
+  row_order = np.argsort(rows, kind='stable')
+  row_features = features[row_order]
+  row_starts = np.concatenate(([0], np.cumsum(sizes)))
+
+  feature_order = np.argsort(features, kind='stable')
+  postings = rows[feature_order]
+  posting_starts = np.concatenate(
+      ([0], np.cumsum(np.bincount(features))))
+
+  neighbors = {}
+  for row, recipe_id in enumerate(recipe_ids):
+    own = row_features[row_starts[row]:row_starts[row + 1]]
+    if not len(own):
+      neighbors[int(recipe_id)] = ([], [])
+      continue
+
+    candidates, shared = np.unique(np.concatenate(
+        [postings[posting_starts[f]:posting_starts[f + 1]] for f in own]),
+        return_counts=True)
+    others = candidates != row
+    candidates, shared = candidates[others], shared[others]
+    scores = shared / (sizes[row] + sizes[candidates] - shared)
+
+    if len(candidates) > count:
+      top = np.argpartition(-scores, count)[:count]
+      candidates, scores = candidates[top], scores[top]
+    order = np.lexsort((-recipe_ids[candidates], -scores))
+    neighbors[int(recipe_id)] = (
+        recipe_ids[candidates[order]], scores[order])
+
+  return neighbors
+
+
+def build_for_user(user_id, count):
+  """Recompute and store the similar recipes of all recipes of a user"""
+  started = timezone.now()
+  recipe_ids, pairs = load_features(user_id)
+  neighbors = compute_neighbors(recipe_ids, pairs, count)
+
+  with transaction.atomic():
+    existing = SimilarRecipes.objects.filter(recipe__user_id=user_id)
+    changed = dict(existing.values_list('recipe_id', 'changed_at'))
+    existing.delete()
+    SimilarRecipes.objects.bulk_create(
+        [SimilarRecipes(recipe_id=recipe_id,
+                        neighbors=pack_neighbors(ids, scores),
+                        built_at=started,
+                        changed_at=changed.get(recipe_id))
+         for recipe_id, (ids, scores) in neighbors.items()],
+        batch_size=1000)
+
+  return len(neighbors)
+
+
+def stale_user_ids():
+  """Return ids of users with recipes changed since their last build"""
+  return Recipe.objects.filter(
+      Q(similarrecipes__isnull=True) |
+      Q(similarrecipes__changed_at__gte=F('similarrecipes__built_at'))
+  ).order_by().values_list('user_id', flat=True).distinct()
+
+
+def mark_changed(recipe_ids):
+  """Flag the stored neighbors of recipes for the next incremental build
+
+  `recipe_ids` may be a queryset of ids, which is used as a subquery.
+  """
+  SimilarRecipes.objects.filter(recipe_id__in=recipe_ids).update(
+      changed_at=timezone.now())
+
+
+def similar_recipes(recipe, count):
+  """Return up to `count` (recipe id, score) pairs most similar to `recipe`
+
+  Recipes not seen by a build yet have no neighbors.
+  """
+  stored = SimilarRecipes.objects.filter(recipe=recipe).values_list(
+      'neighbors', flat=True).first()
+  if stored is None:
+    return []
+  return unpack_neighbors(stored)[:count]
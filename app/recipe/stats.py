@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (
+    Aggregate, Avg, Count, DecimalField, ExpressionWrapper, F, IntegerField)
+
+from core import metrics
+from core.models import Recipe
+from recipe import cache as recipe_cache
+
+
+class Median(Aggregate):
+  """PostgreSQL continuous median of an expression"""
+  function = 'PERCENTILE_CONT'
+  name = 'Median'
+  template = '%(function)s(0.5) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+
+def compute_stats(user):
+  """Compute recipe statistics for `user` with aggregate queries"""
+  recipes = Recipe.objects.filter(user=user)
+  summary = recipes.aggregate(
+      count=Count('id'),
+      average_price=Avg('price'),
+      median_price=Median(
+          'price', output_field=DecimalField(max_digits=7, decimal_places=2)),
+  )
+
+  width = settings.RECIPE_STATS_TIME_BUCKET
+  bucket = ExpressionWrapper(
+      F('time_minutes') / width * width, output_field=IntegerField())
+  histogram = recipes.annotate(bucket=bucket).values('bucket').annotate(
+      count=Count('id')).order_by('bucket')
+
+  top = settings.RECIPE_STATS_TOP_COUNT
+  top_tags = Recipe.tags.through.objects.filter(
+      tag__user=user).values('tag_id', 'tag__name').annotate(
+      count=Count('id')).order_by('-count', 'tag_id')[:top]
+  top_ingredients = Recipe.ingredients.through.objects.filter(
+      ingredient__user=user).values(
+      'ingredient_id', 'ingredient__name').annotate(
+      count=Count('id')).order_by('-count', 'ingredient_id')[:top]
+
+  return {
+      **summary,
+      'time_minutes_histogram': [
+          {'min_minutes': row['bucket'],
+           'max_minutes': row['bucket'] + width - 1,
+           'count': row['count']}
+          for row in histogram],
+      'top_tags': [
+          {'id': row['tag_id'], 'name': row['tag__name'],
+           'count': row['count']}
+          for row in top_tags],
+      'top_ingredients': [
+          {'id': row['ingredient_id'], 'name': row['ingredient__name'],
+           'count': row['count']}
+          for row in top_ingredients],
+  }
+
+
+def get_stats(user):
+  """Return recipe statistics for `user`, computing them on a cache miss
+
+  Without a shared cache they are computed every time, as a write through
+  another process would not invalidate them here.
+  """
+  if not settings.SHARED_CACHE:
+    return compute_stats(user)
+
+  key = recipe_cache.user_cache_key(user.id, 'stats')
+  stats = cache.get(key)
+  metrics.record_cache_lookup('stats', stats is not None)
+  if stats is None:
+    stats = compute_stats(user)
+    cache.set(key, stats, settings.RECIPE_STATS_CACHE_TIMEOUT)
+  return stats
@@ -0,0 +1,138 @@
+import contextlib
+from collections import OrderedDict
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from recipe import cache as recipe_cache
+
+RECIPES_URL = reverse('recipe:recipe-list')
+STATS_URL = reverse('recipe:recipe-stats')
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+
+
+class Process:
+  """Server process with memory of its own, using the cache at `location`
+
+  Processes given the same location share the cache as they would a
+  memcached.
+  """
+
+  def __init__(self, location):
+    self.cache = LocMemCache(location, {})
+    self.cache.clear()
+    self.indexes = OrderedDict()
+
+
+@contextlib.contextmanager
+def serving_from(process):
+  """Run the recipe code as `process` would"""
+  with patch('recipe.cache.cache', process.cache), \
+          patch('recipe.stats.cache', process.cache), \
+          patch('recipe.views.cache', process.cache), \
+          patch('recipe.cook._indexes', process.indexes):
+    yield
+
+
+class CacheAcrossProcessesTests(TransactionTestCase):
+  """Tests that a write through one server process is seen by another"""
+
+  def setUp(self):
+    self.client = APIClient()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client.force_authenticate(self.user)
+
+  def write_between_reads(self, url, reader, writer):
+    """Read `url` through `reader` before and after a recipe is added
+    through `writer`, returning the last response"""
+    with serving_from(reader):
+      self.client.get(url)
+    with serving_from(writer):
+      Recipe.objects.create(
+          user=self.user, title='Curry', time_minutes=10, price=5)
+    with serving_from(reader):
+      return self.client.get(url)
+
+  def test_stats_caches_per_process(self):
+    """Tests that statistics are not cached by processes with caches of
+    their own"""
+    reader, writer = Process('one'), Process('two')
+
+    res = self.write_between_reads(STATS_URL, reader, writer)
+
+    self.assertEqual(res.data['count'], 1)
+
+  @override_settings(SHARED_CACHE=True)
+  def test_stats_shared_cache(self):
+    """Tests that cached statistics are invalidated by writes through
+    another process sharing the cache"""
+    reader, writer = Process('shared'), Process('shared')
+
+    with serving_from(reader):
+      self.client.get(STATS_URL)
+      with self.assertNumQueries(0):
+        self.client.get(STATS_URL)
+    res = self.write_between_reads(STATS_URL, reader, writer)
+
+    self.assertEqual(res.data['count'], 1)
+
+  def test_cook_index_caches_per_process(self):
+    """Tests that ingredient indexes are not reused by processes with
+    caches of their own"""
+    reader, writer = Process('one'), Process('two')
+
+    res = self.write_between_reads(COOKABLE_URL, reader, writer)
+
+    self.assertEqual(len(res.data), 1)
+
+  @override_settings(SHARED_CACHE=True)
+  def test_cook_index_shared_cache(self):
+    """Tests that ingredient indexes are rebuilt after writes through
+    another process sharing the cache"""
+    reader, writer = Process('shared'), Process('shared')
+
+    res = self.write_between_reads(COOKABLE_URL, reader, writer)
+
+    self.assertEqual(len(res.data), 1)
+
+  def test_lists_caches_per_process(self):
+    """Tests that lists are not cached by processes with caches of their
+    own"""
+    reader, writer = Process('one'), Process('two')
+
+    res = self.write_between_reads(RECIPES_URL, reader, writer)
+
+    self.assertEqual(len(res.json()), 1)
+
+  @override_settings(SHARED_CACHE=True)
+  def test_lists_shared_cache(self):
+    """Tests that cached lists are invalidated by writes through another
+    process sharing the cache"""
+    reader, writer = Process('shared'), Process('shared')
+
+    res = self.write_between_reads(RECIPES_URL, reader, writer)
+
+    self.assertEqual(len(res.json()), 1)
+
+  @override_settings(SHARED_CACHE=True)
+  def test_invalidated_on_commit(self):
+    """Tests that cached data is invalidated once a write commits, so
+    that reads meanwhile do not cache data from before it as current"""
+    with serving_from(Process('shared')):
+      version = recipe_cache.get_user_version(self.user.id)
+      with transaction.atomic():
+        Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=10, price=5)
+        self.assertEqual(
+            recipe_cache.get_user_version(self.user.id), version)
+
+      self.assertGreater(
+          recipe_cache.get_user_version(self.user.id), version)
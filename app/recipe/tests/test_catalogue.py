@@ -0,0 +1,102 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from core.models import (
+    CanonicalIngredient, CanonicalTag, Ingredient, Recipe, Tag)
+from recipe import catalogue
+
+
+def create_user(email):
+  return get_user_model().objects.create_user(email=email, password='pass')
+
+
+class CatalogueTests(TestCase):
+  """Tests the catalogue shared by the tags and ingredients of all users"""
+
+  def setUp(self):
+    self.user = create_user('vinson@vinson.sg')
+    self.other = create_user('other@vinson.sg')
+
+  def test_names_share_entry(self):
+    """Tests that names differing in case and spacing are one entry"""
+    salt = Ingredient.objects.create(user=self.user, name='Sea  Salt')
+    other = Ingredient.objects.create(user=self.other, name=' sea salt')
+
+    self.assertEqual(salt.canonical, other.canonical)
+    self.assertEqual(salt.canonical.name, 'sea salt')
+    self.assertEqual(salt.name, 'Sea  Salt')
+
+    salt.name = 'Salt'
+    salt.save(update_fields=['name'])
+    salt.refresh_from_db()
+    self.assertEqual(salt.canonical.name, 'salt')
+
+  def test_existing_entries_not_rewritten(self):
+    """Tests that using an existing catalogue entry neither locks nor
+    rewrites its row"""
+    salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+    def version():
+      with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT ctid::text FROM core_canonicalingredient WHERE id = %s',
+            [salt.canonical_id])
+        return cursor.fetchone()
+
+    before = version()
+    Ingredient.objects.create(user=self.other, name='salt')
+
+    self.assertEqual(version(), before)
+
+  def test_existing_tags_not_rewritten(self):
+    """Tests that using an existing tag of the user neither locks nor
+    rewrites its row"""
+    vegan = Tag.objects.create(user=self.user, name='Vegan')
+
+    def version():
+      with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT ctid::text FROM core_tag WHERE id = %s', [vegan.id])
+        return cursor.fetchone()
+
+    before = version()
+    ids = catalogue.ids_for_names('tags', self.user.id, ['VEGAN', 'Dinner'])
+
+    self.assertEqual(version(), before)
+    self.assertEqual(
+        sorted(Tag.objects.filter(id__in=ids).values_list('name', flat=True)),
+        ['Dinner', 'Vegan'])
+
+  def test_backfill(self):
+    """Tests linking unlinked rows and merging a user's duplicates"""
+    chicken = Ingredient.objects.create(user=self.user, name='Chicken')
+    duplicate = Ingredient.objects.create(user=self.user, name='chicken ')
+    other = Ingredient.objects.create(user=self.other, name='CHICKEN')
+    first = Recipe.objects.create(
+        user=self.user, title='First', time_minutes=5, price=1)
+    first.ingredients.add(chicken, duplicate)
+    second = Recipe.objects.create(
+        user=self.user, title='Second', time_minutes=5, price=1)
+    second.ingredients.add(duplicate)
+    Ingredient.objects.update(canonical=None)
+    CanonicalIngredient.objects.all().delete()
+
+    out = StringIO()
+    call_command('backfill_catalogue', '--batch-size', '1', stdout=out)
+
+    self.assertEqual(
+        list(Ingredient.objects.order_by('id')), [chicken, other])
+    self.assertEqual(list(first.ingredients.all()), [chicken])
+    self.assertEqual(list(second.ingredients.all()), [chicken])
+    self.assertEqual(
+        list(CanonicalIngredient.objects.values_list('name', flat=True)),
+        ['chicken'])
+    self.assertEqual(
+        Ingredient.objects.filter(canonical__name='chicken').count(), 2)
+    self.assertFalse(CanonicalTag.objects.exists())
+    self.assertIn('ingredients: linked 3, merged 1 duplicates',
+                  out.getvalue())
@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Ingredient
+from recipe import cook
+from recipe.cook import IngredientIndex
+
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+
+
+def sample_recipe(user, **params):
+  """Creates and returns a sample recipe"""
+  defaults = {
+      'title': 'Sample Recipe Title',
+      'time_minutes': 10,
+      'price': 5.00
+  }
+  defaults.update(params)
+
+  return Recipe.objects.create(user=user, **defaults)
+
+
+class IngredientIndexTests(TestCase):
+  """Tests the ingredient index arrays"""
+
+  def test_match_subsets(self):
+    """Tests that recipes are matched when all ingredients are available"""
+    index = IngredientIndex(1, [1, 2, 3], [(1, 10), (1, 11), (2, 10)])
+
+    self.assertEqual(index.match([10, 11]), [(3, 0), (2, 0), (1, 0)])
+    self.assertEqual(index.match([10]), [(3, 0), (2, 0)])
+    self.assertEqual(index.match([10], max_missing=1),
+                     [(3, 0), (2, 0), (1, 1)])
+
+  def test_incremental_updates(self):
+    """Tests adding, changing and removing recipes"""
+    index = IngredientIndex(1, [1], [(1, 10)])
+
+    index.set_recipe(2, [10, 20])
+    for recipe_id in range(3, 40):
+      index.set_recipe(recipe_id, [100 + recipe_id])
+    index.set_recipe(1, [20])
+    index.remove_recipe(3)
+
+    self.assertEqual(index.match([20]), [(1, 0)])
+    self.assertEqual(index.match([10, 20])[:2], [(2, 0), (1, 0)])
+    self.assertNotIn(3, [r for r, _ in index.match([103])])
+    self.assertIn((39, 0), index.match([139]))
+
+
+class CookableApiTests(TransactionTestCase):
+  """Tests the what can I cook API"""
+
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client.force_authenticate(self.user)
+    self.chicken = Ingredient.objects.create(user=self.user, name='Chicken')
+    self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+    self.egg = Ingredient.objects.create(user=self.user, name='Egg')
+
+  def test_cookable_recipes(self):
+    """Tests that only recipes with available ingredients are returned"""
+    chicken_rice = sample_recipe(user=self.user, title='Chicken Rice')
+    chicken_rice.ingredients.add(self.chicken, self.rice)
+    omelette = sample_recipe(user=self.user, title='Omelette')
+    omelette.ingredients.add(self.egg)
+
+    res = self.client.get(
+        COOKABLE_URL, {'ingredients': f'{self.chicken.id},{self.rice.id}'})
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual([r['title'] for r in res.data], ['Chicken Rice'])
+
+    res = self.client.get(COOKABLE_URL, {
+        'ingredients': f'{self.chicken.id},{self.egg.id}', 'missing': 1})
+    self.assertEqual([r['title'] for r in res.data],
+                     ['Omelette', 'Chicken Rice'])
+
+  def test_index_follows_changes(self):
+    """Tests that the index is updated when recipes change"""
+    recipe = sample_recipe(user=self.user)
+    recipe.ingredients.add(self.chicken)
+    params = {'ingredients': f'{self.chicken.id}'}
+    self.assertEqual(len(self.client.get(COOKABLE_URL, params).data), 1)
+
+    recipe.ingredients.add(self.egg)
+    self.assertEqual(len(self.client.get(COOKABLE_URL, params).data), 0)
+
+    other = sample_recipe(user=self.user)
+    other.ingredients.add(self.chicken)
+    self.assertEqual(self.client.get(COOKABLE_URL, params).data[0]['id'],
+                     other.id)
+
+    other.delete()
+    self.assertEqual(self.client.get(COOKABLE_URL, params).data, [])
+
+  @override_settings(SHARED_CACHE=True)
+  def test_index_updated_in_place(self):
+    """Tests that writes update the cached index instead of dropping it"""
+    recipe = sample_recipe(user=self.user)
+    index = cook.get_index(self.user.id)
+
+    recipe.ingredients.add(self.chicken)
+
+    self.assertIs(cook.get_index(self.user.id), index)
+    self.assertEqual(index.match([self.chicken.id]), [(recipe.id, 0)])
+
+  @override_settings(SHARED_CACHE=True)
+  def test_index_kept_on_rollback(self):
+    """Tests that writes rolled back leave the cached index alone"""
+    recipe = sample_recipe(user=self.user)
+    recipe.ingredients.add(self.chicken)
+    chicken_id = self.chicken.id
+    index = cook.get_index(self.user.id)
+
+    with self.assertRaises(RuntimeError), transaction.atomic():
+      recipe.ingredients.add(self.egg)
+      self.chicken.delete()
+      raise RuntimeError
+
+    self.assertIs(cook.get_index(self.user.id), index)
+    self.assertEqual(index.match([chicken_id]), [(recipe.id, 0)])
+
+  def test_cookable_limited_to_user(self):
+    """Tests that recipes of other users are not returned"""
+    another_user = get_user_model().objects.create_user(
+        email='another@vinson.sg', password='password')
+    sample_recipe(user=another_user)
+
+    res = self.client.get(COOKABLE_URL)
+
+    self.assertEqual(res.data, [])
+
+  def test_cookable_invalid_ids(self):
+    """Tests that invalid ingredient ids are rejected"""
+    res = self.client.get(COOKABLE_URL, {'ingredients': 'chicken'})
+
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
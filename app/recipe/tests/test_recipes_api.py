@@ -1,3 +1,4 @@
+import json
 import tempfile
 import os
 
@@ -5,15 +6,27 @@ from PIL import Image
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core.models import Recipe, RecipeShare, Tag, Ingredient
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 RECIPES_URL = reverse('recipe:recipe-list')
+STATS_URL = reverse('recipe:recipe-stats')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+COPY_URL = reverse('recipe:recipe-copy')
+SHARES_URL = reverse('recipe:recipeshare-list')
+
+
+def share_url(share_id, action):
+  """Return the URL answering a share"""
+  return reverse(f'recipe:recipeshare-{action}', args=[share_id])
 
 
 def image_upload_url(recipe_id):
@@ -82,6 +95,48 @@ class PrivateRecipesApiTest(TestCase):
     self.assertEqual(res.data, serializer.data)
     self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+  @override_settings(LIST_STREAM_CHUNK_SIZE=2)
+  def test_retrieve_recipes_streamed(self):
+    """Tests that a streamed list matches the regular one, read with a
+    single query"""
+    tag = sample_tag(user=self.user)
+    chicken = sample_ingredient(user=self.user)
+    for title in ('Steak', 'Chicken Rice', 'Laksa'):
+      recipe = sample_recipe(user=self.user, title=title)
+      recipe.tags.add(tag)
+      recipe.ingredients.add(chicken)
+    recipe.tags.add(sample_tag(user=self.user, name='Vegan'))
+
+    # The list, setting the idle timeout and the server-side cursor
+    with self.assertNumQueries(4):
+      res = self.client.get(RECIPES_URL, {'stream': '1'})
+      content = b''.join(res.streaming_content)
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res['Content-Type'], 'application/json')
+    self.assertEqual(json.loads(content.decode()),
+                     json.loads(self.client.get(RECIPES_URL).content))
+
+  @override_settings(LIST_STREAM_IDLE_TIMEOUT=5)
+  def test_retrieve_recipes_streamed_idle_timeout(self):
+    """Tests that slow readers of a streamed list cannot keep its
+    transaction open indefinitely"""
+    sample_recipe(user=self.user)
+    res = self.client.get(RECIPES_URL, {'stream': '1'})
+    content = iter(res.streaming_content)
+    next(content)
+
+    with connection.cursor() as cursor:
+      cursor.execute('SHOW idle_in_transaction_session_timeout')
+      self.assertEqual(cursor.fetchone()[0], '5s')
+    list(content)
+
+  def test_retrieve_recipes_streamed_empty(self):
+    """Tests that a streamed list without recipes is an empty array"""
+    res = self.client.get(RECIPES_URL, {'stream': '1'})
+
+    self.assertEqual(b''.join(res.streaming_content), b'[]')
+
   def test_recipes_limited_to_user(self):
     """Tests retrieving recipes for user"""
     sample_recipe(user=self.user)
@@ -165,6 +220,45 @@ class PrivateRecipesApiTest(TestCase):
     self.assertIn(ingredient_1, ingredients)
     self.assertIn(ingredient_2, ingredients)
 
+  def test_create_recipe_with_names(self):
+    """Tests creating a recipe with tags and ingredients given by name,
+    reusing the ones the user has whatever their case"""
+    vegan = sample_tag(user=self.user, name='Vegan')
+    payload = {
+        'title': 'Tofu Curry',
+        'tag_names': ['vegan', 'Dinner', 'dinner'],
+        'ingredient_names': ['Tofu', 'Coconut Milk'],
+        'time_minutes': 30,
+        'price': 8.00
+    }
+    with CaptureQueriesContext(connection) as queries:
+      res = self.client.post(RECIPES_URL, payload, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertNotIn('tag_names', res.data)
+    recipe = Recipe.objects.get(id=res.data['id'])
+    self.assertEqual(
+        sorted(recipe.tags.values_list('name', flat=True)),
+        ['Dinner', 'Vegan'])
+    self.assertIn(vegan, recipe.tags.all())
+    self.assertEqual(
+        sorted(recipe.ingredients.values_list('name', flat=True)),
+        ['Coconut Milk', 'Tofu'])
+    self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+    self.assertLessEqual(len(queries), 17)
+
+  def test_update_recipe_with_names(self):
+    """Tests that tag names replace the tags of a recipe"""
+    recipe = sample_recipe(user=self.user)
+    recipe.tags.add(sample_tag(user=self.user, name='Lunch'))
+
+    res = self.client.patch(
+        detail_url(recipe.id), {'tag_names': ['Dinner']}, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(
+        list(recipe.tags.values_list('name', flat=True)), ['Dinner'])
+
 
 class RecipeImageUploadTests(TestCase):
 
@@ -197,3 +291,292 @@ class RecipeImageUploadTests(TestCase):
     url = image_upload_url(self.recipe.id)
     res = self.client.post(url, {'image': 'no image'}, format='multipart')
     self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeStatsApiTests(TransactionTestCase):
+  """Tests the recipe statistics API"""
+
+  def setUp(self):
+    cache.clear()
+    self.client = APIClient()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client.force_authenticate(self.user)
+
+  def test_stats_no_recipes(self):
+    """Tests statistics for a user without recipes"""
+    res = self.client.get(STATS_URL)
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.data['count'], 0)
+    self.assertIsNone(res.data['median_price'])
+    self.assertEqual(res.data['time_minutes_histogram'], [])
+
+  def test_stats(self):
+    """Tests the aggregated statistics of the user's recipes"""
+    vegan = sample_tag(user=self.user, name='Vegan')
+    dessert = sample_tag(user=self.user, name='Dessert')
+    chicken = sample_ingredient(user=self.user, name='Chicken')
+    recipe_1 = sample_recipe(user=self.user, time_minutes=5, price=2.00)
+    recipe_2 = sample_recipe(user=self.user, time_minutes=20, price=4.00)
+    recipe_3 = sample_recipe(user=self.user, time_minutes=25, price=9.00)
+    recipe_1.tags.add(vegan, dessert)
+    recipe_2.tags.add(vegan)
+    recipe_3.ingredients.add(chicken)
+    another_user = get_user_model().objects.create_user(
+        email='another@vinson.sg', password='password')
+    sample_recipe(user=another_user, price=100.00)
+
+    res = self.client.get(STATS_URL)
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.data['count'], 3)
+    self.assertEqual(res.data['average_price'], '5.00')
+    self.assertEqual(res.data['median_price'], '4.00')
+    self.assertEqual(
+        [(b['min_minutes'], b['count'])
+         for b in res.data['time_minutes_histogram']],
+        [(0, 1), (15, 2)])
+    self.assertEqual(
+        [(t['name'], t['count']) for t in res.data['top_tags']],
+        [('Vegan', 2), ('Dessert', 1)])
+    self.assertEqual(res.data['top_ingredients'][0]['name'], 'Chicken')
+
+  @override_settings(SHARED_CACHE=True)
+  def test_stats_cached_until_write(self):
+    """Tests that statistics are cached and invalidated on writes"""
+    recipe = sample_recipe(user=self.user)
+    self.client.get(STATS_URL)
+
+    with self.assertNumQueries(0):
+      res = self.client.get(STATS_URL)
+    self.assertEqual(res.data['count'], 1)
+
+    recipe.tags.add(sample_tag(user=self.user))
+    res = self.client.get(STATS_URL)
+    self.assertEqual(res.data['top_tags'][0]['count'], 1)
+
+    sample_recipe(user=self.user)
+    res = self.client.get(STATS_URL)
+    self.assertEqual(res.data['count'], 2)
+
+
+class ShoppingListApiTests(TestCase):
+  """Tests the shopping list API"""
+
+  def setUp(self):
+    self.client = APIClient()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client.force_authenticate(self.user)
+
+  def test_shopping_list(self):
+    """Tests that ingredients are deduplicated across recipes"""
+    chicken = sample_ingredient(user=self.user, name='Chicken')
+    rice = sample_ingredient(user=self.user, name='Rice')
+    egg = sample_ingredient(user=self.user, name='Egg')
+    recipe_1 = sample_recipe(user=self.user)
+    recipe_1.ingredients.add(chicken, rice)
+    recipe_2 = sample_recipe(user=self.user)
+    recipe_2.ingredients.add(rice, egg)
+    recipe_3 = sample_recipe(user=self.user)
+    recipe_3.ingredients.add(egg)
+
+    res = self.client.get(
+        SHOPPING_LIST_URL, {'recipes': f'{recipe_1.id},{recipe_2.id}'})
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(
+        [(i['name'], i['recipes']) for i in res.data],
+        [('Chicken', [recipe_1.id]),
+         ('Egg', [recipe_2.id]),
+         ('Rice', [recipe_1.id, recipe_2.id])])
+
+  def test_shopping_list_limited_to_user(self):
+    """Tests that other users' recipes are ignored"""
+    another_user = get_user_model().objects.create_user(
+        email='another@vinson.sg', password='password')
+    recipe = sample_recipe(user=another_user)
+    recipe.ingredients.add(sample_ingredient(user=another_user))
+
+    res = self.client.get(SHOPPING_LIST_URL, {'recipes': f'{recipe.id}'})
+
+    self.assertEqual(res.data, [])
+
+  def test_shopping_list_constant_queries(self):
+    """Tests that the number of queries does not grow with recipes"""
+    chicken = sample_ingredient(user=self.user)
+    recipes = [sample_recipe(user=self.user) for _ in range(20)]
+    for recipe in recipes:
+      recipe.ingredients.add(chicken)
+
+    for count in (1, 20):
+      ids = ','.join(str(recipe.id) for recipe in recipes[:count])
+      with self.assertNumQueries(1):
+        res = self.client.get(SHOPPING_LIST_URL, {'recipes': ids})
+      self.assertEqual(len(res.data[0]['recipes']), count)
+
+
+class RecipeCopyApiTests(TestCase):
+  """Tests copying recipes to the user and to other users"""
+
+  def setUp(self):
+    self.client = APIClient()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.other = get_user_model().objects.create_user(
+        email='other@vinson.sg', password='password')
+    self.client.force_authenticate(self.user)
+
+  def share(self, recipes, recipient):
+    """Share recipes with the recipient, who then accepts them"""
+    res = self.client.post(COPY_URL, {
+        'recipes': [recipe.id for recipe in recipes],
+        'recipient': recipient}, format='json')
+    self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+
+    client = APIClient()
+    client.force_authenticate(self.other)
+    share_id = client.get(SHARES_URL).data[0]['id']
+    return client.post(share_url(share_id, 'accept'))
+
+  def test_copy_recipes_to_self(self):
+    """Tests that copies keep the fields, tags and ingredients"""
+    recipe = sample_recipe(user=self.user, title='Curry', link='x.sg')
+    recipe.tags.add(sample_tag(user=self.user))
+    recipe.ingredients.add(sample_ingredient(user=self.user))
+
+    res = self.client.post(COPY_URL, {'recipes': [recipe.id]}, format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    copy = Recipe.objects.get(id=res.data[0]['copy'])
+    self.assertEqual(res.data[0]['recipe'], recipe.id)
+    self.assertNotEqual(copy.id, recipe.id)
+    self.assertEqual(
+        RecipeSerializer(copy).data,
+        dict(RecipeSerializer(recipe).data, id=copy.id))
+    self.assertEqual(Tag.objects.count(), 1)
+    self.assertEqual(Ingredient.objects.count(), 1)
+
+  @override_settings(RECIPE_COPY_BATCH_SIZE=2)
+  def test_copy_recipes_to_other_user(self):
+    """Tests that the recipient's tags and ingredients are used, matching
+    names in any case, and the ones they lack are created"""
+    vegan = sample_tag(user=self.user, name='Vegan')
+    dinner = sample_tag(user=self.user, name='Dinner')
+    salt = sample_ingredient(user=self.user, name='Salt')
+    their_vegan = sample_tag(user=self.other, name='VEGAN')
+    recipes = [sample_recipe(user=self.user, title=str(i)) for i in range(5)]
+    for recipe in recipes:
+      recipe.tags.add(vegan, dinner)
+      recipe.ingredients.add(salt)
+
+    res = self.share(recipes, 'Other@vinson.sg')
+
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    self.assertEqual([pair['recipe'] for pair in res.data],
+                     [recipe.id for recipe in recipes])
+    copies = Recipe.objects.filter(user=self.other).order_by('id')
+    self.assertEqual([copy.title for copy in copies],
+                     [str(i) for i in range(5)])
+    their_dinner = Tag.objects.get(user=self.other, name='Dinner')
+    their_salt = Ingredient.objects.get(user=self.other, name='Salt')
+    self.assertEqual(their_dinner.canonical_id, dinner.canonical_id)
+    for copy in copies:
+      self.assertEqual(set(copy.tags.all()), {their_vegan, their_dinner})
+      self.assertEqual(list(copy.ingredients.all()), [their_salt])
+    self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+
+  def test_copy_recipes_share_image(self):
+    """Tests that copies refer to the image file of their recipe"""
+    recipe = sample_recipe(user=self.user, image='uploads/recipe/a.jpg')
+
+    res = self.share([recipe], self.other.email)
+
+    copy = Recipe.objects.get(id=res.data[0]['copy'])
+    self.assertEqual(copy.image.name, 'uploads/recipe/a.jpg')
+
+  def test_copy_recipes_constant_queries(self):
+    """Tests that the number of queries does not grow with recipes"""
+    tag = sample_tag(user=self.user)
+    recipes = [sample_recipe(user=self.user) for _ in range(20)]
+    for recipe in recipes:
+      recipe.tags.add(tag)
+
+    for count in (1, 20):
+      ids = [recipe.id for recipe in recipes[:count]]
+      with CaptureQueriesContext(connection) as queries:
+        res = self.client.post(COPY_URL, {'recipes': ids}, format='json')
+      self.assertEqual(len(res.data), count)
+      if count == 1:
+        expected = len(queries)
+    self.assertEqual(len(queries), expected)
+
+  def test_copy_recipes_invalid(self):
+    """Tests that recipes of other users are rejected without copying
+    anything"""
+    mine = sample_recipe(user=self.user)
+    theirs = sample_recipe(user=self.other)
+
+    res = self.client.post(
+        COPY_URL, {'recipes': [mine.id, theirs.id]}, format='json')
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn(str(theirs.id), str(res.data['recipes']))
+    self.assertEqual(Recipe.objects.count(), 2)
+
+  def test_share_waits_for_recipient(self):
+    """Tests that shared recipes are only copied once accepted, and are
+    listed to the recipient alone"""
+    recipe = sample_recipe(user=self.user, title='Curry')
+
+    res = self.client.post(COPY_URL, {
+        'recipes': [recipe.id], 'recipient': self.other.email},
+        format='json')
+
+    self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+    self.assertFalse(Recipe.objects.filter(user=self.other).exists())
+    self.assertEqual(self.client.get(SHARES_URL).data, [])
+    client = APIClient()
+    client.force_authenticate(self.other)
+    res = client.get(SHARES_URL)
+    self.assertEqual(len(res.data), 1)
+    self.assertEqual(res.data[0]['sender'], self.user.email)
+    self.assertEqual(res.data[0]['recipes'], [recipe.id])
+
+  def test_share_unknown_recipient(self):
+    """Tests that sharing answers the same whether or not the email has
+    an account"""
+    recipe = sample_recipe(user=self.user)
+
+    responses = [self.client.post(COPY_URL, {
+        'recipes': [recipe.id], 'recipient': email}, format='json')
+        for email in (self.other.email, 'nobody@vinson.sg')]
+
+    self.assertEqual(
+        [(res.status_code, res.content) for res in responses[1:]],
+        [(responses[0].status_code, responses[0].content)])
+    self.assertEqual(RecipeShare.objects.get().recipient, self.other)
+
+  def test_answer_share_once(self):
+    """Tests that shares are answered once, by their recipient only"""
+    recipe = sample_recipe(user=self.user)
+    share = RecipeShare.objects.create(
+        sender=self.user, recipient=self.other, recipe_ids=[recipe.id])
+    declined = RecipeShare.objects.create(
+        sender=self.user, recipient=self.other, recipe_ids=[recipe.id])
+    client = APIClient()
+    client.force_authenticate(self.other)
+
+    res = self.client.post(share_url(share.id, 'accept'))
+    self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+    res = client.post(share_url(declined.id, 'decline'))
+    self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+    res = client.post(share_url(declined.id, 'accept'))
+    self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+    res = client.post(share_url(share.id, 'accept'))
+    self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+    res = client.post(share_url(share.id, 'accept'))
+    self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    self.assertEqual(Recipe.objects.filter(user=self.other).count(), 1)
+    self.assertEqual(client.get(SHARES_URL).data, [])
@@ -0,0 +1,137 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, SimilarRecipes, Tag
+from recipe import similarity
+
+
+def similar_url(recipe_id):
+  """Return similar recipes URL"""
+  return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+def sample_recipe(user, **params):
+  """Creates and returns a sample recipe"""
+  defaults = {
+      'title': 'Sample Recipe Title',
+      'time_minutes': 10,
+      'price': 5.00
+  }
+  defaults.update(params)
+
+  return Recipe.objects.create(user=user, **defaults)
+
+
+class ComputeNeighborsTests(TestCase):
+  """Tests computing similar recipes"""
+
+  def test_jaccard_neighbors(self):
+    """Tests that neighbors are ranked by Jaccard similarity"""
+    pairs = [(1, 10), (1, 11), (1, 12),
+             (2, 10), (2, 11), (2, 12),
+             (3, 10), (3, 13),
+             (4, 99)]
+
+    neighbors = similarity.compute_neighbors([1, 2, 3, 4], pairs, 2)
+
+    ids, scores = neighbors[1]
+    self.assertEqual(list(ids), [2, 3])
+    self.assertAlmostEqual(scores[0], 1.0)
+    self.assertAlmostEqual(scores[1], 0.25)
+    self.assertEqual(len(neighbors[4][0]), 0)
+
+  def test_pack_round_trip(self):
+    """Tests that packed neighbors are unpacked unchanged"""
+    data = similarity.pack_neighbors([3, 7], [0.5, 0.25])
+
+    self.assertEqual(similarity.unpack_neighbors(data),
+                     [(3, 0.5), (7, 0.25)])
+
+
+class SimilarRecipesApiTests(TestCase):
+  """Tests the similar recipes API"""
+
+  def setUp(self):
+    self.client = APIClient()
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.client.force_authenticate(self.user)
+    chicken = Ingredient.objects.create(user=self.user, name='Chicken')
+    rice = Ingredient.objects.create(user=self.user, name='Rice')
+    vegan = Tag.objects.create(user=self.user, name='Vegan')
+
+    self.chicken_rice = sample_recipe(user=self.user, title='Chicken Rice')
+    self.chicken_rice.ingredients.add(chicken, rice)
+    self.fried_rice = sample_recipe(user=self.user, title='Fried Rice')
+    self.fried_rice.ingredients.add(rice)
+    self.salad = sample_recipe(user=self.user, title='Salad')
+    self.salad.tags.add(vegan)
+
+  def build(self, *args):
+    call_command('build_similar_recipes', *args, stdout=StringIO())
+
+  def test_similar_recipes(self):
+    """Tests retrieving the precomputed similar recipes"""
+    self.build()
+
+    res = self.client.get(similar_url(self.chicken_rice.id))
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual([r['title'] for r in res.data], ['Fried Rice'])
+    self.assertEqual(res.data[0]['similarity'], 0.5)
+
+  def test_not_built_yet(self):
+    """Tests that recipes without stored neighbors have none"""
+    res = self.client.get(similar_url(self.salad.id))
+
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertEqual(res.data, [])
+
+  def test_incremental_build(self):
+    """Tests that only users with changed recipes are rebuilt"""
+    self.build()
+    self.assertEqual(list(similarity.stale_user_ids()), [])
+
+    self.salad.ingredients.add(
+        Ingredient.objects.create(user=self.user, name='Lettuce'))
+    self.assertEqual(list(similarity.stale_user_ids()), [self.user.id])
+
+    self.build()
+    self.assertEqual(list(similarity.stale_user_ids()), [])
+    self.assertEqual(SimilarRecipes.objects.count(), 3)
+
+  def test_reverse_changes_mark_recipes(self):
+    """Tests that changing the recipes of an ingredient or tag flags
+    them, clearing included, with one update"""
+    rice = Ingredient.objects.get(name='Rice')
+    vegan = Tag.objects.get(name='Vegan')
+    self.build()
+
+    rice.recipe_set.clear()
+    self.assertEqual(
+        set(SimilarRecipes.objects.filter(changed_at__isnull=False)
+            .values_list('recipe_id', flat=True)),
+        {self.chicken_rice.id, self.fried_rice.id})
+
+    self.build()
+    # Existing links, the insert and a single update of both recipes
+    with self.assertNumQueries(3):
+      vegan.recipe_set.add(self.chicken_rice, self.fried_rice)
+    self.assertEqual(list(similarity.stale_user_ids()), [self.user.id])
+
+  def test_similar_limited_to_user(self):
+    """Tests that other users' recipes cannot be queried"""
+    another_user = get_user_model().objects.create_user(
+        email='another@vinson.sg', password='password')
+    recipe = sample_recipe(user=another_user)
+
+    res = self.client.get(similar_url(recipe.id))
+
+    self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,3 +1,5 @@
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import TestCase
@@ -79,3 +81,23 @@ class PrivateTagsApiTest(TestCase):
 
     self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
     self.assertFalse(exists)
+
+  def test_create_tag_duplicate_name(self):
+    """Test that a tag named like another of the user's is rejected"""
+    Tag.objects.create(user=self.user, name='Vegan')
+    res = self.client.post(TAGS_URL, {'name': 'vegan'})
+
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_create_tag_duplicate_name_concurrently(self):
+    """Test that a tag saved by a concurrent request after the name was
+    checked is rejected rather than failing"""
+    Tag.objects.create(user=self.user, name='Vegan')
+
+    with patch.object(
+            TagSerializer, 'validate_name', lambda self, value: value):
+      res = self.client.post(TAGS_URL, {'name': 'vegan'})
+
+    self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertIn('name', res.data)
+    self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
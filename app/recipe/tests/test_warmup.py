@@ -0,0 +1,89 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from recipe import cook, warmup
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def create_user(email, last_login=None):
+  user = get_user_model().objects.create_user(email=email, password='pass')
+  get_user_model().objects.filter(id=user.id).update(last_login=last_login)
+  Tag.objects.create(user=user, name='Vegan')
+  Recipe.objects.create(user=user, title='Curry', time_minutes=5, price=1)
+  return user
+
+
+class WarmUpTests(TransactionTestCase):
+  """Tests filling caches of recently active users"""
+
+  def setUp(self):
+    cache.clear()
+    self.active = create_user('vinson@vinson.sg', timezone.now())
+    self.inactive = create_user(
+        'other@vinson.sg', timezone.now() - timedelta(days=30))
+
+  def test_token_use_marks_activity(self):
+    """Tests that using a token records when the user was last active"""
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.inactive)}')
+
+    client.get(TAGS_URL)
+    self.inactive.refresh_from_db()
+
+    self.assertGreater(
+        self.inactive.last_login, timezone.now() - timedelta(minutes=1))
+    self.assertEqual(warmup.active_users(7), [self.inactive, self.active])
+
+  @override_settings(SHARED_CACHE=True)
+  def test_warm_caches(self):
+    """Tests that lists of active users are then served from the cache"""
+    out = StringIO()
+    call_command('warm_caches', '--concurrency', '2',
+                 '--max-queries-per-second', '1000', stdout=out)
+
+    self.assertIn('Warmed 1 of 1 users', out.getvalue())
+    for user, cached in ((self.active, True), (self.inactive, False)):
+      client = APIClient()
+      client.force_authenticate(user)
+      for url in (RECIPES_URL, TAGS_URL):
+        res = client.get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(hasattr(res, 'data'), not cached)
+
+  def test_warm_caches_without_shared_cache(self):
+    """Tests that caches are not warmed where the server cannot see them"""
+    with self.assertRaisesRegex(CommandError, 'CACHE_LOCATION'):
+      call_command('warm_caches', stdout=StringIO())
+
+  @override_settings(SHARED_CACHE=True)
+  def test_warm_worker(self):
+    """Tests that workers build indexes of active users"""
+    cook.drop_index(self.active.id)
+
+    warmup.warm_worker()
+
+    self.assertIn(self.active.id, cook._indexes)
+    self.assertNotIn(self.inactive.id, cook._indexes)
+
+  def test_warm_worker_without_shared_cache(self):
+    """Tests that workers do not build indexes they would not keep"""
+    cook.drop_index(self.active.id)
+
+    warmup.warm_worker()
+
+    self.assertNotIn(self.active.id, cook._indexes)
@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register('tags', views.TagViewSet)
 router.register('ingredients', views.IngredientViewSet)
 router.register('recipes', views.RecipeViewSet)
+router.register('shares', views.RecipeShareViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
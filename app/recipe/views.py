@@ -1,15 +1,123 @@
+import hashlib
+
 from django import views
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
+from django.db import models
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from core.models import Tag, Ingredient, Recipe
-from recipe import serializers
+from core import compression, metrics, streaming
+from core.authentication import TokenAuthentication
+from core.idempotency import idempotent
+from core.models import Tag, Ingredient, Recipe, RecipeShare
+from recipe import cache as recipe_cache
+from recipe import cook, serializers, sharing, similarity, stats
+
+
+def _params_to_ints(qs, name):
+  """Convert a comma separated query parameter to a list of integers"""
+  try:
+    return [int(str_id) for str_id in qs.split(',') if str_id]
+  except ValueError:
+    raise ValidationError({name: 'Expected a comma separated list of ids'})
+
+
+def _related_ids(relation):
+  """Return an expression for the sorted ids a many to many relation of
+  recipes holds for each recipe"""
+  field = relation.field
+  return RawSQL(
+      f'ARRAY(SELECT {field.m2m_reverse_name()} '
+      f'FROM {relation.through._meta.db_table} '
+      f'WHERE {field.m2m_column_name()} = {Recipe._meta.db_table}.id '
+      f'ORDER BY 1)', (), output_field=ArrayField(models.IntegerField()))
+
+
+class CachedListMixin:
+  """Serve JSON lists from a cache of the current version of user data
+
+  Compressed variants are cached alongside the list so that a hot list is
+  compressed once rather than on every request. Lists are only cached
+  with a shared cache, as a write through another process would not
+  invalidate them otherwise.
+  """
+
+  def list(self, request, *args, **kwargs):
+    if (not settings.SHARED_CACHE or
+            request.accepted_renderer.format != 'json'):
+      return super().list(request, *args, **kwargs)
+
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    key = recipe_cache.user_cache_key(
+        request.user.id, f'list:{self.basename}:{query}')
+    cached = cache.get(key)
+    metrics.record_cache_lookup(f'{self.basename}_list', cached is not None)
+    if cached is not None:
+      content_type, variants = cached
+      return compression.use_variant(
+          HttpResponse(content_type=content_type), request, variants)
+
+    response = super().list(request, *args, **kwargs)
+
+    def store(response):
+      variants = compression.variants(response.content)
+      cache.set(key, (response['Content-Type'], variants),
+                settings.RECIPE_LIST_CACHE_TIMEOUT)
+      compression.use_variant(response, request, variants)
 
+    response.add_post_render_callback(store)
+    return response
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixins.CreateModelMixin):
+
+class StreamingListMixin:
+  """Stream JSON lists asked for with `?stream=1`, for consumers reading
+  every row of large lists
+
+  Rows from get_stream_rows are sent chunk by chunk, see core.streaming.
+  Streamed lists are neither cached nor compressed, nor can they be read
+  through a batch.
+  """
+  # Row keys of fields that are not columns, see get_stream_rows
+  stream_sources = {}
+
+  def get_stream_rows(self, queryset, keys):
+    """Return `queryset` as rows holding `keys`"""
+    return queryset.values(*keys)
+
+  def list(self, request, *args, **kwargs):
+    if (request.query_params.get('stream') != '1' or
+            request.accepted_renderer.format != 'json'):
+      return super().list(request, *args, **kwargs)
+
+    serializer = self.get_serializer()
+    keys = [key for _, key, _ in streaming.row_fields(
+        serializer, self.stream_sources)]
+    rows = self.get_stream_rows(
+        self.filter_queryset(self.get_queryset()), keys)
+    return StreamingHttpResponse(streaming.json_array(
+        rows, serializer, settings.LIST_STREAM_CHUNK_SIZE,
+        self.stream_sources, settings.LIST_STREAM_IDLE_TIMEOUT),
+        content_type='application/json')
+
+
+def _copy_response(pairs):
+  """Return the response listing the (recipe id, copy id) pairs"""
+  result = serializers.RecipeCopyResultSerializer(
+      [{'recipe': recipe_id, 'copy': copy_id}
+       for recipe_id, copy_id in pairs], many=True)
+  return Response(result.data, status=status.HTTP_201_CREATED)
+
+
+class BaseRecipeAttrViewSet(CachedListMixin, viewsets.GenericViewSet,
+                            mixins.ListModelMixin, mixins.CreateModelMixin):
   """Base viewset for user owned recipe attributes"""
   authentication_classes = (TokenAuthentication,)
   permission_classes = (IsAuthenticated,)
@@ -18,6 +126,11 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixi
     """Return objects for the current authenticated user only"""
     return self.queryset.filter(user=self.request.user).order_by('-name')
 
+  @idempotent
+  def create(self, request, *args, **kwargs):
+    """Creates new object, replaying retries with the same key"""
+    return super().create(request, *args, **kwargs)
+
   def perform_create(self, serializer):
     """Creates new object"""
     serializer.save(user=self.request.user)
@@ -35,12 +148,16 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
   serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(StreamingListMixin, CachedListMixin,
+                    viewsets.ModelViewSet):
   """Manage recipes in the database"""
   serializer_class = serializers.RecipeSerializer
   queryset = Recipe.objects.all()
+  stream_sources = {'ingredients': 'ingredient_ids', 'tags': 'tag_ids'}
   authentication_classes = (TokenAuthentication,)
   permission_classes = (IsAuthenticated, )
+  # Set by actions with a budget of their own
+  throttle_scope = None
 
   def get_queryset(self):
     return self.queryset.filter(user=self.request.user).order_by('-id')
@@ -51,14 +168,124 @@ class RecipeViewSet(viewsets.ModelViewSet):
       return serializers.RecipeDetailSerializer
     elif self.action == 'upload_image':
       return serializers.RecipeImageSerializer
+    elif self.action == 'stats':
+      return serializers.RecipeStatsSerializer
+    elif self.action == 'similar':
+      return serializers.SimilarRecipeSerializer
+    elif self.action == 'shopping_list':
+      return serializers.ShoppingListItemSerializer
+    elif self.action == 'copy':
+      return serializers.RecipeCopySerializer
 
     return self.serializer_class
 
+  def get_stream_rows(self, queryset, keys):
+    """Return recipes as rows with the ids of their ingredients and tags,
+    which the database gathers row by row so that nothing is prefetched"""
+    return queryset.annotate(
+        ingredient_ids=_related_ids(Recipe.ingredients),
+        tag_ids=_related_ids(Recipe.tags)).values(*keys)
+
+  @idempotent
+  def create(self, request, *args, **kwargs):
+    """Create a new recipe, replaying retries with the same key"""
+    return super().create(request, *args, **kwargs)
+
   def perform_create(self, serializer):
     """Create a new recipe"""
     serializer.save(user=self.request.user)
 
-  @action(methods=['POST'], detail=True, url_path='upload-image')
+  @action(methods=['GET'], detail=False)
+  def stats(self, request):
+    """Return statistics over the user's recipes"""
+    serializer = self.get_serializer(stats.get_stats(request.user))
+    return Response(serializer.data)
+
+  @action(methods=['GET'], detail=False)
+  def cookable(self, request):
+    """Return recipes that can be made from the given ingredients"""
+    ingredient_ids = _params_to_ints(
+        request.query_params.get('ingredients', ''), 'ingredients')
+    try:
+      max_missing = int(request.query_params.get('missing', 0))
+    except ValueError:
+      raise ValidationError({'missing': 'Expected an integer'})
+
+    matches = cook.find_cookable(request.user.id, ingredient_ids, max_missing)
+    recipes = self.get_queryset().filter(
+        id__in=[recipe_id for recipe_id, _ in matches]).prefetch_related(
+        'ingredients', 'tags').in_bulk()
+
+    serializer = self.get_serializer(
+        [recipes[recipe_id] for recipe_id, _ in matches
+         if recipe_id in recipes], many=True)
+    return Response(serializer.data)
+
+  @action(methods=['GET'], detail=True)
+  def similar(self, request, pk=None):
+    """Return the recipes sharing the most ingredients and tags"""
+    try:
+      count = int(request.query_params.get(
+          'limit', settings.RECIPE_SIMILAR_COUNT))
+    except ValueError:
+      raise ValidationError({'limit': 'Expected an integer'})
+
+    count = max(min(count, settings.RECIPE_SIMILAR_COUNT), 0)
+    neighbors = similarity.similar_recipes(self.get_object(), count)
+    recipes = self.get_queryset().filter(
+        id__in=[recipe_id for recipe_id, _ in neighbors]).prefetch_related(
+        'ingredients', 'tags').in_bulk()
+
+    similar = []
+    for recipe_id, score in neighbors:
+      if recipe_id in recipes:
+        recipes[recipe_id].similarity = round(score, 4)
+        similar.append(recipes[recipe_id])
+
+    serializer = self.get_serializer(similar, many=True)
+    return Response(serializer.data)
+
+  @action(methods=['GET'], detail=False, url_path='shopping-list')
+  def shopping_list(self, request):
+    """Return the ingredients needed by the given recipes"""
+    recipe_ids = _params_to_ints(
+        request.query_params.get('recipes', ''), 'recipes')
+    rows = Recipe.ingredients.through.objects.filter(
+        recipe__user=request.user, recipe_id__in=recipe_ids).values(
+        'ingredient_id', 'ingredient__name').annotate(
+        recipes=ArrayAgg('recipe_id')).order_by(
+        'ingredient__name', 'ingredient_id')
+
+    serializer = self.get_serializer([
+        {'id': row['ingredient_id'],
+         'name': row['ingredient__name'],
+         'recipes': sorted(row['recipes'])}
+        for row in rows], many=True)
+    return Response(serializer.data)
+
+  @action(methods=['POST'], detail=False)
+  @idempotent
+  def copy(self, request):
+    """Copy recipes to the user along with their tags, ingredients and
+    image, or offer them to the user with the given email
+
+    Offers are answered with 202 whether or not the email has an account.
+    """
+    serializer = self.get_serializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    recipes = serializer.validated_data['recipes']
+    recipient = serializer.validated_data.get('recipient', request.user)
+    if recipient != request.user:
+      sharing.share_recipes(recipes, request.user, recipient)
+      return Response(status=status.HTTP_202_ACCEPTED)
+
+    return _copy_response(sharing.copy_recipes(
+        recipes, request.user.id, request.user.id,
+        settings.RECIPE_COPY_BATCH_SIZE))
+
+  @action(methods=['POST'], detail=True, url_path='upload-image',
+          throttle_scope='upload')
+  @idempotent
   def upload_image(self, request, pk=None):
     """Upload an image to a recipe"""
     recipe = self.get_object()
@@ -75,3 +302,32 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.errors,
         status=status.HTTP_400_BAD_REQUEST
     )
+
+
+class RecipeShareViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
+  """Recipes offered to the user by others, copied once accepted"""
+  serializer_class = serializers.RecipeShareSerializer
+  queryset = RecipeShare.objects.all()
+  authentication_classes = (TokenAuthentication,)
+  permission_classes = (IsAuthenticated,)
+
+  def get_queryset(self):
+    return self.queryset.filter(
+        recipient=self.request.user,
+        status=RecipeShare.PENDING).select_related('sender').order_by('-id')
+
+  @action(methods=['POST'], detail=True)
+  def accept(self, request, pk=None):
+    """Copy the shared recipes to the user"""
+    pairs = sharing.accept_share(
+        self.get_object(), settings.RECIPE_COPY_BATCH_SIZE)
+    if pairs is None:
+      raise NotFound()
+    return _copy_response(pairs)
+
+  @action(methods=['POST'], detail=True)
+  def decline(self, request, pk=None):
+    """Decline the share without copying anything"""
+    if not sharing.decline_share(self.get_object()):
+      raise NotFound()
+    return Response(status=status.HTTP_204_NO_CONTENT)
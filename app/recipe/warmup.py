@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from recipe import cook, stats
+
+# Lists whose cached responses are filled for every warmed user
+LIST_URLS = ('recipe:recipe-list', 'recipe:tag-list', 'recipe:ingredient-list')
+
+
+def active_users(days, limit=None):
+  """Return users who used the API in the last `days` days, most recently
+  active first"""
+  since = timezone.now() - timedelta(days=days)
+  users = get_user_model().objects.filter(
+      is_active=True, last_login__gte=since).order_by('-last_login')
+  return list(users[:limit] if limit else users)
+
+
+class QueryRateLimiter:
+  """Database execute wrapper spacing out the queries of every thread
+  using it to at most `rate` per second"""
+
+  def __init__(self, rate):
+    self.interval = 1 / rate
+    self.next = time.monotonic()
+    self.lock = threading.Lock()
+
+  def __call__(self, execute, sql, params, many, context):
+    with self.lock:
+      now = time.monotonic()
+      start = self.next = max(now, self.next)
+      self.next += self.interval
+    if start > now:
+      time.sleep(start - now)
+    return execute(sql, params, many, context)
+
+
+def warm_user(user):
+  """Fill the cached lists and statistics of a user
+
+  The lists are rendered by their views, so that they are cached under
+  the same keys as when the user asks for them.
+  """
+  factory = APIRequestFactory()
+  for name in LIST_URLS:
+    path = reverse(name)
+    request = factory.get(path, HTTP_ACCEPT='application/json')
+    force_authenticate(request, user)
+    response = resolve(path).func(request)
+    response.render()
+  stats.get_stats(user)
+
+
+def warm_users(users, concurrency=4, max_queries_per_second=None,
+               on_warmed=None):
+  """Warm the caches of `users` from `concurrency` threads
+
+  With `max_queries_per_second`, the queries of all threads together are
+  kept under that rate. `on_warmed` is called with every user warmed, or
+  with the user and the exception when warming failed.
+  """
+  pending = iter(users)
+  lock = threading.Lock()
+  limiter = (QueryRateLimiter(max_queries_per_second)
+             if max_queries_per_second else None)
+
+  def worker():
+    try:
+      while True:
+        with lock:
+          user = next(pending, None)
+        if user is None:
+          return
+        try:
+          if limiter is not None:
+            with connection.execute_wrapper(limiter):
+              warm_user(user)
+          else:
+            warm_user(user)
+        except Exception as e:
+          if on_warmed is not None:
+            on_warmed(user, e)
+        else:
+          if on_warmed is not None:
+            on_warmed(user)
+    finally:
+      connection.close()
+
+  threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+
+def warm_worker():
+  """Prepare a server worker before it accepts requests
+
+  Runs the list views once for the most recently active user so that
+  their code paths are loaded, and builds the in-process ingredient
+  indexes of the WARM_UP_COOK_INDEXES most recently active users. Indexes
+  are only kept with a shared cache, so they are not built without one.
+  """
+  users = active_users(settings.WARM_UP_DAYS,
+                       max(settings.WARM_UP_COOK_INDEXES, 1))
+  if users:
+    warm_user(users[0])
+  if not settings.SHARED_CACHE:
+    return
+  for user in users[:settings.WARM_UP_COOK_INDEXES]:
+    cook.get_index(user.id)
@@ -0,0 +1,149 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core.models import (
+    IdempotencyKey, Ingredient, Recipe, SimilarRecipes, Tag, UserDeletion)
+from recipe import cache, cook
+
+logger = logging.getLogger(__name__)
+
+
+def request_deletion(user):
+  """Deactivate `user` and their tokens now and queue deleting their data"""
+  with transaction.atomic():
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    Token.objects.filter(user=user).delete()
+    job, _ = UserDeletion.objects.get_or_create(user_id=user.id)
+  return job
+
+
+def claim(stale_after):
+  """Return the next deletion to run, marked as running, or None
+
+  Running deletions that made no progress for `stale_after` seconds are
+  taken over, as their worker is assumed to have died.
+  """
+  stale = timezone.now() - timedelta(seconds=stale_after)
+  with transaction.atomic():
+    job = UserDeletion.objects.select_for_update(skip_locked=True).filter(
+        Q(status=UserDeletion.PENDING) |
+        Q(status=UserDeletion.RUNNING, updated_at__lt=stale)).order_by(
+        'id').first()
+    if job is not None:
+      job.status = UserDeletion.RUNNING
+      job.save(update_fields=['status', 'updated_at'])
+  return job
+
+
+def _batches(queryset, batch_size, *fields):
+  """Yield the first `batch_size` rows of `queryset` until it is empty"""
+  while True:
+    rows = list(queryset.order_by('id').values_list(*fields)[:batch_size])
+    if not rows:
+      return
+    yield rows
+
+
+def _delete_rows(model, ids):
+  """Delete rows by id without loading them or sending signals"""
+  with connection.cursor() as cursor:
+    cursor.execute(
+        f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} '
+        f'WHERE id = ANY(%s)', [ids])
+    return cursor.rowcount
+
+
+def _delete_files(names):
+  """Delete stored images, returning how many were deleted"""
+  storage = Recipe._meta.get_field('image').storage
+  deleted = 0
+  for name in names:
+    try:
+      storage.delete(name)
+      deleted += 1
+    except OSError:
+      logger.exception('Could not delete %s', name)
+  return deleted
+
+
+def delete_data(user_id, batch_size):
+  """Delete a user and everything they own in short transactions
+
+  Rows are deleted directly rather than through the delete collector, so
+  that large accounts are neither loaded into memory nor locked at once.
+  Images are deleted once the rows referring to them are, unless copies
+  of the recipes still refer to them. Yields the rows and files deleted
+  by every batch.
+  """
+  recipes = Recipe.objects.filter(user_id=user_id)
+  for batch in _batches(recipes, batch_size, 'id', 'image'):
+    ids = [recipe_id for recipe_id, _ in batch]
+    with transaction.atomic():
+      rows = Recipe.tags.through.objects.filter(recipe_id__in=ids).delete()[0]
+      rows += Recipe.ingredients.through.objects.filter(
+          recipe_id__in=ids).delete()[0]
+      rows += SimilarRecipes.objects.filter(recipe_id__in=ids).delete()[0]
+      rows += _delete_rows(Recipe, ids)
+    images = {image for _, image in batch if image}
+    shared = set(Recipe.objects.filter(image__in=images).values_list(
+        'image', flat=True)) if images else set()
+    yield rows, _delete_files(images - shared)
+
+  for model, through in ((Tag, Recipe.tags.through),
+                         (Ingredient, Recipe.ingredients.through)):
+    column = f'{model._meta.model_name}_id'
+    queryset = model.objects.filter(user_id=user_id)
+    for batch in _batches(queryset, batch_size, 'id'):
+      ids = [row_id for row_id, in batch]
+      with transaction.atomic():
+        rows = through.objects.filter(**{f'{column}__in': ids}).delete()[0]
+        rows += _delete_rows(model, ids)
+      yield rows, 0
+
+  keys = IdempotencyKey.objects.filter(user_id=user_id)
+  for batch in _batches(keys, batch_size, 'id'):
+    yield IdempotencyKey.objects.filter(
+        id__in=[key_id for key_id, in batch]).delete()[0], 0
+
+  # Only small relations are left for the collector to go through
+  yield get_user_model().objects.filter(id=user_id).delete()[0], 0
+
+  cache.bump_user_version(user_id)
+  cook.drop_index(user_id)
+
+
+def run(job, batch_size):
+  """Run a claimed deletion, saving its progress after every batch
+
+  Yields the job after every batch. A failed deletion is marked as such
+  and can be queued again by setting it back to pending.
+  """
+  try:
+    for rows, files in delete_data(job.user_id, batch_size):
+      UserDeletion.objects.filter(id=job.id).update(
+          rows_deleted=F('rows_deleted') + rows,
+          files_deleted=F('files_deleted') + files,
+          updated_at=timezone.now())
+      job.refresh_from_db()
+      yield job
+  except Exception:
+    logger.exception('Deleting user %s failed', job.user_id)
+    job.status = UserDeletion.FAILED
+    job.error = traceback.format_exc()
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    yield job
+    return
+
+  job.status = UserDeletion.DONE
+  job.finished_at = timezone.now()
+  job.save(update_fields=['status', 'finished_at', 'updated_at'])
+  yield job
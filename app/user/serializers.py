@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import ugettext_lazy as _
 
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+
+from core.hashing import HashingBusy
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -38,8 +41,11 @@ class AuthTokenSerializer(serializers.Serializer):
     email = attrs.get('email')
     password = attrs.get('password')
 
-    user = authenticate(request=self.context.get(
-        'request'), username=email, password=password)
+    try:
+      user = authenticate(request=self.context.get(
+          'request'), username=email, password=password)
+    except HashingBusy:
+      raise exceptions.Throttled(wait=settings.PASSWORD_HASH_RETRY_AFTER)
 
     if not user:
       msg = 'An invalid email or password was provided'
@@ -0,0 +1,99 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import (
+    IdempotencyKey, Ingredient, Recipe, SimilarRecipes, Tag, UserDeletion)
+from user import deletion
+
+
+def create_recipe(user, **params):
+  defaults = {'title': 'Recipe', 'time_minutes': 10, 'price': 5}
+  defaults.update(params)
+  return Recipe.objects.create(user=user, **defaults)
+
+
+class UserDeletionTests(TestCase):
+  """Tests deleting users and their data in the background"""
+
+  def setUp(self):
+    self.media_root = tempfile.TemporaryDirectory()
+    self.addCleanup(self.media_root.cleanup)
+    settings = override_settings(MEDIA_ROOT=self.media_root.name)
+    settings.enable()
+    self.addCleanup(settings.disable)
+
+    self.user = get_user_model().objects.create_user(
+        email='vinson@vinson.sg', password='password')
+    self.other = get_user_model().objects.create_user(
+        email='other@vinson.sg', password='password')
+
+  def test_delete_user_data(self):
+    """Tests that the user, their recipes, tags, ingredients and images
+    are deleted and other users' data is kept"""
+    tag = Tag.objects.create(user=self.user, name='Vegan')
+    ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+    for i in range(5):
+      recipe = create_recipe(
+          self.user, image=SimpleUploadedFile(f'{i}.jpg', b'image'))
+      recipe.tags.add(tag)
+      recipe.ingredients.add(ingredient)
+    SimilarRecipes.objects.create(
+        recipe=recipe, neighbors=b'', built_at=timezone.now())
+    IdempotencyKey.objects.create(
+        user=self.user, key='key', method='POST', path='/',
+        created_at=timezone.now(), expires_at=timezone.now())
+    images = [recipe.image.path for recipe in Recipe.objects.all()]
+    kept = create_recipe(self.other)
+    kept.tags.add(Tag.objects.create(user=self.other, name='Dinner'))
+
+    deletion.request_deletion(self.user)
+    out = StringIO()
+    call_command('process_user_deletions', '--once', '--batch-size', '2',
+                 stdout=out)
+
+    job = UserDeletion.objects.get(user_id=self.user.id)
+    self.assertEqual(job.status, UserDeletion.DONE)
+    self.assertEqual(job.files_deleted, 5)
+    # 5 recipes, 10 relations, a similar recipes row, a tag, an
+    # ingredient, an idempotency key and the user
+    self.assertEqual(job.rows_deleted, 20)
+    self.assertFalse(
+        get_user_model().objects.filter(id=self.user.id).exists())
+    self.assertFalse(any(os.path.exists(image) for image in images))
+    self.assertEqual(list(Recipe.objects.all()), [kept])
+    self.assertEqual(kept.tags.get().name, 'Dinner')
+    self.assertIn(f'Deleted user {self.user.id}', out.getvalue())
+
+  def test_delete_user_data_shared_image(self):
+    """Tests that images shared with copies of the recipes are kept"""
+    recipe = create_recipe(
+        self.user, image=SimpleUploadedFile('shared.jpg', b'image'))
+    create_recipe(
+        self.user, image=SimpleUploadedFile('own.jpg', b'image'))
+    copy = create_recipe(self.other, image=recipe.image.name)
+
+    list(deletion.delete_data(self.user.id, batch_size=10))
+
+    self.assertTrue(os.path.exists(copy.image.path))
+    self.assertEqual(
+        os.listdir(os.path.dirname(copy.image.path)),
+        [os.path.basename(copy.image.path)])
+
+  def test_claim(self):
+    """Tests that running deletions are only taken over once stale"""
+    job = deletion.request_deletion(self.user)
+
+    self.assertEqual(deletion.claim(300), job)
+    self.assertIsNone(deletion.claim(300))
+
+    UserDeletion.objects.filter(id=job.id).update(
+        updated_at=timezone.now() - timedelta(seconds=301))
+    self.assertEqual(deletion.claim(300), job)
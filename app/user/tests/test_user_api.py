@@ -1,10 +1,13 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import UserDeletion
+
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
@@ -88,6 +91,38 @@ class PublicUserApiTests(TestCase):
     self.assertNotIn('token', res.data)
     self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+  def test_create_token_email_case_insensitive(self):
+    """Tests that the email is matched regardless of case"""
+    create_user(email='Vinson@vinson.sg', password='password')
+    payload = {'email': 'VINSON@vinson.sg', 'password': 'password'}
+    res = self.client.post(TOKEN_URL, payload)
+
+    self.assertIn('token', res.data)
+
+  def test_password_rehashed_on_login(self):
+    """Tests that hashes made with old settings are upgraded on login"""
+    with override_settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+      user = create_user(email='vinson@vinson.sg', password='password')
+    self.assertIn('$1000$', user.password)
+
+    with override_settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+      res = self.client.post(
+          TOKEN_URL, {'email': 'vinson@vinson.sg', 'password': 'password'})
+
+    user.refresh_from_db()
+    self.assertEqual(res.status_code, status.HTTP_200_OK)
+    self.assertIn('$2000$', user.password)
+
+  @override_settings(PASSWORD_HASH_QUEUE_SIZE=0)
+  def test_login_throttled_when_hashing_busy(self):
+    """Tests that logins are turned away while the hashing pool is full"""
+    create_user(email='vinson@vinson.sg', password='password')
+    res = self.client.post(
+        TOKEN_URL, {'email': 'vinson@vinson.sg', 'password': 'password'})
+
+    self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+    self.assertEqual(res['Retry-After'], '1')
+
   def test_retrieve_user_unauthorized(self):
     """Tests that an unauthorized request fails to retrieve a user"""
     res = self.client.get(ME_URL)
@@ -130,3 +165,18 @@ class PrivateUserApiTests(TestCase):
     self.assertEqual(self.user.name, payload['name'])
     self.assertTrue(self.user.check_password(payload['password']))
     self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+  def test_delete_user(self):
+    """Tests that deleting the account deactivates the user at once and
+    queues deleting their data"""
+    Token.objects.create(user=self.user)
+
+    res = self.client.delete(ME_URL)
+    self.user.refresh_from_db()
+
+    self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+    self.assertFalse(self.user.is_active)
+    self.assertFalse(Token.objects.filter(user=self.user).exists())
+    self.assertEqual(
+        UserDeletion.objects.get(user_id=self.user.id).status,
+        UserDeletion.PENDING)
@@ -1,6 +1,10 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from core.authentication import TokenAuthentication
+from core.throttling import LoginIPRateThrottle, LoginRateThrottle
+from user import deletion
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -13,14 +17,21 @@ class CreateTokenView(ObtainAuthToken):
   """Creates a new auth token for the user"""
   serializer_class = AuthTokenSerializer
   renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+  throttle_classes = (LoginRateThrottle, LoginIPRateThrottle)
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
   """Manage the authenticated user"""
   serializer_class = UserSerializer
-  authentication_classes = (authentication.TokenAuthentication,)
+  authentication_classes = (TokenAuthentication,)
   permission_classes = (permissions.IsAuthenticated,)
 
   def get_object(self):
     """Retrieve and return the authenticated user"""
     return self.request.user
+
+  def destroy(self, request, *args, **kwargs):
+    """Deactivate the user, leaving the deletion of their data to the
+    process_user_deletions worker"""
+    job = deletion.request_deletion(self.get_object())
+    return Response({'status': job.status}, status=status.HTTP_202_ACCEPTED)